@@ -6,7 +6,7 @@ Flask-based web interface for school report generation
 Created by: RN_LAB_TECH
 """
 
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for, session, make_response  # type: ignore[import-not-found]
+from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for, session, make_response, Response, stream_with_context  # type: ignore[import-not-found]
 import os
 import sys
 import traceback
@@ -14,6 +14,7 @@ from datetime import datetime
 import json
 import hashlib
 import zipfile
+import itertools
 import io
 import secrets
 import sqlite3
@@ -25,7 +26,9 @@ sys.path.insert(0, current_dir)
 from termly_report_generator import TermlyReportGenerator
 from performance_analyzer import PerformanceAnalyzer
 from school_database import SchoolDatabase
+import ranking_engine
 from multi_user_manager import SchoolUserManager
+from report_jobs import ReportJobManager, FORM_LEVELS
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 # Use environment-provided SECRET_KEY in production
@@ -242,6 +245,18 @@ except Exception as e:
     # message (useful when users double-click the script on Windows).
     # The server will not start if INIT_OK is False.
 
+# Background report jobs; worker threads resume interrupted jobs on startup
+# (REPORT_JOB_WORKERS=0 only queues jobs from this process)
+report_jobs = None
+if INIT_OK:
+    try:
+        jobs_dir = os.environ.get('REPORT_JOBS_DIR') or os.path.join(
+            'data' if db.use_postgres else os.path.dirname(os.path.abspath(db.db_path)), 'report_jobs')
+        report_jobs = ReportJobManager(jobs_dir, generator, workers=int(os.environ.get('REPORT_JOB_WORKERS', '1')))
+        report_jobs.start()
+    except Exception as e:
+        print(f"ERROR: Error starting report jobs: {e}")
+
 
 @app.route('/')
 def index():
@@ -881,11 +896,10 @@ def api_save_student_marks():
         academic_year = data['academic_year']
         marks = data['marks']  # Dictionary of subject: mark
         
-        # Save marks to database with school_id
-        for subject, mark in marks.items():
-            if mark is not None and str(mark).strip():
-                mark_value = int(str(mark).strip())
-                db.save_student_mark(student_id, subject, mark_value, term, academic_year, form_level, school_id)
+        # Save marks to database with school_id, all subjects in one transaction
+        mark_values = {subject: int(str(mark).strip()) for subject, mark in marks.items()
+                       if mark is not None and str(mark).strip()}
+        db.save_student_marks(student_id, mark_values, term, academic_year, form_level, school_id)
         
         return jsonify({
             'success': True,
@@ -1043,9 +1057,17 @@ def api_export_report_card():
         if pdf_bytes and len(pdf_bytes) > 0:
             filename = f"{student['first_name']}_{student['last_name']}_Report_{term.replace(' ','_')}_{academic_year.replace('-','_')}.pdf"
             
+            # Cards are rendered deterministically, so the content hash is a strong validator
+            etag = hashlib.sha256(pdf_bytes).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+                response.set_etag(etag)
+                return response
+            
             response = make_response(pdf_bytes)
             response.headers['Content-Type'] = 'application/pdf'
             response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            response.set_etag(etag)
             return response
         else:
             return jsonify({
@@ -1062,9 +1084,48 @@ def api_export_report_card():
             'message': f'Error exporting report: {str(e)}'
         }), 500
 
+class _ZipChunkSink:
+    """Write-only, non-seekable target for zipfile that hands out what was written so far.
+
+    zipfile falls back to data descriptors when it cannot seek, so each
+    member can be sent as soon as it has been written.
+    """
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip_stream(entries):
+    """Yield a ZIP archive chunk by chunk from (filename, bytes) entries; memory stays at one entry"""
+    sink = _ZipChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for filename, data in entries:
+            zf.writestr(filename, data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # Central directory
+    yield sink.drain()
+
+
 @app.route('/api/print-all-reports')
 def api_print_all_reports():
-    """Generate and download all report cards for a form as ZIP"""
+    """Generate and download all report cards for a form as ZIP
+    
+    The archive is streamed: each report card is sent as soon as it is
+    rendered instead of building the whole ZIP in memory first.
+    """
     try:
         school_id = get_current_school_id()
         if not school_id:
@@ -1081,22 +1142,27 @@ def api_print_all_reports():
                 'message': f'No students found for Form {form_level}'
             }), 404
         
-        mem_zip = io.BytesIO()
-        with zipfile.ZipFile(mem_zip, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for student in students:
-                try:
-                    pdf_bytes = generator.export_report_to_pdf_bytes(student['student_id'], term, academic_year, school_id)
+        # One prefetch for the whole form, then every card is rendered from it. The first card is
+        # pulled before the response starts, so a failed prefetch still gets an error response
+        cards = generator.generate_class_report_pdfs(form_level, term, academic_year, school_id)
+        first_card = next(cards, None)
+        
+        def report_entries():
+            try:
+                for student, pdf_bytes in itertools.chain([first_card] if first_card else [], cards):
                     if pdf_bytes:
                         filename = f"{student['first_name']}_{student['last_name']}_Report_{term.replace(' ','_')}_{academic_year.replace('-','_')}.pdf"
-                        zf.writestr(filename, pdf_bytes)
-                except Exception as e:
-                    print(f"Error generating PDF for {student['first_name']} {student['last_name']}: {e}")
-                    continue
-        
-        mem_zip.seek(0)
-        
-        response = make_response(mem_zip.read())
-        response.headers['Content-Type'] = 'application/zip'
+                        yield filename, pdf_bytes
+            except Exception as e:
+                # Headers are already sent; finish a valid archive with the cards rendered so far
+                # and say in it that the archive is incomplete
+                app.logger.exception(f"Error generating reports for Form {form_level}")
+                yield 'ERRORS.txt', (f"This archive is incomplete: generating the Form {form_level} report cards "
+                                     f"failed after the cards included here.\nError: {e}\n").encode('utf-8')
+            finally:
+                cards.close()
+        
+        response = Response(stream_with_context(iter_zip_stream(report_entries())), mimetype='application/zip')
         response.headers['Content-Disposition'] = f'attachment; filename="Form_{form_level}_Reports_{term.replace(" ","_")}_{academic_year.replace("-","_")}.zip"'
         return response
         
@@ -1106,6 +1172,109 @@ def api_print_all_reports():
             'message': f'Error generating reports: {str(e)}'
         }), 500
 
+@app.route('/api/print-class-booklet')
+def api_print_class_booklet():
+    """Download the report cards of a form as one PDF booklet, one card per page with a bookmark per student"""
+    try:
+        school_id = get_current_school_id()
+        if not school_id:
+            return jsonify({'success': False, 'message': 'School authentication required'}), 403
+        
+        form_level = int(request.args.get('form_level', 1))
+        term = request.args.get('term', 'Term 1')
+        academic_year = request.args.get('academic_year', '2024-2025')
+        
+        buffer = io.BytesIO()
+        if not generator.generate_class_booklet(form_level, term, academic_year, school_id, buffer):
+            return jsonify({
+                'success': False,
+                'message': f'No report cards found for Form {form_level}'
+            }), 404
+        
+        response = make_response(buffer.getvalue())
+        response.headers['Content-Type'] = 'application/pdf'
+        response.headers['Content-Disposition'] = f'attachment; filename="Form_{form_level}_Report_Booklet_{term.replace(" ","_")}_{academic_year.replace("-","_")}.pdf"'
+        return response
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error generating report booklet: {str(e)}'
+        }), 500
+
+@app.route('/api/report-jobs', methods=['POST'])
+def api_submit_report_job():
+    """Queue background generation of the report cards of one form ("form_level": 1-4) or all forms ("all")"""
+    try:
+        school_id = get_current_school_id()
+        if not school_id:
+            return jsonify({'success': False, 'message': 'School authentication required'}), 403
+        if report_jobs is None:
+            return jsonify({'success': False, 'message': 'Background report jobs are not available'}), 503
+        
+        data = request.get_json() or {}
+        form_level = data.get('form_level', 'all')
+        forms = FORM_LEVELS if form_level == 'all' else [int(form_level)]
+        if any(form not in FORM_LEVELS for form in forms):
+            return jsonify({'success': False, 'message': f'Invalid form level: {form_level}'}), 400
+        term = data.get('term', 'Term 1')
+        academic_year = data.get('academic_year', '2024-2025')
+        
+        job_id = report_jobs.submit(school_id, forms, term, academic_year)
+        return jsonify({'success': True, 'job_id': job_id}), 202
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error queuing report job: {str(e)}'
+        }), 500
+
+@app.route('/api/report-jobs/<job_id>', methods=['GET'])
+def api_get_report_job(job_id):
+    """Progress of a report job: status, done/total, progress fraction and ETA in seconds"""
+    try:
+        school_id = get_current_school_id()
+        if not school_id:
+            return jsonify({'success': False, 'message': 'School authentication required'}), 403
+        
+        job = report_jobs.get_job(job_id, school_id) if report_jobs else None
+        if not job:
+            return jsonify({'success': False, 'message': 'Report job not found'}), 404
+        job.pop('artifact_path', None)
+        return jsonify({'success': True, 'job': job})
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error loading report job: {str(e)}'
+        }), 500
+
+@app.route('/api/report-jobs/<job_id>/download', methods=['GET'])
+def api_download_report_job(job_id):
+    """Download the ZIP of a completed report job (supports HTTP Range requests for resuming)"""
+    try:
+        school_id = get_current_school_id()
+        if not school_id:
+            return jsonify({'success': False, 'message': 'School authentication required'}), 403
+        
+        job = report_jobs.get_job(job_id, school_id) if report_jobs else None
+        if not job:
+            return jsonify({'success': False, 'message': 'Report job not found'}), 404
+        if job['status'] != 'completed' or not job['artifact_path'] or not os.path.exists(job['artifact_path']):
+            return jsonify({'success': False, 'message': f"Report job is {job['status']}"}), 409
+        
+        forms = 'All_Forms' if len(job['forms']) > 1 else f"Form_{job['forms'][0]}"
+        download_name = f"{forms}_Reports_{job['term'].replace(' ', '_')}_{job['academic_year'].replace('-', '_')}.zip"
+        # conditional=True answers Range and If-None-Match/If-Modified-Since requests
+        return send_file(job['artifact_path'], mimetype='application/zip', as_attachment=True,
+                         download_name=download_name, conditional=True)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error downloading report job: {str(e)}'
+        }), 500
+
 @app.route('/api/get-rankings', methods=['GET'])
 def api_get_rankings():
     """Get student rankings for analysis"""
@@ -1232,6 +1401,35 @@ def api_get_rankings_by_form(form_level):
             'message': f'Error loading rankings: {str(e)}'
         })
 
+@app.route('/api/rankings/<int:form_level>/annual', methods=['GET'])
+def api_get_annual_rankings(form_level):
+    """Get end-of-year rankings for a form from Terms 1-3 (optional ?weights=1,1,2)"""
+    try:
+        school_id = get_current_school_id()
+        if not school_id:
+            return jsonify({'success': False, 'message': 'School authentication required'}), 403
+        
+        academic_year = request.args.get('academic_year', '2024-2025')
+        weights = request.args.get('weights')
+        try:
+            term_weights = ranking_engine.parse_term_weights(weights) if weights else None
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        result = db.get_annual_rankings(form_level, academic_year, school_id, term_weights)
+        
+        return jsonify({
+            'success': True,
+            'rankings': result.get('rankings', []),
+            'term_weights': result.get('term_weights', term_weights or ranking_engine.DEFAULT_TERM_WEIGHTS)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error loading annual rankings: {str(e)}'
+        })
+
 @app.route('/api/top-performers/<int:form_level>/<category>', methods=['GET'])
 def api_get_top_performers_by_category(form_level, category):
     """Get top performers by category"""
@@ -1243,6 +1441,13 @@ def api_get_top_performers_by_category(form_level, category):
         term = request.args.get('term', 'Term 1')
         academic_year = request.args.get('academic_year', '2024-2025')
         
+        # 'all' returns every category's leaderboard from one pass over the class results
+        if category == 'all':
+            return jsonify({
+                'success': True,
+                'categories': db.get_top_performers_all_categories(form_level, term, academic_year, school_id)
+            })
+        
         performers = db.get_top_performers_by_category(category, form_level, term, academic_year, school_id)
         
         return jsonify({
@@ -1396,11 +1601,20 @@ def api_export_rankings_pdf():
         
         data = request.get_json()
         form_level = int(data['form_level'])
-        term = data['term']
         academic_year = data['academic_year']
+        annual = bool(data.get('annual'))
+        # Annual rankings cover Terms 1-3, optionally weighted ("weights": "1,1,2")
+        term = 'Annual' if annual else data['term']
         
         # Get the rankings data which includes the rankings list and counts
-        rankings_data = db.get_student_rankings(form_level, term, academic_year, school_id)
+        if annual:
+            try:
+                term_weights = ranking_engine.parse_term_weights(data['weights']) if data.get('weights') else None
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            rankings_data = db.get_annual_rankings(form_level, academic_year, school_id, term_weights)
+        else:
+            rankings_data = db.get_student_rankings(form_level, term, academic_year, school_id)
         
         if not rankings_data or 'rankings' not in rankings_data or not rankings_data['rankings']:
             return jsonify({'success': False, 'message': 'No rankings data found'}), 404
@@ -1843,6 +2057,26 @@ def api_developer_schools_to_lock():
             'message': f'Error retrieving schools to lock: {str(e)}'
         })
 
+@app.route('/api/developer/db-stats', methods=['GET'])
+def api_developer_db_stats():
+    """Connection pool and ranking cache counters of this worker (Developer only)"""
+    if not check_developer_auth():
+        return jsonify({'success': False, 'message': 'Unauthorized access'}), 403
+
+    try:
+        return jsonify({
+            'success': True,
+            'pid': os.getpid(),
+            'connection_pool': db.get_connection_pool_stats(),
+            'ranking_cache': db.get_ranking_cache_stats()
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error retrieving database stats: {str(e)}'
+        })
+
 @app.route('/api/developer/reset-school-credentials', methods=['POST'])
 def api_developer_reset_school_credentials():
     """Reset a school's credentials (Developer only)"""
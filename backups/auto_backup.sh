@@ -0,0 +1,29 @@
+#!/bin/bash
+# Auto backup script for school database
+DB_PATH="/root/package/data/school_reports.db"
+BACKUP_DIR="/root/package/backups"
+TIMESTAMP=$(date +%Y%m%d_%H%M%S)
+BACKUP_FILE="$BACKUP_DIR/school_reports_auto_backup_$TIMESTAMP.db"
+
+if [ ! -f "$DB_PATH" ]; then
+    echo "Database file not found: $DB_PATH" >&2
+    exit 1
+fi
+
+# Create backup (through SQLite, so changes still in a WAL file are included)
+if ! python3 - "$DB_PATH" "$BACKUP_FILE" <<'PY'
+import sqlite3, sys
+source = sqlite3.connect(sys.argv[1])
+target = sqlite3.connect(sys.argv[2])
+try:
+    source.backup(target)
+finally:
+    target.close()
+    source.close()
+PY
+then
+    echo "Auto backup failed: $BACKUP_FILE" >&2
+    rm -f "$BACKUP_FILE"
+    exit 1
+fi
+echo "Auto backup created: $BACKUP_FILE"
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Database Connection Pools
+Keeps one SQLite connection per thread and database file instead of opening
+a new one (and re-running its PRAGMAs) for every query. Pooled connections
+are ordinary sqlite3 connections whose close() hands them back to the pool;
+nested `with` blocks on one thread share the outermost transaction.
+Connections are replaced after POOL_MAX_AGE seconds, when they fail a
+health check or the database file is replaced, and in a forked child
+(gunicorn workers never use a connection inherited from the master).
+
+With DATABASE_URL set, connections come from a bounded psycopg2 pool
+instead, checked out for the outermost `with` block of a thread.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List
+
+# Optional Postgres support (psycopg2)
+try:
+    import psycopg2
+    import psycopg2.extras
+    import psycopg2.pool
+    HAVE_PSYCOPG2 = True
+except ImportError:
+    psycopg2 = None
+    HAVE_PSYCOPG2 = False
+
+# Connections older than this are closed and reopened on their next checkout
+POOL_MAX_AGE = float(os.environ.get('SQLITE_POOL_MAX_AGE', '600'))
+# Connections idle for longer than this run a health check query on checkout
+POOL_HEALTH_CHECK_IDLE = float(os.environ.get('SQLITE_POOL_HEALTH_CHECK_IDLE', '30'))
+# SQLite concurrency profile: 'default' keeps rollback journaling (safe for local and
+# Windows use); 'server' uses WAL so readers never block the writer when several
+# gunicorn workers share the database file
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default').strip().lower()
+# How long a connection waits for another process's write lock before "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '30000'))
+
+# Journal mode (set on the database file once at startup) and per-connection PRAGMAs
+SQLITE_PROFILES = {
+    'default': {
+        'journal_mode': 'DELETE',
+        'pragmas': [('synchronous', 'NORMAL'), ('cache_size', 10000), ('temp_store', 'memory')]
+    },
+    'server': {
+        'journal_mode': 'WAL',
+        # In WAL mode NORMAL only syncs at checkpoints and cannot corrupt the database
+        'pragmas': [('synchronous', 'NORMAL'), ('cache_size', 10000), ('temp_store', 'memory'),
+                    # Checkpoint every ~4 MB of WAL and truncate the file back to 64 MB afterwards
+                    ('wal_autocheckpoint', 1000), ('journal_size_limit', 64 * 1024 * 1024)]
+    }
+}
+
+
+def sqlite_profile(name: str = None) -> Dict:
+    """Settings of a SQLite profile (SQLITE_PROFILE by default; unknown names fall back to 'default')"""
+    return SQLITE_PROFILES.get(name or SQLITE_PROFILE, SQLITE_PROFILES['default'])
+
+
+# Postgres connections kept open per process, and the most open at once
+PG_POOL_MIN = int(os.environ.get('PG_POOL_MIN', '1'))
+PG_POOL_MAX = int(os.environ.get('PG_POOL_MAX', '10'))
+# Seconds to wait for a free Postgres connection before giving up
+PG_POOL_TIMEOUT = float(os.environ.get('PG_POOL_TIMEOUT', '30'))
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection owned by a SQLitePool.
+
+    `with conn:` commits or rolls back only when the outermost block of the
+    thread exits, and close() returns the connection to the pool (rolling
+    back anything left uncommitted, as closing a connection would).
+    """
+
+    def __init__(self, *args, **kwargs):
+        sqlite3.Connection.__init__(self, *args, **kwargs)
+        self._pool = None
+        self._created = time.monotonic()
+        self._last_used = self._created
+        self._depth = 0
+        self._file_id = None
+
+    def __enter__(self):
+        if self._depth == 0 and self._pool is not None:
+            self._pool._count('in_use')
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth > 0:
+            # The outer block decides on commit or rollback
+            return False
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            if self._pool is not None:
+                self._pool._count('in_use', -1)
+        return False
+
+    def close(self):
+        if self._pool is None:
+            sqlite3.Connection.close(self)
+        elif self._depth == 0 and self.in_transaction:
+            self.rollback()
+
+    def _close(self):
+        """Really close the connection"""
+        self._pool = None
+        sqlite3.Connection.close(self)
+
+
+class SQLitePool:
+    """Per-thread connections to one SQLite file"""
+
+    def __init__(self, db_path: str, configure: Callable[[sqlite3.Connection], None] = None,
+                 timeout: float = 30.0, max_age: float = POOL_MAX_AGE):
+        self.db_path = db_path
+        self.configure = configure
+        self.timeout = timeout
+        self.max_age = max_age
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._stats = {'created': 0, 'checkouts': 0, 'reused': 0, 'in_use': 0,
+                       'expired': 0, 'unhealthy': 0, 'forked': 0, 'checkout_seconds': 0.0}
+        # Open connections of all threads; a thread's connection closes when the thread ends
+        self._open = weakref.WeakSet()
+        # Connections inherited across a fork; kept referenced so they are never closed in the child
+        self._inherited: List[PooledConnection] = []
+
+    def _count(self, name: str, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _file_id(self):
+        try:
+            stat = os.stat(self.db_path)
+            return (stat.st_dev, stat.st_ino)
+        except OSError:
+            return None
+
+    def _healthy(self, conn: PooledConnection) -> bool:
+        if conn._file_id != self._file_id():
+            # The database file was deleted or replaced under the connection
+            return False
+        try:
+            if time.monotonic() - conn._last_used > POOL_HEALTH_CHECK_IDLE:
+                conn.execute('SELECT 1').fetchone()
+            if conn.in_transaction:
+                # A previous user left a transaction open; don't inherit it
+                conn.rollback()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: PooledConnection, reason: str):
+        with self._lock:
+            self._stats[reason] += 1
+            self._open.discard(conn)
+        try:
+            conn._close()
+        except sqlite3.Error:
+            pass
+
+    def _connect(self) -> PooledConnection:
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, factory=PooledConnection)
+        if self.configure:
+            self.configure(conn)
+        conn._pool = self
+        conn._file_id = self._file_id()
+        with self._lock:
+            self._stats['created'] += 1
+            self._open.add(conn)
+        return conn
+
+    def connection(self) -> PooledConnection:
+        """The calling thread's connection, (re)opened as needed"""
+        start = time.perf_counter()
+        if os.getpid() != self._pid:
+            self._after_fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and conn._depth == 0:
+            if time.monotonic() - conn._created > self.max_age:
+                self._discard(conn, 'expired')
+                conn = None
+            elif not self._healthy(conn):
+                self._discard(conn, 'unhealthy')
+                conn = None
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        else:
+            self._count('reused')
+        conn._last_used = time.monotonic()
+        self._count('checkouts')
+        self._count('checkout_seconds', time.perf_counter() - start)
+        return conn
+
+    def _after_fork(self):
+        """Forget the parent's connections in a forked child"""
+        with self._lock:
+            if os.getpid() == self._pid:
+                return
+            self._stats['forked'] += len(self._open)
+            self._inherited.extend(self._open)
+            self._local = threading.local()
+            self._open = weakref.WeakSet()
+            self._pid = os.getpid()
+            self._stats['in_use'] = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = len(self._open)
+        stats['db_path'] = self.db_path
+        stats['avg_checkout_ms'] = round(stats['checkout_seconds'] * 1000 / stats['checkouts'], 4) if stats['checkouts'] else 0.0
+        return stats
+
+    def close_all(self):
+        """Close the calling thread's connection (other threads' close when they exit)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and conn._depth == 0:
+            self._local.conn = None
+            self._discard(conn, 'expired')
+
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_sqlite_pool(db_path: str, configure: Callable[[sqlite3.Connection], None] = None) -> SQLitePool:
+    """Shared pool of a database file (one per process)"""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SQLitePool(db_path, configure)
+        return pool
+
+
+class PgCursor:
+    """psycopg2 cursor taking SQLite-style queries (? placeholders)"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._inserted = False
+
+    def execute(self, query, params=None):
+        query = query.replace('?', '%s')
+        self._cursor.execute(query, params or ())
+        self._inserted = query.lstrip().lower().startswith('insert')
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._inserted = False
+        self._cursor.executemany(query.replace('?', '%s'), seq_of_params)
+        return self
+
+    def execute_values(self, query, rows, template=None, page_size=500):
+        """Insert many rows with multi-row VALUES statements (the query has a single `VALUES ?`)"""
+        self._inserted = False
+        psycopg2.extras.execute_values(self._cursor, query.replace('?', '%s'), rows, template=template, page_size=page_size)
+        return self
+
+    @property
+    def lastrowid(self):
+        """Id generated by the last INSERT, fetched only when asked for.
+
+        Costs a round trip; inserts that need their id should use RETURNING.
+        """
+        if not self._inserted:
+            return None
+        try:
+            with self._cursor.connection.cursor() as cursor:
+                cursor.execute('SELECT LASTVAL()')
+                row = cursor.fetchone()
+            return row[0] if row else None
+        except psycopg2.Error:
+            return None
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PooledPgConnection:
+    """psycopg2 connection checked out of a PostgresPool.
+
+    Behaves like the pooled SQLite connections: `with` blocks of one thread
+    share the connection and its transaction, and the outermost block
+    commits or rolls back and returns the connection to the pool.
+    """
+
+    def __init__(self, pool: 'PostgresPool', conn):
+        self._pool = pool
+        self._conn = conn
+        self._depth = 0
+
+    def cursor(self, *args, **kwargs):
+        return PgCursor(self._conn.cursor(*args, **kwargs))
+
+    def __enter__(self):
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth > 0:
+            return False
+        try:
+            if exc_type is None:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+        finally:
+            self._pool._release(self)
+        return False
+
+    def close(self):
+        """Return the connection to the pool, discarding uncommitted work"""
+        if self._depth == 0 and self._conn is not None:
+            self._pool._release(self)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class PostgresPool:
+    """Bounded psycopg2 connection pool; callers wait for a free connection"""
+
+    def __init__(self, dsn: str, minconn: int = PG_POOL_MIN, maxconn: int = PG_POOL_MAX,
+                 timeout: float = PG_POOL_TIMEOUT):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = max(maxconn, minconn, 1)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stats = {'checkouts': 0, 'reused': 0, 'in_use': 0, 'broken': 0, 'timeouts': 0,
+                       'forked': 0, 'wait_seconds': 0.0}
+        # Pools inherited across a fork; kept referenced so their connections are never closed in the child
+        self._inherited: List = []
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._last_used: Dict[int, float] = {}
+        self._pool = psycopg2.pool.ThreadedConnectionPool(self.minconn, self.maxconn, self.dsn)
+
+    def _count(self, name: str, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used <= POOL_HEALTH_CHECK_IDLE:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def connection(self) -> PooledPgConnection:
+        """The calling thread's checked-out connection, or a free one from the pool"""
+        if os.getpid() != self._pid:
+            self._after_fork()
+        pooled = getattr(self._local, 'conn', None)
+        if pooled is not None:
+            self._count('reused')
+            return pooled
+
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count('timeouts')
+            raise psycopg2.pool.PoolError(f"No Postgres connection free after {self.timeout:g}s")
+        try:
+            conn = self._pool.getconn()
+            while not self._healthy(conn):
+                self._count('broken')
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['wait_seconds'] += time.perf_counter() - start
+        pooled = self._local.conn = PooledPgConnection(self, conn)
+        return pooled
+
+    def _release(self, pooled: PooledPgConnection):
+        conn, pooled._conn = pooled._conn, None
+        if conn is None:
+            return
+        if getattr(self._local, 'conn', None) is pooled:
+            self._local.conn = None
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                # Never hand out a connection with a transaction still open
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken:
+            self._count('broken')
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=broken)
+            if conn.closed:
+                # Closed by the pool as surplus to its minimum
+                self._last_used.pop(id(conn), None)
+        finally:
+            self._slots.release()
+            self._count('in_use', -1)
+
+    def _after_fork(self):
+        """Open a fresh pool in a forked child, leaving the parent's connections alone"""
+        with self._lock:
+            if os.getpid() == self._pid:
+                return
+            self._inherited.append(self._pool)
+            self._stats['forked'] += 1
+            self._stats['in_use'] = 0
+            self._start()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['min'] = self.minconn
+        stats['max'] = self.maxconn
+        stats['open'] = len(self._pool._pool) + len(self._pool._used)
+        stats['avg_wait_ms'] = round(stats['wait_seconds'] * 1000 / stats['checkouts'], 4) if stats['checkouts'] else 0.0
+        return stats
+
+
+_pg_pools: Dict[str, PostgresPool] = {}
+
+
+def get_postgres_pool(dsn: str) -> PostgresPool:
+    """Shared pool of a Postgres database (one per process)"""
+    with _pools_lock:
+        pool = _pg_pools.get(dsn)
+        if pool is None:
+            pool = _pg_pools[dsn] = PostgresPool(dsn)
+        return pool
@@ -0,0 +1,119 @@
+-- Baseline schema: every table as init_postgres_database last created it.
+
+CREATE TABLE IF NOT EXISTS students (
+    student_id SERIAL PRIMARY KEY,
+    student_number TEXT,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    date_of_birth TEXT,
+    grade_level INTEGER NOT NULL,
+    email TEXT,
+    phone TEXT,
+    address TEXT,
+    parent_guardian_name TEXT,
+    parent_guardian_phone TEXT,
+    parent_guardian_email TEXT,
+    status TEXT DEFAULT 'Active',
+    date_enrolled TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    school_id INTEGER,
+    UNIQUE(student_number, school_id)
+);
+
+CREATE TABLE IF NOT EXISTS student_marks (
+    mark_id SERIAL PRIMARY KEY,
+    student_id INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    mark INTEGER NOT NULL,
+    grade TEXT NOT NULL,
+    term TEXT NOT NULL,
+    academic_year TEXT NOT NULL,
+    form_level INTEGER NOT NULL,
+    date_entered TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    school_id INTEGER NOT NULL
+);
+
+-- Mark saves upsert on this key; an index rather than a table constraint so
+-- that tables created before it was declared get it too
+CREATE UNIQUE INDEX IF NOT EXISTS idx_student_marks_unique
+ON student_marks (student_id, subject, term, academic_year, school_id);
+
+CREATE TABLE IF NOT EXISTS school_settings (
+    setting_id SERIAL PRIMARY KEY,
+    school_name TEXT,
+    school_address TEXT,
+    school_phone TEXT,
+    school_email TEXT,
+    pta_fund TEXT,
+    sdf_fund TEXT,
+    boarding_fee TEXT,
+    next_term_begins TEXT,
+    boys_uniform TEXT,
+    girls_uniform TEXT,
+    selected_term TEXT,
+    selected_academic_year TEXT,
+    updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    school_id INTEGER UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS academic_periods (
+    period_id SERIAL PRIMARY KEY,
+    academic_year TEXT NOT NULL,
+    period_name TEXT NOT NULL,
+    start_date TEXT,
+    end_date TEXT,
+    is_active INTEGER DEFAULT 0,
+    school_id INTEGER,
+    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (academic_year, period_name, school_id)
+);
+
+CREATE TABLE IF NOT EXISTS subject_teachers (
+    id SERIAL PRIMARY KEY,
+    subject TEXT NOT NULL,
+    form_level INTEGER NOT NULL,
+    teacher_name TEXT NOT NULL,
+    updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    school_id INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS school_fees (
+    id SERIAL PRIMARY KEY,
+    pta_fund TEXT,
+    sdf_fund TEXT,
+    boarding_fee TEXT,
+    updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS schools (
+    school_id SERIAL PRIMARY KEY,
+    school_name TEXT NOT NULL,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    status TEXT DEFAULT 'active',
+    subscription_status TEXT DEFAULT 'trial',
+    subscription_start_date TEXT,
+    subscription_end_date TEXT,
+    days_remaining INTEGER DEFAULT 90,
+    must_change_password INTEGER DEFAULT 0,
+    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_login TEXT
+);
+
+CREATE TABLE IF NOT EXISTS subscription_notifications (
+    notification_id SERIAL PRIMARY KEY,
+    school_id INTEGER,
+    message TEXT NOT NULL,
+    notification_type TEXT DEFAULT 'reminder',
+    sent_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_read INTEGER DEFAULT 0
+);
+
+-- Per-period data versions used to invalidate cached rankings
+CREATE TABLE IF NOT EXISTS data_versions (
+    school_id INTEGER NOT NULL,
+    term TEXT NOT NULL,
+    academic_year TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (school_id, term, academic_year)
+);
@@ -0,0 +1,13 @@
+-- Covering indexes for class, term and roster queries
+
+-- Class-level queries: ranking membership, subject positions, marks-exist checks
+CREATE INDEX IF NOT EXISTS idx_student_marks_class
+ON student_marks (school_id, form_level, term, academic_year, subject, mark, student_id);
+
+-- Term-level queries: rank_all_forms, ranked students' marks, report card batches
+CREATE INDEX IF NOT EXISTS idx_student_marks_term
+ON student_marks (school_id, term, academic_year, student_id, subject, mark, form_level);
+
+-- Rosters: data entry lists, top performers, subject analysis, results matrix
+CREATE INDEX IF NOT EXISTS idx_students_school_grade
+ON students (school_id, grade_level, status, first_name, last_name);
@@ -0,0 +1,11 @@
+-- Random identity of this database; survives backups, differs between databases.
+-- Report cards cached on disk are keyed on it, so a fresh database whose
+-- version counters restart never serves another database's cards.
+CREATE TABLE IF NOT EXISTS database_identity (
+    database_id TEXT PRIMARY KEY,
+    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO database_identity (database_id)
+SELECT md5(random()::text || clock_timestamp()::text)
+WHERE NOT EXISTS (SELECT 1 FROM database_identity);
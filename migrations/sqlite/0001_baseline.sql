@@ -0,0 +1,156 @@
+-- Baseline schema: every table as init_database last created it.
+-- Databases created before the migration runner already have these tables;
+-- the runner adds any columns they lack before this file runs.
+
+CREATE TABLE IF NOT EXISTS students (
+    student_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_number TEXT,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    date_of_birth TEXT,
+    grade_level INTEGER NOT NULL,
+    email TEXT,
+    phone TEXT,
+    address TEXT,
+    parent_guardian_name TEXT,
+    parent_guardian_phone TEXT,
+    parent_guardian_email TEXT,
+    status TEXT DEFAULT 'Active',
+    date_enrolled TEXT DEFAULT CURRENT_TIMESTAMP,
+    school_id INTEGER,
+    UNIQUE(student_number, school_id)
+);
+
+CREATE TABLE IF NOT EXISTS student_marks (
+    mark_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    mark INTEGER NOT NULL,
+    grade TEXT NOT NULL,
+    term TEXT NOT NULL,
+    academic_year TEXT NOT NULL,
+    form_level INTEGER NOT NULL,
+    date_entered TEXT DEFAULT CURRENT_TIMESTAMP,
+    school_id INTEGER NOT NULL,
+    FOREIGN KEY (student_id) REFERENCES students (student_id),
+    UNIQUE(student_id, subject, term, academic_year, school_id)
+);
+
+CREATE TABLE IF NOT EXISTS school_settings (
+    setting_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    school_name TEXT,
+    school_address TEXT,
+    school_phone TEXT,
+    school_email TEXT,
+    pta_fund TEXT,
+    sdf_fund TEXT,
+    boarding_fee TEXT,
+    next_term_begins TEXT,
+    boys_uniform TEXT,
+    girls_uniform TEXT,
+    selected_term TEXT,
+    selected_academic_year TEXT,
+    updated_date TEXT DEFAULT CURRENT_TIMESTAMP,
+    school_id INTEGER,
+    UNIQUE(school_id)
+);
+
+CREATE TABLE IF NOT EXISTS academic_periods (
+    period_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    academic_year TEXT NOT NULL,
+    period_name TEXT NOT NULL,
+    start_date TEXT,
+    end_date TEXT,
+    is_active INTEGER DEFAULT 0,
+    school_id INTEGER,
+    created_date TEXT DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(academic_year, period_name, school_id)
+);
+
+CREATE TABLE IF NOT EXISTS subject_teachers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject TEXT NOT NULL,
+    form_level INTEGER NOT NULL,
+    teacher_name TEXT NOT NULL,
+    updated_date TEXT DEFAULT CURRENT_TIMESTAMP,
+    school_id INTEGER,
+    UNIQUE(subject, form_level, school_id)
+);
+
+CREATE TABLE IF NOT EXISTS school_fees (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pta_fund TEXT,
+    sdf_fund TEXT,
+    boarding_fee TEXT,
+    updated_date TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS schools (
+    school_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    school_name TEXT NOT NULL,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    status TEXT DEFAULT 'active',
+    subscription_status TEXT DEFAULT 'trial',
+    subscription_start_date TEXT,
+    subscription_end_date TEXT,
+    days_remaining INTEGER DEFAULT 90,
+    must_change_password INTEGER DEFAULT 0,
+    created_date TEXT DEFAULT CURRENT_TIMESTAMP,
+    last_login TEXT
+);
+
+CREATE TABLE IF NOT EXISTS subscription_notifications (
+    notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    school_id INTEGER,
+    message TEXT NOT NULL,
+    notification_type TEXT DEFAULT 'reminder',
+    sent_date TEXT DEFAULT CURRENT_TIMESTAMP,
+    is_read INTEGER DEFAULT 0,
+    FOREIGN KEY (school_id) REFERENCES schools (school_id)
+);
+
+-- Per-period data versions used to invalidate cached rankings
+CREATE TABLE IF NOT EXISTS data_versions (
+    school_id INTEGER NOT NULL,
+    term TEXT NOT NULL,
+    academic_year TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_date TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (school_id, term, academic_year)
+);
+
+-- Existing schools get default subscription values
+UPDATE schools
+SET subscription_status = 'trial', days_remaining = 90
+WHERE subscription_status IS NULL OR subscription_status = '';
+
+-- Blank settings for existing schools - waiting for admin to edit
+INSERT INTO school_settings
+(school_name, school_address, school_phone, school_email, pta_fund, sdf_fund, boarding_fee,
+ next_term_begins, boys_uniform, girls_uniform, selected_term, selected_academic_year, school_id)
+SELECT '', '', '', '', '', '', '', '', '', '', '', '', s.school_id
+FROM schools s
+LEFT JOIN school_settings ss ON s.school_id = ss.school_id
+WHERE ss.school_id IS NULL;
+
+-- Default fees
+INSERT INTO school_fees (pta_fund, sdf_fund, boarding_fee)
+SELECT '', '', 'MK 150,000'
+WHERE NOT EXISTS (SELECT 1 FROM school_fees);
+
+-- Default subject teachers, shared by schools that have not named their own
+WITH subjects (position, subject) AS (
+    VALUES (1, 'Agriculture'), (2, 'Bible Knowledge'), (3, 'Biology'), (4, 'Chemistry'),
+           (5, 'Chichewa'), (6, 'Computer Studies'), (7, 'English'), (8, 'Geography'),
+           (9, 'History'), (10, 'Life Skills/SOS'), (11, 'Mathematics'), (12, 'Physics'),
+           (13, 'Business Studies'), (14, 'Home Economics')
+),
+forms (form_level) AS (
+    VALUES (1), (2), (3), (4)
+)
+INSERT INTO subject_teachers (subject, form_level, teacher_name, school_id)
+SELECT s.subject, f.form_level, s.subject || ' Teacher F' || f.form_level, NULL
+FROM forms f, subjects s
+WHERE NOT EXISTS (SELECT 1 FROM subject_teachers)
+ORDER BY f.form_level, s.position;
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+PDF Output Profile
+Settings shared by the PDFs the application generates (report cards,
+booklets, performance reports). The default "compact" profile is meant for
+downloads over slow connections: compressed page streams written as binary
+instead of ASCII85 text, and images pre-scaled to print resolution.
+PDF_PROFILE=legacy keeps ReportLab's defaults.
+"""
+
+import os
+from typing import Dict
+
+COMPACT_PDF = os.environ.get('PDF_PROFILE', 'compact') != 'legacy'
+
+# Print resolution of embedded images in the compact profile
+COMPACT_IMAGE_DPI = 150
+COMPACT_JPEG_QUALITY = 85
+
+
+def apply_pdf_profile():
+    """Configure ReportLab for the active profile (ASCII85 is a process-wide setting)"""
+    if COMPACT_PDF:
+        from reportlab import rl_config
+        rl_config.useA85 = 0
+
+
+def doc_options() -> Dict:
+    """Keyword arguments for ReportLab document templates of the active profile"""
+    return {'pageCompression': 1} if COMPACT_PDF else {}
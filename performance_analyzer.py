@@ -7,6 +7,7 @@ Created: 2025-08-06
 """
 
 from school_database import SchoolDatabase
+import pdf_profile
 from datetime import datetime
 import json
 from typing import List, Dict, Optional
@@ -703,13 +704,15 @@ Created by: RN_LAB_TECH
             from reportlab.lib import colors
             
             # Create PDF document with margins
+            pdf_profile.apply_pdf_profile()
             doc = SimpleDocTemplate(
                 filename, 
                 pagesize=A4,
                 rightMargin=2*cm,
                 leftMargin=2*cm,
                 topMargin=2*cm,
-                bottomMargin=2*cm
+                bottomMargin=2*cm,
+                **pdf_profile.doc_options()
             )
             
             # Custom color scheme
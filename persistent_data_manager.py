@@ -6,11 +6,12 @@ Ensures data remains intact across deployments and restarts
 
 import os
 import sqlite3
-import shutil
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional
 
+import ranking_engine
+
 class PersistentDataManager:
     """Manages persistent data storage for Render deployment environments"""
     
@@ -112,7 +113,7 @@ class PersistentDataManager:
             backup_path = os.path.join(backup_dir, backup_filename)
             
             # Copy database to backup location
-            shutil.copy2(db_path, backup_path)
+            self.copy_database(db_path, backup_path)
             
             self.logger.info(f"Database backup created: {backup_path}")
             return backup_path
@@ -121,11 +122,32 @@ class PersistentDataManager:
             self.logger.error(f"Failed to create backup: {e}")
             return None
     
+    def copy_database(self, source_path: str, target_path: str):
+        """Copy a SQLite database with SQLite's backup API.
+
+        Unlike a file copy this includes changes still in a WAL file
+        (SQLITE_PROFILE=server), is consistent while other workers write, and
+        cannot leave a stale WAL next to the target to replay over the copy.
+        """
+        source = sqlite3.connect(source_path)
+        try:
+            target = sqlite3.connect(target_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+
     def restore_from_backup(self, backup_path: str, target_path: str) -> bool:
         """Restore database from backup"""
         try:
             if os.path.exists(backup_path):
-                shutil.copy2(backup_path, target_path)
+                replaced_versions = self.read_data_versions(target_path)
+                self.copy_database(backup_path, target_path)
+                self.advance_data_versions(target_path, replaced_versions)
+                # Snapshots of this process are of the replaced data
+                ranking_engine.ranking_cache.clear()
                 self.logger.info(f"Database restored from backup: {backup_path}")
                 return True
             else:
@@ -135,6 +157,41 @@ class PersistentDataManager:
             self.logger.error(f"Failed to restore from backup: {e}")
             return False
     
+    def read_data_versions(self, db_path: str) -> Dict:
+        """Period data versions of a database, {} when it has none"""
+        if not os.path.exists(db_path):
+            return {}
+        try:
+            with sqlite3.connect(db_path) as conn:
+                rows = conn.execute("SELECT school_id, term, academic_year, version FROM data_versions").fetchall()
+            return {tuple(row[:3]): row[3] for row in rows}
+        except sqlite3.Error:
+            return {}
+
+    def advance_data_versions(self, db_path: str, replaced_versions: Dict):
+        """Move every period version of a restored database past the versions it replaced.
+
+        Cached rankings and report cards are stamped with these counters; the
+        backup's lower ones would climb back to numbers cached from the
+        replaced data. Offsetting them keeps every version new to all workers.
+        """
+        if not replaced_versions:
+            return
+        offset = max(replaced_versions.values()) + 1
+        now = datetime.now().isoformat()
+        try:
+            with sqlite3.connect(db_path) as conn:
+                conn.execute("UPDATE data_versions SET version = version + ?, updated_date = ?", (offset, now))
+                # Periods the backup doesn't know still must not restart at 1
+                conn.executemany("""
+                    INSERT OR IGNORE INTO data_versions (school_id, term, academic_year, version, updated_date)
+                    VALUES (?, ?, ?, ?, ?)
+                """, [key + (offset, now) for key in replaced_versions])
+            conn.close()
+        except sqlite3.Error as e:
+            # A backup from before data_versions existed; it is created at the next start
+            self.logger.warning(f"Could not advance data versions of restored database: {e}")
+
     def verify_data_integrity(self, db_path: str) -> Dict:
         """Verify data integrity and return status"""
         try:
@@ -174,21 +231,35 @@ class PersistentDataManager:
         backup_dir = os.environ.get('BACKUP_DIR', 'backups')
         
         # Create backup script
-        backup_script = f"""
-#!/bin/bash
+        backup_script = f"""#!/bin/bash
 # Auto backup script for school database
 DB_PATH="{os.environ.get('DATABASE_PATH', 'school_reports.db')}"
 BACKUP_DIR="{backup_dir}"
 TIMESTAMP=$(date +%Y%m%d_%H%M%S)
 BACKUP_FILE="$BACKUP_DIR/school_reports_auto_backup_$TIMESTAMP.db"
 
-# Create backup
-if [ -f "$DB_PATH" ]; then
-    cp "$DB_PATH" "$BACKUP_FILE"
-    echo "Auto backup created: $BACKUP_FILE"
-else
-    echo "Database file not found: $DB_PATH"
+if [ ! -f "$DB_PATH" ]; then
+    echo "Database file not found: $DB_PATH" >&2
+    exit 1
+fi
+
+# Create backup (through SQLite, so changes still in a WAL file are included)
+if ! python3 - "$DB_PATH" "$BACKUP_FILE" <<'PY'
+import sqlite3, sys
+source = sqlite3.connect(sys.argv[1])
+target = sqlite3.connect(sys.argv[2])
+try:
+    source.backup(target)
+finally:
+    target.close()
+    source.close()
+PY
+then
+    echo "Auto backup failed: $BACKUP_FILE" >&2
+    rm -f "$BACKUP_FILE"
+    exit 1
 fi
+echo "Auto backup created: $BACKUP_FILE"
 """
         
         script_path = os.path.join(backup_dir, 'auto_backup.sh')
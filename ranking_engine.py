@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Class Ranking Engine
+Computes class rankings in memory from the marks of one period
+(school, form, term, academic year) loaded with a single query.
+Used by the ranking pages, the rankings PDF and the report card positions.
+Pass/fail, grades and aggregate points come from results_engine;
+Forms 1&2 are ranked by average, Forms 3&4 by best-six aggregate points.
+Also holds the incremental class ranking used during live mark entry and
+the per-process ranking snapshot cache.
+"""
+
+import bisect
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from results_engine import best_six_points, calculate_grade, grade_scale, pass_threshold, student_result
+
+# Ranking row for one student: (student_id, first_name, last_name, {subject: mark})
+ClassMarks = List[Tuple[int, str, str, Dict[str, int]]]
+
+
+def build_ranking_row(student_id: int, first_name: str, last_name: str, marks: Dict[str, int], form_level: int) -> Dict:
+    """Build the ranking row of one student from all of their marks in the period"""
+    result = student_result(marks, form_level)
+    row = {
+        'student_id': student_id,
+        'name': f"{first_name} {last_name}",
+        'average': result['average'],
+        'subjects_passed': result['passed_subjects'],
+        'status': result['status'],
+        'total_subjects': result['total_subjects']
+    }
+
+    # Students who wrote insufficient subjects (1-5) fail outright
+    if result['total_subjects'] <= 5:
+        row['average'] = 0
+        row['subjects_passed'] = 0
+
+    if form_level >= 3:
+        row['aggregate_points'] = result['aggregate_points']
+    else:
+        row['grade'] = result['grade']
+        row['best_six_total'] = result['best_six_total']
+    return row
+
+
+def assign_positions(rankings: List[Dict], form_level: int) -> None:
+    """Sort ranking rows in place and assign tied positions"""
+    if form_level >= 3:
+        # Forms 3&4: PASS first, then aggregate points (LOWEST first)
+        rankings.sort(key=lambda x: (x['status'] == 'FAIL', x.get('aggregate_points', 999)))
+
+        def same_rank(a, b):
+            return a['status'] == b['status'] and a.get('aggregate_points') == b.get('aggregate_points')
+    else:
+        # Forms 1&2: PASS first, then average (HIGHEST first)
+        rankings.sort(key=lambda x: (x['status'] == 'FAIL', -x['average']))
+
+        def same_rank(a, b):
+            return a['status'] == b['status'] and round(a['average'], 1) == round(b['average'], 1)
+
+    for i, student in enumerate(rankings):
+        if i > 0 and same_rank(student, rankings[i - 1]):
+            student['position'] = rankings[i - 1]['position']
+        else:
+            student['position'] = i + 1
+
+
+def group_period_marks(rows) -> ClassMarks:
+    """Group (student_id, first_name, last_name, subject, mark) rows by student, keeping row order"""
+    students = {}
+    for student_id, first_name, last_name, subject, mark in rows:
+        entry = students.get(student_id)
+        if entry is None:
+            entry = students[student_id] = (student_id, first_name, last_name, {})
+        entry[3][subject] = mark
+    return list(students.values())
+
+
+def rank_class(class_marks: ClassMarks, form_level: int) -> Dict:
+    """Rank a class from its grouped marks (students in roster order)
+
+    Returns:
+        dict: {'rankings': [...], 'index': {student_id: ranking row},
+               'total_students': int, 'students_with_marks': int}
+    """
+    rankings = [build_ranking_row(student_id, first_name, last_name, marks, form_level)
+                for student_id, first_name, last_name, marks in class_marks]
+    assign_positions(rankings, form_level)
+    return {
+        'rankings': rankings,
+        'index': {row['student_id']: row for row in rankings},
+        'total_students': len(rankings),  # Total students who have marks (actual class size)
+        'students_with_marks': len(rankings)  # All students in rankings sat for at least one exam
+    }
+
+
+TERMS = ['Term 1', 'Term 2', 'Term 3']
+
+
+def parse_term_weights(text: str) -> Dict[str, float]:
+    """Parse annual term weights such as "1,1,2" into {'Term 1': 1.0, 'Term 2': 1.0, 'Term 3': 2.0}"""
+    weights = [float(value) for value in text.split(',')]
+    if (len(weights) != len(TERMS) or not all(math.isfinite(weight) and weight >= 0 for weight in weights)
+            or not any(weights)):
+        raise ValueError(f"Expected {len(TERMS)} finite non-negative term weights, got {text!r}")
+    return dict(zip(TERMS, weights))
+
+
+def default_term_weights(text: str) -> Dict[str, float]:
+    """Configured term weights; a malformed setting is logged and equal weights are used"""
+    try:
+        return parse_term_weights(text)
+    except ValueError as e:
+        logging.getLogger(__name__).error(f"Invalid ANNUAL_TERM_WEIGHTS, using equal weights: {e}")
+        return parse_term_weights('1,1,1')
+
+
+# Equal weights unless configured, e.g. ANNUAL_TERM_WEIGHTS="1,1,2" to count Term 3 double
+DEFAULT_TERM_WEIGHTS = default_term_weights(os.environ.get('ANNUAL_TERM_WEIGHTS', '1,1,1'))
+
+
+def group_annual_marks(rows) -> ClassMarks:
+    """Group (student_id, first_name, last_name, subject, weighted_total, weight_total) rows by student.
+
+    The annual mark of a subject is the weighted mean of the terms it was
+    written in, rounded half up to a whole mark; subjects only written in
+    zero-weight terms are left out.
+    """
+    students = {}
+    for student_id, first_name, last_name, subject, weighted_total, weight_total in rows:
+        entry = students.get(student_id)
+        if entry is None:
+            entry = students[student_id] = (student_id, first_name, last_name, {})
+        if weight_total:
+            # Postgres sums the bound float weights as NUMERIC (Decimal)
+            entry[3][subject] = int(float(weighted_total) / float(weight_total) + 0.5)
+    return [entry for entry in students.values() if entry[3]]
+
+
+def rank_subject_marks(rows) -> Tuple[Dict[int, Dict[str, int]], Dict[str, int]]:
+    """Competition-rank (1, 1, 3) every student within each subject.
+
+    Takes (student_id, subject, mark) rows and returns
+    ({student_id: {subject: position}}, {subject: students_with_marks}).
+    """
+    by_subject = {}
+    for student_id, subject, mark in rows:
+        by_subject.setdefault(subject, []).append((mark, student_id))
+
+    positions = {}
+    totals = {}
+    for subject, entries in by_subject.items():
+        entries.sort(key=lambda entry: -entry[0])
+        totals[subject] = len(entries)
+        position = 1
+        for i, (mark, student_id) in enumerate(entries):
+            if i > 0 and mark != entries[i - 1][0]:
+                position = i + 1
+            positions.setdefault(student_id, {})[subject] = position
+    return positions, totals
+
+
+def format_subject_positions(positions: Dict[int, Dict[str, int]], totals: Dict[str, int]) -> Dict[int, Dict[str, str]]:
+    """Render numeric subject positions as "pos/total" strings"""
+    return {
+        student_id: {subject: f"{position}/{totals[subject]}" for subject, position in subjects.items()}
+        for student_id, subjects in positions.items()
+    }
+
+
+def summarize_subject_marks(histogram, form_level: int) -> List[Dict]:
+    """Per-subject statistics from (subject, mark, count) histogram rows.
+
+    Returns one entry per subject, best average first, with the pass rate,
+    grade distribution, population standard deviation and median.
+    """
+    by_subject = OrderedDict()
+    for subject, mark, count in histogram:
+        by_subject.setdefault(subject, []).append((mark, count))
+
+    threshold = pass_threshold(form_level)
+    subjects = []
+    for subject, bins in by_subject.items():
+        bins.sort()
+        student_count = sum(count for _, count in bins)
+        average = sum(mark * count for mark, count in bins) / student_count
+        variance = sum(count * (mark - average) ** 2 for mark, count in bins) / student_count
+        passed_count = sum(count for mark, count in bins if mark >= threshold)
+
+        distribution = {grade: 0 for grade in grade_scale(form_level)}
+        for mark, count in bins:
+            distribution[calculate_grade(mark, form_level)] += count
+
+        subjects.append({
+            'subject': subject,
+            'average': round(average, 1),
+            'student_count': student_count,
+            'min_mark': bins[0][0],
+            'max_mark': bins[-1][0],
+            'pass_rate': round(passed_count / student_count * 100, 1),
+            'grade_distribution': distribution,
+            'std_dev': round(variance ** 0.5, 1),
+            'median': _histogram_median(bins, student_count),
+            '_average': average
+        })
+
+    subjects.sort(key=lambda x: -x['_average'])
+    for entry in subjects:
+        del entry['_average']
+    return subjects
+
+
+def _histogram_median(bins: List[Tuple[int, int]], total: int) -> float:
+    """Median of the marks described by sorted (mark, count) bins"""
+    def nth(n):
+        seen = 0
+        for mark, count in bins:
+            seen += count
+            if seen > n:
+                return mark
+
+    if total % 2:
+        return float(nth(total // 2))
+    return (nth(total // 2 - 1) + nth(total // 2)) / 2
+
+
+# Department groups used by the top performers leaderboards
+SUBJECT_GROUPS = {
+    # Sciences include the full science list including Business Studies and Home Economics
+    'sciences': ['Agriculture', 'Biology', 'Chemistry', 'Physics', 'Mathematics', 'Business Studies', 'Home Economics'],
+    'humanities': ['Bible Knowledge', 'Geography', 'History', 'Life Skills/SOS'],
+    # Languages are Chichewa and English; ranking based on total marks across both
+    'languages': ['English', 'Chichewa']
+}
+
+TOP_PERFORMER_CATEGORIES = ['overall'] + list(SUBJECT_GROUPS)
+
+
+def build_results_matrix(rows) -> List[Dict]:
+    """Build the class results matrix from (student_id, first_name, last_name, subject, mark, school_id) rows.
+
+    One entry per student (in row order) holding every mark of the period
+    together with the derived total, subject count and average.
+    """
+    students = {}
+    for student_id, first_name, last_name, subject, mark, school_id in rows:
+        entry = students.get(student_id)
+        if entry is None:
+            entry = students[student_id] = {
+                'student_id': student_id,
+                'name': f"{first_name} {last_name}",
+                'marks': [],
+                'total': 0
+            }
+        entry['marks'].append((subject, mark, school_id))
+        entry['total'] += mark
+
+    for entry in students.values():
+        entry['subject_count'] = len(entry['marks'])
+        entry['average'] = entry['total'] / entry['subject_count']
+    return list(students.values())
+
+
+def top_performers_from_matrix(matrix: List[Dict], category: str, form_level: int,
+                               school_id: Optional[int] = None, limit: int = 10) -> List[Dict]:
+    """Slice one top performers leaderboard out of the class results matrix"""
+    if category == 'overall':
+        # Only students who wrote at least six subjects are considered
+        candidates = [entry for entry in matrix if entry['subject_count'] >= 6]
+        performers = []
+        if form_level >= 3:
+            for entry in candidates:
+                performers.append({
+                    'name': entry['name'],
+                    'average': round(entry['average'], 1),
+                    'aggregate_points': best_six_points([mark for _, mark, _ in entry['marks']], form_level),
+                    'excellence_area': 'Overall Performance'
+                })
+            # Sort by lowest aggregate points (best performance) - CRITICAL RULE for Forms 3&4
+            performers.sort(key=lambda x: x['aggregate_points'])
+            return performers[:limit]
+
+        # For Forms 1&2: Sort by highest average
+        for entry in sorted(candidates, key=lambda x: -x['average'])[:limit]:
+            performers.append({
+                'name': entry['name'],
+                'average': round(entry['average'], 1),
+                'grade': calculate_grade(int(entry['average']), form_level),
+                'excellence_area': 'Overall Performance'
+            })
+        return performers
+
+    if category not in SUBJECT_GROUPS:
+        return []
+
+    # Department performance is the TOTAL of the group's subjects, with the department
+    # average (total / subjects taken) and the overall average for display
+    subjects = set(SUBJECT_GROUPS[category])
+    departments = []
+    for entry in matrix:
+        group_marks = [(subject, mark) for subject, mark, _ in entry['marks'] if subject in subjects]
+        if group_marks:
+            departments.append((entry, sum(mark for _, mark in group_marks), len({subject for subject, _ in group_marks})))
+    departments.sort(key=lambda x: -x[1])
+
+    performers = []
+    for entry, department_total, subjects_taken in departments[:limit]:
+        if school_id:
+            school_marks = [mark for _, mark, mark_school in entry['marks'] if mark_school == school_id]
+        else:
+            school_marks = [mark for _, mark, _ in entry['marks']]
+        overall_average = sum(school_marks) / len(school_marks) if school_marks else 0
+        performers.append({
+            'name': entry['name'],
+            'average': round(overall_average, 1),  # Overall average in %
+            'department_total': int(department_total),
+            'department_average': round(department_total / subjects_taken, 1),
+            'subjects_taken': int(subjects_taken),
+            'excellence_area': f"{category.title()} Department"
+        })
+    return performers
+
+
+class IncrementalClassRanking:
+    """Class ranking kept up to date one student at a time during mark entry.
+
+    Every student is held in a sorted list under their ranking sort key
+    (status, points or -average, then roster order) and in a second sorted
+    list of tie keys (status, points or -average rounded to 1 decimal). A
+    mark change recomputes only that student's row and moves its keys, and a
+    student's tied position is a bisect over the tie keys, so updating one
+    student costs O(log N) comparisons plus the list shift. snapshot()
+    materializes exactly the result of rank_class for the current students.
+    """
+
+    def __init__(self, class_marks: ClassMarks, form_level: int):
+        self.form_level = form_level
+        self._lock = threading.Lock()
+        self._entries = {}  # student_id -> (sort_key, tie_key, row)
+        self._sort_keys = []
+        self._tie_keys = []
+        self._snapshot = None
+        for student_id, first_name, last_name, marks in class_marks:
+            sort_key, tie_key, row = self._entry(student_id, first_name, last_name, marks)
+            self._entries[student_id] = (sort_key, tie_key, row)
+            self._sort_keys.append(sort_key)
+            self._tie_keys.append(tie_key)
+        self._sort_keys.sort()
+        self._tie_keys.sort()
+
+    def _entry(self, student_id: int, first_name: str, last_name: str, marks: Dict[str, int]):
+        """Sort key, tie key and ranking row of one student (same order and ties as assign_positions)"""
+        row = build_ranking_row(student_id, first_name, last_name, marks, self.form_level)
+        failed = row['status'] == 'FAIL'
+        if self.form_level >= 3:
+            rank_value = row['aggregate_points']
+            tie_key = (failed, rank_value)
+        else:
+            rank_value = -row['average']
+            tie_key = (failed, -round(row['average'], 1))
+        # Roster order (first name, last name, student id) keeps equal students in load order
+        return (failed, rank_value, first_name, last_name, student_id), tie_key, row
+
+    def update_student(self, student_id: int, first_name: str, last_name: str,
+                       marks: Optional[Dict[str, int]]) -> None:
+        """Re-rank one student after their marks changed; no marks removes them from the class"""
+        with self._lock:
+            old = self._entries.pop(student_id, None)
+            if old is not None:
+                del self._sort_keys[bisect.bisect_left(self._sort_keys, old[0])]
+                del self._tie_keys[bisect.bisect_left(self._tie_keys, old[1])]
+            if marks:
+                sort_key, tie_key, row = self._entry(student_id, first_name, last_name, marks)
+                self._entries[student_id] = (sort_key, tie_key, row)
+                bisect.insort(self._sort_keys, sort_key)
+                bisect.insort(self._tie_keys, tie_key)
+            self._snapshot = None
+
+    def position(self, student_id: int) -> Optional[int]:
+        """Tied position of a student: 1 + number of students ranked strictly ahead"""
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is None:
+                return None
+            return bisect.bisect_left(self._tie_keys, entry[1]) + 1
+
+    def __contains__(self, student_id: int) -> bool:
+        return student_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def snapshot(self) -> Dict:
+        """Current ranking in the shape of rank_class; rebuilt only after a change"""
+        with self._lock:
+            if self._snapshot is None:
+                rankings = []
+                previous_tie_key = None
+                for i, sort_key in enumerate(self._sort_keys):
+                    _, tie_key, row = self._entries[sort_key[-1]]
+                    row = dict(row)
+                    row['position'] = rankings[-1]['position'] if tie_key == previous_tie_key else i + 1
+                    previous_tie_key = tie_key
+                    rankings.append(row)
+                self._snapshot = {
+                    'rankings': rankings,
+                    'index': {row['student_id']: row for row in rankings},
+                    'total_students': len(rankings),
+                    'students_with_marks': len(rankings)
+                }
+            return self._snapshot
+
+
+class RankingSnapshotCache:
+    """Bounded LRU cache of ranking snapshots stamped with a period data version.
+
+    A snapshot is only served while the stored version equals the current
+    version of its period, so any write that bumps the version makes older
+    snapshots unreachable. Snapshots are shared between callers and must be
+    treated as read-only.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        """Return the snapshot for key if it was stored for this version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: int, snapshot: Any) -> None:
+        """Store a snapshot, evicting the least recently used entries beyond maxsize"""
+        with self._lock:
+            self._entries[key] = (version, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def version_of(self, key: Hashable) -> Optional[int]:
+        """Version an entry was stored for, without touching LRU order or counters"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def advance(self, key: Hashable, version: int, new_version: int, update: Callable[[Any], None]) -> bool:
+        """Apply an in-place update to the entry stored for `version` and restamp it as `new_version`.
+
+        Used by writers that know their change is the only one between the two
+        versions; returns False (and changes nothing) when the entry is missing
+        or was stored for another version.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return False
+            update(entry[1])
+            self._entries[key] = (new_version, entry[1])
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+# Shared by every SchoolDatabase instance in the process
+ranking_cache = RankingSnapshotCache(maxsize=int(os.environ.get('RANKING_CACHE_SIZE', '256')))
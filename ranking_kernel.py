@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Vectorized Ranking Kernel
+NumPy version of the class ranking for whole-school recomputation (term close).
+A class is a dense int8 students x subjects mark array with a mask of the
+marks that were actually written; pass counts, English pass, best-six MSCE
+points, averages and tied positions are computed for every student at once.
+Produces exactly the rows of ranking_engine.rank_class (same rules from
+results_engine, same order and tie handling).
+"""
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+import ranking_engine
+import results_engine
+
+# MSCE grade points of every mark 0-100
+MSCE_POINTS = np.array([int(results_engine.calculate_grade(mark, 3)) for mark in range(101)], dtype=np.int8)
+# Forms 1&2 grade index of every mark 0-100 (0=A, 1=B, 2=C, 3=D, 4=F)
+JUNIOR_GRADE_INDEX = np.array(
+    [results_engine.JUNIOR_GRADES.index(results_engine.calculate_grade(mark, 1)) for mark in range(101)], dtype=np.int8)
+
+
+def build_mark_matrix(class_marks, subjects: Sequence[str]):
+    """Dense (marks, present) arrays for grouped class marks; missing marks are 0 and masked out"""
+    column = {subject: i for i, subject in enumerate(subjects)}
+    marks = np.zeros((len(class_marks), len(subjects)), dtype=np.int8)
+    present = np.zeros((len(class_marks), len(subjects)), dtype=bool)
+    for row, (_, _, _, student_marks) in enumerate(class_marks):
+        for subject, mark in student_marks.items():
+            marks[row, column[subject]] = mark
+            present[row, column[subject]] = True
+    return marks, present
+
+
+def _round1(average: np.ndarray) -> np.ndarray:
+    """round(x, 1) for every element, bit-identical to Python's round.
+
+    np.round scales by 10 first, which can tip values that sit just below a
+    .x5 boundary; those few are redone with Python's correctly rounded round().
+    """
+    rounded = np.round(average, 1)
+    scaled = average * 10
+    near_half = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for i in near_half:
+        rounded[i] = round(float(average[i]), 1)
+    return rounded
+
+
+def rank_matrix(marks: np.ndarray, present: np.ndarray, english_column: int, form_level: int) -> Dict[str, np.ndarray]:
+    """Compute ranking figures for every student (row) of a class at once.
+
+    Args:
+        marks: int8 array (students x subjects), marks 0-100
+        present: bool array of the same shape, True where a mark was written
+        english_column: column of English, or -1 when nobody wrote it
+        form_level: form of the class
+
+    Returns:
+        dict of per-student arrays in input order: total_subjects, passed,
+        english_passed, passed_status, average, aggregate_points,
+        best_six_total, grade_index (Forms 1&2) and order/position (the
+        ranked order of rows and the tied position of each ranked row)
+    """
+    n_students = marks.shape[0]
+    wide = marks.astype(np.int64)
+    total_subjects = present.sum(axis=1)
+    insufficient = total_subjects < results_engine.MIN_PASSED_SUBJECTS
+
+    threshold = results_engine.pass_threshold(form_level)
+    passing = present & (wide >= threshold)
+    passed = passing.sum(axis=1)
+    if english_column >= 0:
+        english_passed = passing[:, english_column]
+    else:
+        english_passed = np.zeros(n_students, dtype=bool)
+    passed_status = (passed >= results_engine.MIN_PASSED_SUBJECTS) & english_passed
+
+    totals = np.where(present, wide, 0).sum(axis=1)
+    average = np.where(total_subjects > 0, totals / np.maximum(total_subjects, 1), 0.0)
+
+    # Best six: sort written marks descending (missing ones as -1 sink to the end)
+    best = -np.sort(-np.where(present, wide, -1), axis=1)[:, :6]
+    best_present = best >= 0
+    best_six_total = np.where(insufficient, 0, np.where(best_present, best, 0).sum(axis=1))
+    best_points = np.where(best_present, MSCE_POINTS[np.clip(best, 0, 100)], 0).sum(axis=1)
+    aggregate_points = np.where(insufficient, results_engine.INSUFFICIENT_SUBJECTS_POINTS, best_points)
+
+    # Forms 1&2 ranking grade: most common passing grade, the better grade winning ties
+    grade_index = JUNIOR_GRADE_INDEX[np.clip(wide, 0, 100)]
+    grade_counts = np.stack([(passing & (grade_index == g)).sum(axis=1) for g in range(4)], axis=1)
+    ranking_grade_index = np.where(passed_status, np.argmax(grade_counts, axis=1), 4)
+
+    failed = ~passed_status
+    if form_level >= 3:
+        # PASS first, then aggregate points (LOWEST first); stable on roster order
+        order = np.lexsort((aggregate_points, failed))
+        tie_key = aggregate_points[order]
+    else:
+        # PASS first, then average (HIGHEST first); ties on the average rounded to 1 decimal
+        rank_average = np.where(insufficient, 0.0, average)
+        order = np.lexsort((-rank_average, failed))
+        tie_key = _round1(rank_average)[order]
+
+    ranked_failed = failed[order]
+    tied = np.zeros(n_students, dtype=bool)
+    tied[1:] = (ranked_failed[1:] == ranked_failed[:-1]) & (tie_key[1:] == tie_key[:-1])
+    slots = np.arange(1, n_students + 1)
+    position = np.maximum.accumulate(np.where(tied, 0, slots))
+
+    return {
+        'total_subjects': total_subjects,
+        'passed': passed,
+        'english_passed': english_passed,
+        'passed_status': passed_status,
+        'average': average,
+        'aggregate_points': aggregate_points,
+        'best_six_total': best_six_total,
+        'grade_index': ranking_grade_index,
+        'order': order,
+        'position': position
+    }
+
+
+def _snapshot(figures: Dict[str, np.ndarray], student_ids: List[int], names: List[str], form_level: int) -> Dict:
+    """Ranking result in the shape of ranking_engine.rank_class, with plain Python values"""
+    columns = {name: values.tolist() for name, values in figures.items()}
+    rankings: List[Dict] = []
+    for ranked, i in enumerate(columns['order']):
+        insufficient = columns['total_subjects'][i] <= 5
+        row = {
+            'student_id': student_ids[i],
+            'name': names[i],
+            'average': 0 if insufficient else columns['average'][i],
+            'subjects_passed': 0 if insufficient else columns['passed'][i],
+            'status': 'PASS' if columns['passed_status'][i] else 'FAIL',
+            'total_subjects': columns['total_subjects'][i]
+        }
+        if form_level >= 3:
+            row['aggregate_points'] = columns['aggregate_points'][i]
+        else:
+            row['grade'] = results_engine.JUNIOR_GRADES[columns['grade_index'][i]]
+            row['best_six_total'] = columns['best_six_total'][i]
+        row['position'] = columns['position'][ranked]
+        rankings.append(row)
+
+    return {
+        'rankings': rankings,
+        'index': {row['student_id']: row for row in rankings},
+        'total_students': len(rankings),
+        'students_with_marks': len(rankings)
+    }
+
+
+def rank_class_vectorized(class_marks, form_level: int) -> Dict:
+    """Drop-in replacement for ranking_engine.rank_class on grouped class marks (0-100)"""
+    subjects = sorted({subject for _, _, _, marks in class_marks for subject in marks})
+    marks, present = build_mark_matrix(class_marks, subjects)
+    english_column = subjects.index('English') if 'English' in subjects else -1
+    figures = rank_matrix(marks, present, english_column, form_level)
+    student_ids = [student_id for student_id, _, _, _ in class_marks]
+    names = [f"{first_name} {last_name}" for _, first_name, last_name, _ in class_marks]
+    return _snapshot(figures, student_ids, names, form_level)
+
+
+def rank_school_rows(rows, form_levels: Sequence[int] = (1, 2, 3, 4)) -> Dict[int, Dict]:
+    """Rank every form of a school from (student_id, first_name, last_name, subject, mark, form_level) rows.
+
+    Rows must be in roster order. A student is ranked in every form they have
+    a mark for, using all of their marks; the whole school is densified into
+    one matrix without grouping marks per student in Python. Forms holding a
+    mark outside 0-100 are ranked by ranking_engine.rank_class instead.
+    """
+    if not rows:
+        return {form_level: _snapshot(rank_matrix(np.zeros((0, 0), dtype=np.int8), np.zeros((0, 0), dtype=bool), -1, form_level),
+                                      [], [], form_level)
+                for form_level in form_levels}
+
+    student_col, first_col, last_col, subject_col, mark_col, form_col = zip(*rows)
+    ids, first_seen, inverse = np.unique(np.array(student_col, dtype=np.int64), return_index=True, return_inverse=True)
+    # Matrix rows follow the roster: order of each student's first row
+    roster = np.argsort(first_seen, kind='stable')
+    roster_row = np.empty_like(roster)
+    roster_row[roster] = np.arange(len(roster))
+    row_of_mark = roster_row[inverse.reshape(-1)]
+
+    subjects, column_of_mark = np.unique(np.array(subject_col, dtype=object), return_inverse=True)
+    column_of_mark = column_of_mark.reshape(-1)
+    marks = np.zeros((len(ids), len(subjects)), dtype=np.int64)
+    present = np.zeros((len(ids), len(subjects)), dtype=bool)
+    marks[row_of_mark, column_of_mark] = np.array(mark_col, dtype=np.int64)
+    present[row_of_mark, column_of_mark] = True
+
+    in_form = np.zeros((len(ids), 5), dtype=bool)
+    in_form[row_of_mark, np.array([f if f in (1, 2, 3, 4) else 0 for f in form_col], dtype=np.int64)] = True
+
+    first_rows = first_seen[roster].tolist()
+    student_ids = [student_col[i] for i in first_rows]
+    names = [f"{first_col[i]} {last_col[i]}" for i in first_rows]
+    subject_list = subjects.tolist()
+    english_column = subject_list.index('English') if 'English' in subject_list else -1
+
+    results = {}
+    for form_level in form_levels:
+        members = np.flatnonzero(in_form[:, form_level])
+        class_marks, class_present = marks[members], present[members]
+        member_ids = [student_ids[i] for i in members.tolist()]
+        member_names = [names[i] for i in members.tolist()]
+        written = class_marks[class_present]
+        if written.size and (written.min() < 0 or written.max() > 100):
+            grouped = [
+                (member_ids[k], first_col[first_rows[i]], last_col[first_rows[i]],
+                 {subject_list[j]: int(class_marks[k, j]) for j in np.flatnonzero(class_present[k]).tolist()})
+                for k, i in enumerate(members.tolist())
+            ]
+            results[form_level] = ranking_engine.rank_class(grouped, form_level)
+            continue
+        figures = rank_matrix(class_marks.astype(np.int8), class_present, english_column, form_level)
+        results[form_level] = _snapshot(figures, member_ids, member_names, form_level)
+    return results
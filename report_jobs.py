@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Background Report Jobs
+Generates the report cards of one form or all forms outside the HTTP request.
+Jobs live in a small SQLite database next to the school database; worker
+threads claim them with a renewable lease, record every finished student and
+keep its PDF on disk, so a job interrupted by a restart resumes from the last
+completed student. The finished job is a ZIP artifact served with Range support.
+"""
+
+import json
+import os
+import secrets
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import zipfile
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import logging
+
+# A running job whose lease is not renewed for this long is considered interrupted
+LEASE_SECONDS = int(os.environ.get('REPORT_JOB_LEASE_SECONDS', '120'))
+# Finished jobs and their artifacts are removed after this many hours
+RETENTION_HOURS = int(os.environ.get('REPORT_JOB_RETENTION_HOURS', '48'))
+FORM_LEVELS = [1, 2, 3, 4]
+
+
+class ReportJobManager:
+    """SQLite-backed queue of report generation jobs and the threads that run them"""
+
+    def __init__(self, jobs_dir: str, generator, workers: int = 1, poll_interval: float = 2.0):
+        self.jobs_dir = jobs_dir
+        self.db_path = os.path.join(jobs_dir, 'report_jobs.db')
+        self.generator = generator
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.logger = logging.getLogger(__name__)
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads: List[threading.Thread] = []
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.create_tables()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create_tables(self):
+        """Create the job tables if they don't exist"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS report_jobs (
+                        job_id TEXT PRIMARY KEY,
+                        school_id INTEGER NOT NULL,
+                        forms TEXT NOT NULL,
+                        term TEXT NOT NULL,
+                        academic_year TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'queued',
+                        total INTEGER DEFAULT 0,
+                        done INTEGER DEFAULT 0,
+                        created_date TEXT NOT NULL,
+                        started_date TEXT,
+                        finished_date TEXT,
+                        lease_expires REAL DEFAULT 0,
+                        claim_token TEXT,
+                        run_done_start INTEGER DEFAULT 0,
+                        artifact_path TEXT,
+                        error TEXT
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS report_job_items (
+                        job_id TEXT NOT NULL,
+                        form_level INTEGER NOT NULL,
+                        seq INTEGER NOT NULL,
+                        student_id INTEGER NOT NULL,
+                        filename TEXT NOT NULL,
+                        completed_date TEXT NOT NULL,
+                        PRIMARY KEY (job_id, form_level, student_id)
+                    )
+                """)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_jobs_status ON report_jobs (status, created_date)")
+                # Job databases created before claims carried a token
+                cursor.execute("PRAGMA table_info(report_jobs)")
+                if 'claim_token' not in [row[1] for row in cursor.fetchall()]:
+                    cursor.execute("ALTER TABLE report_jobs ADD COLUMN claim_token TEXT")
+                conn.commit()
+        except Exception as e:
+            self.logger.error(f"Error creating report job tables: {e}")
+            raise
+
+    # ------------------------------------------------------------------
+    # Queue API used by the web endpoints
+    # ------------------------------------------------------------------
+
+    def submit(self, school_id: int, forms: List[int], term: str, academic_year: str) -> str:
+        """Queue a job generating the report cards of `forms` and return its id"""
+        job_id = secrets.token_hex(12)
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO report_jobs (job_id, school_id, forms, term, academic_year, status, created_date)
+                VALUES (?, ?, ?, ?, ?, 'queued', ?)
+            """, (job_id, school_id, json.dumps(forms), term, academic_year, datetime.now().isoformat()))
+            conn.commit()
+        self.logger.info(f"Queued report job {job_id} for school {school_id}: forms {forms}, {term} {academic_year}")
+        self._wake.set()
+        return job_id
+
+    def get_job(self, job_id: str, school_id: int = None) -> Optional[Dict]:
+        """Job status with progress and ETA; None if it doesn't exist (or belongs to another school)"""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            if school_id:
+                row = conn.execute("SELECT * FROM report_jobs WHERE job_id = ? AND school_id = ?", (job_id, school_id)).fetchone()
+            else:
+                row = conn.execute("SELECT * FROM report_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job['forms'] = json.loads(job['forms'])
+        job['progress'] = round(job['done'] / job['total'], 3) if job['total'] else 0.0
+        job['eta_seconds'] = None
+        # ETA from the rate of the current run (started_date restarts when a job is resumed)
+        done_this_run = job['done'] - job.pop('run_done_start')
+        if job['status'] == 'running' and done_this_run > 0 and job['started_date']:
+            elapsed = (datetime.now() - datetime.fromisoformat(job['started_date'])).total_seconds()
+            job['eta_seconds'] = round(elapsed / done_this_run * (job['total'] - job['done']), 1)
+        del job['lease_expires']
+        del job['claim_token']
+        return job
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'report-job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        """Ask the workers to stop after their current student"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stop.clear()
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                claim = self.claim_next_job()
+                if claim:
+                    self.run_job(*claim)
+                    continue
+                self.purge_expired()
+            except Exception as e:
+                self.logger.error(f"Report job worker error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def claim_next_job(self) -> Optional[Tuple[str, str]]:
+        """Atomically take the oldest queued job, or a running one whose lease expired (interrupted).
+
+        Returns (job_id, claim_token). Every later update of the job matches
+        the token, so a worker that lost its lease to another one cannot
+        renew, finish or fail the job any more.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("""
+                SELECT job_id FROM report_jobs
+                WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?)
+                ORDER BY created_date LIMIT 1
+            """, (now,)).fetchone()
+            if row is None:
+                conn.commit()
+                return None
+            claim_token = uuid.uuid4().hex
+            conn.execute("""
+                UPDATE report_jobs SET status = 'running', lease_expires = ?, claim_token = ?, started_date = ?,
+                                       run_done_start = done
+                WHERE job_id = ?
+            """, (now + LEASE_SECONDS, claim_token, datetime.now().isoformat(), row[0]))
+            conn.commit()
+            return row[0], claim_token
+
+    def _parts_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def run_job(self, job_id: str, claim_token: str):
+        """Render every remaining student of a claimed job, then assemble its ZIP"""
+        with self._connect() as conn:
+            school_id, forms, term, academic_year, created_date = conn.execute(
+                "SELECT school_id, forms, term, academic_year, created_date FROM report_jobs WHERE job_id = ?",
+                (job_id,)).fetchone()
+        forms = json.loads(forms)
+        # Every card of a job carries the submission time, also when it is resumed
+        generated_at = datetime.fromisoformat(created_date)
+
+        try:
+            total = sum(len(self.generator.db.get_students_by_grade(form_level, school_id)) for form_level in forms)
+            with self._connect() as conn:
+                conn.execute("UPDATE report_jobs SET total = ? WHERE job_id = ? AND claim_token = ?",
+                             (total, job_id, claim_token))
+                conn.commit()
+
+            for form_level in forms:
+                with self._connect() as conn:
+                    completed = {row[0] for row in conn.execute(
+                        "SELECT student_id FROM report_job_items WHERE job_id = ? AND form_level = ?", (job_id, form_level))}
+                cards = self.generator.generate_class_report_pdfs(
+                    form_level, term, academic_year, school_id, generated_at=generated_at, skip_student_ids=completed)
+                try:
+                    for seq, (student, pdf_bytes) in enumerate(cards):
+                        if self._stop.is_set():
+                            # Shutting down: hand the job back to the queue to be resumed
+                            with self._connect() as conn:
+                                conn.execute("UPDATE report_jobs SET status = 'queued' WHERE job_id = ? AND claim_token = ?",
+                                             (job_id, claim_token))
+                                conn.commit()
+                            return
+                        if not self._record_student(job_id, claim_token, form_level, len(completed) + seq,
+                                                    student, pdf_bytes, term, academic_year):
+                            self.logger.warning(f"Report job {job_id}: lease lost to another worker, stopping")
+                            return
+                finally:
+                    cards.close()
+
+            self._finish_job(job_id, claim_token, forms, term, academic_year)
+        except Exception as e:
+            self.logger.error(f"Report job {job_id} failed: {e}")
+            with self._connect() as conn:
+                conn.execute("""
+                    UPDATE report_jobs SET status = 'failed', error = ?, finished_date = ?
+                    WHERE job_id = ? AND claim_token = ?
+                """, (str(e), datetime.now().isoformat(), job_id, claim_token))
+                conn.commit()
+
+    def _record_student(self, job_id: str, claim_token: str, form_level: int, seq: int, student: Dict,
+                        pdf_bytes: bytes, term: str, academic_year: str) -> bool:
+        """Persist one finished card, count it and renew the job lease.
+
+        Returns False when the claim is no longer ours (the lease expired and
+        another worker took the job).
+        """
+        filename = ''
+        if pdf_bytes:
+            filename = f"{student['first_name']}_{student['last_name']}_Report_{term.replace(' ','_')}_{academic_year.replace('-','_')}.pdf"
+            parts_dir = self._parts_dir(job_id)
+            os.makedirs(parts_dir, exist_ok=True)
+            part_path = os.path.join(parts_dir, f"{form_level}_{student['student_id']}.pdf")
+            with open(part_path + '.tmp', 'wb') as f:
+                f.write(pdf_bytes)
+            os.replace(part_path + '.tmp', part_path)
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT OR IGNORE INTO report_job_items (job_id, form_level, seq, student_id, filename, completed_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (job_id, form_level, seq, student['student_id'], filename, datetime.now().isoformat()))
+            renewed = conn.execute("""
+                UPDATE report_jobs SET done = (SELECT COUNT(*) FROM report_job_items WHERE job_id = ?), lease_expires = ?
+                WHERE job_id = ? AND claim_token = ?
+            """, (job_id, time.time() + LEASE_SECONDS, job_id, claim_token)).rowcount
+            conn.commit()
+        return renewed == 1
+
+    def _finish_job(self, job_id: str, claim_token: str, forms: List[int], term: str, academic_year: str):
+        """Zip the stored cards in roster order and mark the job completed"""
+        with self._connect() as conn:
+            items = conn.execute("""
+                SELECT form_level, student_id, filename FROM report_job_items
+                WHERE job_id = ? AND filename != '' ORDER BY form_level, seq
+            """, (job_id,)).fetchall()
+
+        parts_dir = self._parts_dir(job_id)
+        artifact_path = os.path.join(self.jobs_dir, f"{job_id}.zip")
+        # Each claim zips into its own file; only the current claim publishes it
+        temp_path = f"{artifact_path}.{claim_token}.tmp"
+        try:
+            with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+                for form_level, student_id, filename in items:
+                    # One folder per form when the job covers several forms
+                    arcname = f"Form_{form_level}/{filename}" if len(forms) > 1 else filename
+                    zf.write(os.path.join(parts_dir, f"{form_level}_{student_id}.pdf"), arcname)
+
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                completed = conn.execute("""
+                    UPDATE report_jobs SET status = 'completed', artifact_path = ?, finished_date = ?
+                    WHERE job_id = ? AND claim_token = ?
+                """, (artifact_path, datetime.now().isoformat(), job_id, claim_token)).rowcount
+                if completed:
+                    os.replace(temp_path, artifact_path)
+                conn.commit()
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        if not completed:
+            self.logger.warning(f"Report job {job_id}: lease lost to another worker, artifact discarded")
+            return
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        self.logger.info(f"Report job {job_id} completed: {len(items)} report cards")
+
+    def purge_expired(self):
+        """Remove finished jobs (and their files) older than RETENTION_HOURS"""
+        cutoff = datetime.fromtimestamp(time.time() - RETENTION_HOURS * 3600).isoformat()
+        with self._connect() as conn:
+            expired = conn.execute("""
+                SELECT job_id, artifact_path FROM report_jobs
+                WHERE status IN ('completed', 'failed') AND finished_date < ?
+            """, (cutoff,)).fetchall()
+            for job_id, artifact_path in expired:
+                if artifact_path and os.path.exists(artifact_path):
+                    os.remove(artifact_path)
+                shutil.rmtree(self._parts_dir(job_id), ignore_errors=True)
+                conn.execute("DELETE FROM report_job_items WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM report_jobs WHERE job_id = ?", (job_id,))
+            conn.commit()
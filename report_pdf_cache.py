@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Report Card PDF Cache
+Content-addressed store of rendered report-card PDFs on the persistent disk.
+A card is filed under a hash of everything it is rendered from (student,
+period data version, settings version, last modification time, database
+identity, the student's own rows, template version), so an unchanged card
+is served with one file read and a changed one simply gets a new key.
+The directory is bounded in size; the least recently served files go first.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+# Size bound of the cache directory; 0 disables caching
+REPORT_PDF_CACHE_MB = int(os.environ.get('REPORT_PDF_CACHE_MB', '256'))
+
+
+def report_cache_key(*parts) -> str:
+    """Hex SHA-256 of the given key parts"""
+    return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class ReportPDFCache:
+    """Size-bounded directory of PDFs named by their content key.
+
+    Files are written atomically, so several gunicorn workers can share one
+    directory. A hit refreshes the file's mtime, which is the LRU order used
+    when the directory grows beyond `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._size = None  # bytes on disk, counted on the first write
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Cached PDF bytes for a key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                pdf_bytes = f.read()
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pdf_bytes
+
+    def put(self, key: str, pdf_bytes: bytes):
+        """Store a PDF under its key and evict old files when over the size bound"""
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(pdf_bytes)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.error(f"Error writing cached report {key}: {e}")
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += len(pdf_bytes)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        for shard in os.scandir(self.cache_dir):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.pdf'):
+                        yield entry
+
+    def _disk_usage(self) -> int:
+        return sum(entry.stat().st_size for entry in self._files())
+
+    def _evict(self):
+        """Delete least recently served files until the cache is at 90% of its bound.
+
+        Other processes write to the same directory, so the size is recounted
+        from disk here rather than trusted from this process's tally.
+        """
+        entries = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self._files()))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+            size -= entry_size
+        self._size = size
+
+    def clear(self):
+        """Remove every cached PDF"""
+        with self._lock:
+            for entry in list(self._files()):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'cache_dir': self.cache_dir,
+                'max_bytes': self.max_bytes,
+                'size_bytes': self._size if self._size is not None else self._disk_usage(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+_caches: Dict[str, ReportPDFCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_report_pdf_cache(cache_dir: str) -> Optional[ReportPDFCache]:
+    """Shared cache of a directory (one per process), or None when caching is disabled"""
+    if REPORT_PDF_CACHE_MB <= 0:
+        return None
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = _caches[cache_dir] = ReportPDFCache(cache_dir, REPORT_PDF_CACHE_MB * 1024 * 1024)
+        return cache
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Student Results Engine
+Single home of the school's result rules, shared by the class rankings,
+report cards, progress reports and PDFs:
+- Subject pass mark: 50 for Forms 1&2 (A-F), 40 for Forms 3&4 (MSCE 1-9)
+- PASS requires at least 6 passed subjects AND a pass in English
+- Students who wrote 1-5 subjects FAIL (54 aggregate points for Forms 3&4)
+- Forms 3&4 aggregate: MSCE points of the best six subjects
+Results are plain dicts computed from {subject: mark}; compute_results
+takes the marks of many students at once.
+"""
+
+from typing import Dict, Hashable, List, Mapping
+
+JUNIOR_GRADES = ['A', 'B', 'C', 'D', 'F']
+PASSING_JUNIOR_GRADES = ['A', 'B', 'C', 'D']
+MIN_PASSED_SUBJECTS = 6
+# CRITICAL RULE: Forms 3&4 students with 1-5 subjects MUST get 54 aggregate points
+INSUFFICIENT_SUBJECTS_POINTS = 54
+
+
+def pass_threshold(form_level: int) -> int:
+    """Pass mark for a subject: 50 for Forms 1&2, 40 (MSCE grade 8) for Forms 3&4"""
+    return 50 if form_level in [1, 2] else 40
+
+
+def calculate_grade(mark: int, form_level: int) -> str:
+    """Grade for a mark (A-F for Forms 1&2, MSCE 1-9 for Forms 3&4)"""
+    if form_level in [1, 2]:
+        if mark >= 80: return 'A'
+        elif mark >= 70: return 'B'
+        elif mark >= 60: return 'C'
+        elif mark >= 50: return 'D'
+        else: return 'F'
+    else:
+        if mark >= 75: return '1'
+        elif mark >= 70: return '2'
+        elif mark >= 65: return '3'
+        elif mark >= 60: return '4'
+        elif mark >= 55: return '5'
+        elif mark >= 50: return '6'
+        elif mark >= 45: return '7'
+        elif mark >= 40: return '8'
+        else: return '9'
+
+
+def grade_scale(form_level: int) -> List[str]:
+    """All grades of a form's grading scale, best first"""
+    return list(JUNIOR_GRADES) if form_level in [1, 2] else [str(points) for points in range(1, 10)]
+
+
+def best_six_points(marks: List[int], form_level: int) -> int:
+    """Sum of MSCE grade points of the best six marks"""
+    best_marks = sorted(marks, reverse=True)[:6]
+    points = 0
+    for mark in best_marks:
+        grade = calculate_grade(mark, form_level)
+        points += int(grade) if grade.isdigit() else 9
+    return points
+
+
+def status_reason(passed_subjects: int, english_passed: bool) -> str:
+    """Explanation for a pass/fail status"""
+    if passed_subjects >= MIN_PASSED_SUBJECTS and english_passed:
+        return 'Passed 6 or more subjects including English'
+    elif passed_subjects >= MIN_PASSED_SUBJECTS and not english_passed:
+        return 'Failed English (English is mandatory for pass)'
+    elif passed_subjects < MIN_PASSED_SUBJECTS and english_passed:
+        return f'Passed only {passed_subjects} subjects (minimum 6 required)'
+    else:
+        return f'Passed only {passed_subjects} subjects and failed English'
+
+
+def _most_common(grades: List[str], scale: List[str]) -> List[str]:
+    """Grades of the scale that occur most often (in scale order)"""
+    counts = {grade: 0 for grade in scale}
+    for grade in grades:
+        if grade in counts:
+            counts[grade] += 1
+    max_count = max(counts.values())
+    return [grade for grade, count in counts.items() if count == max_count]
+
+
+def ranking_grade(marks: List[int], form_level: int, status: str) -> str:
+    """Forms 1&2 class ranking grade.
+
+    Failed students get F; passed students get their most common passing
+    grade, the better grade winning a tie.
+    """
+    # CRITICAL RULE: ANY failed student gets F grade
+    if status == 'FAIL':
+        return 'F'
+    threshold = pass_threshold(form_level)
+    passing = [calculate_grade(mark, form_level) for mark in marks if mark >= threshold]
+    if not passing:
+        return 'D'
+    return _most_common(passing, PASSING_JUNIOR_GRADES)[0]
+
+
+def report_grade(marks: List[int], form_level: int, status: str, average: float) -> str:
+    """Overall grade printed on report cards.
+
+    Forms 3&4 use the grade of the average mark. Forms 1&2: failed students
+    get F; otherwise the most common grade, with ties settled by the grade of
+    the average mark, and a passed student never gets F.
+    """
+    if form_level not in [1, 2]:
+        return calculate_grade(int(average), form_level)
+    if status == 'FAIL' or not marks:
+        return 'F'
+
+    grades = [calculate_grade(mark, form_level) for mark in marks]
+    most_common = _most_common(grades, JUNIOR_GRADES)
+    grade = most_common[0] if len(most_common) == 1 else calculate_grade(int(average), form_level)
+
+    # Ensure passing students don't get F grade
+    if grade == 'F':
+        passing = [g for g in grades if g in PASSING_JUNIOR_GRADES]
+        if not passing:
+            return 'D'
+        most_common = _most_common(passing, PASSING_JUNIOR_GRADES)
+        if len(most_common) == 1:
+            grade = most_common[0]
+        else:
+            grade = calculate_grade(int(average), form_level)
+            if grade == 'F':
+                grade = 'D'
+    return grade
+
+
+def student_result(marks: Mapping[str, int], form_level: int) -> Dict:
+    """Compute a student's outcome for a period from their {subject: mark}
+
+    Returns:
+        dict: total_subjects, average, passed_subjects, english_mark,
+        english_passed, status, status_reason, aggregate_points (best-six
+        MSCE points, 54 for 1-5 subjects), best_six_total (sum of the best
+        six marks, 0 for 1-5 subjects), grade (ranking rule) and
+        report_grade (report card rule)
+    """
+    mark_values = list(marks.values())
+    total_subjects = len(mark_values)
+    threshold = pass_threshold(form_level)
+
+    average = sum(mark_values) / total_subjects if total_subjects else 0
+    passed_subjects = sum(1 for mark in mark_values if mark >= threshold)
+    english_mark = marks.get('English', 0)
+    english_passed = english_mark >= threshold
+    # Students who wrote insufficient subjects (1-5) can never reach 6 passes
+    if passed_subjects >= MIN_PASSED_SUBJECTS and english_passed:
+        status = 'PASS'
+    else:
+        status = 'FAIL'
+
+    insufficient = total_subjects < MIN_PASSED_SUBJECTS
+    return {
+        'total_subjects': total_subjects,
+        'average': average,
+        'passed_subjects': passed_subjects,
+        'english_mark': english_mark,
+        'english_passed': english_passed,
+        'status': status,
+        'status_reason': status_reason(passed_subjects, english_passed),
+        'aggregate_points': INSUFFICIENT_SUBJECTS_POINTS if insufficient else best_six_points(mark_values, form_level),
+        'best_six_total': 0 if insufficient else sum(sorted(mark_values, reverse=True)[:6]),
+        'grade': ranking_grade(mark_values, form_level, status),
+        'report_grade': report_grade(mark_values, form_level, status, average)
+    }
+
+
+def compute_results(students_marks: Mapping[Hashable, Mapping[str, int]], form_level: int) -> Dict[Hashable, Dict]:
+    """Batch version of student_result: {student_id: {subject: mark}} -> {student_id: result}"""
+    return {student_id: student_result(marks, form_level) for student_id, marks in students_marks.items()}
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Versioned Schema Migrations
+Ordered SQL files in migrations/sqlite and migrations/postgres, named
+NNNN_description.sql, build the schema one step at a time. Every applied
+file is recorded in the schema_version table, so a process start costs a
+single SELECT MAX(version) once the database is up to date; only a database
+behind the newest file takes the migration lock and applies the rest.
+
+SQLite databases created before the runner carry no schema_version rows.
+They are adopted once: columns that older versions added with ALTER TABLE
+at every start are added if missing, and a students table still keyed on
+student_number alone is rebuilt, before the baseline migration runs.
+Append new migrations as new files; never edit one that has been applied.
+"""
+
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Held for the migration transaction so Postgres workers starting together migrate one at a time
+PG_MIGRATION_LOCK_ID = 5_208_301
+
+# Columns that SQLite databases predating the baseline may lack, with their definitions
+LEGACY_COLUMNS = {
+    'students': [('school_id', 'INTEGER')],
+    'student_marks': [('school_id', 'INTEGER')],
+    'subject_teachers': [('school_id', 'INTEGER')],
+    'school_settings': [
+        ('sdf_fund', 'TEXT'),
+        ('boarding_fee', 'TEXT'),
+        ('selected_term', 'TEXT'),
+        ('selected_academic_year', 'TEXT'),
+    ],
+    'schools': [
+        ('subscription_status', "TEXT DEFAULT 'trial'"),
+        ('subscription_start_date', 'TEXT'),
+        ('subscription_end_date', 'TEXT'),
+        ('days_remaining', 'INTEGER DEFAULT 90'),
+        ('must_change_password', 'INTEGER DEFAULT 0'),
+    ],
+    'academic_periods': [
+        ('school_id', 'INTEGER'),
+        # ALTER TABLE cannot add a column with a CURRENT_TIMESTAMP default
+        ('created_date', 'TEXT'),
+    ],
+}
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split a migration file into statements (no procedural blocks are used)"""
+    statements, current = [], ''
+    for line in sql.splitlines(keepends=True):
+        if not current and (not line.strip() or line.lstrip().startswith('--')):
+            continue
+        current += line
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ''
+    if current.strip():
+        statements.append(current.strip())
+    return statements
+
+
+class SchemaMigrator:
+    """Applies the migration files of one backend ('sqlite' or 'postgres')"""
+
+    def __init__(self, backend: str = 'sqlite', migrations_dir: str = MIGRATIONS_DIR):
+        self.backend = backend
+        self.directory = os.path.join(migrations_dir, backend)
+        self.logger = logging.getLogger(__name__)
+        self._migrations = None
+
+    def migrations(self) -> List[Tuple[int, str, List[str]]]:
+        """(version, description, statements) of every migration file, in order"""
+        if self._migrations is None:
+            migrations = []
+            for filename in sorted(os.listdir(self.directory)):
+                name, ext = os.path.splitext(filename)
+                number, _, description = name.partition('_')
+                if ext != '.sql' or not number.isdigit():
+                    continue
+                with open(os.path.join(self.directory, filename), 'r', encoding='utf-8') as file:
+                    statements = split_statements(file.read())
+                migrations.append((int(number), description.replace('_', ' '), statements))
+            versions = [version for version, _, _ in migrations]
+            if len(set(versions)) != len(versions):
+                raise ValueError(f"Duplicate migration numbers in {self.directory}")
+            self._migrations = migrations
+        return self._migrations
+
+    @property
+    def latest_version(self) -> int:
+        migrations = self.migrations()
+        return migrations[-1][0] if migrations else 0
+
+    def current_version(self, conn) -> int:
+        """Highest recorded migration, 0 when schema_version does not exist yet"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MAX(version) FROM schema_version")
+            row = cursor.fetchone()
+            return row[0] if row and row[0] else 0
+        except Exception:
+            # A failed statement aborts the Postgres transaction
+            conn.rollback()
+            return 0
+
+    def migrate(self, conn) -> List[Tuple[int, str]]:
+        """Bring the database up to the newest migration.
+
+        Runs inside the caller's `with` block, whose exit commits every
+        applied migration together or none of them. Returns the applied
+        (version, description) pairs.
+        """
+        if self.current_version(conn) >= self.latest_version:
+            return []
+
+        cursor = conn.cursor()
+        if self.backend == 'postgres':
+            cursor.execute("SELECT pg_advisory_xact_lock(?)", (PG_MIGRATION_LOCK_ID,))
+        elif not conn.in_transaction:
+            # Take the write lock first; another worker may be migrating right now
+            cursor.execute("BEGIN IMMEDIATE")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_date TEXT
+            )
+        """)
+        current = self.current_version(conn)
+        if current == 0 and self.backend == 'sqlite':
+            self.adopt_legacy_schema(cursor)
+
+        applied = []
+        for version, description, statements in self.migrations():
+            if version <= current:
+                continue
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("""
+                INSERT INTO schema_version (version, description, applied_date) VALUES (?, ?, ?)
+            """, (version, description, datetime.now().isoformat()))
+            self.logger.info(f"Applied schema migration {version}: {description}")
+            applied.append((version, description))
+        return applied
+
+    def adopt_legacy_schema(self, cursor):
+        """Bring an SQLite database created before the migration runner up to the baseline"""
+        columns = self._table_columns(cursor)
+        for table, wanted in LEGACY_COLUMNS.items():
+            if table not in columns:
+                continue
+            for column, definition in wanted:
+                if column not in columns[table]:
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                    self.logger.info(f"Added {column} column to {table}")
+                    columns[table].append(column)
+
+        if 'students' in columns and self._student_number_is_globally_unique(cursor):
+            self._rebuild_students(cursor, columns['students'])
+
+    def _table_columns(self, cursor) -> Dict[str, List[str]]:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = [row[0] for row in cursor.fetchall()]
+        columns = {}
+        for table in tables:
+            cursor.execute(f"PRAGMA table_info({table})")
+            columns[table] = [row[1] for row in cursor.fetchall()]
+        return columns
+
+    def _student_number_is_globally_unique(self, cursor) -> bool:
+        """True when students has a UNIQUE(student_number) from before schools were separated"""
+        cursor.execute("PRAGMA index_list(students)")
+        unique_indexes = [row[1] for row in cursor.fetchall() if row[2]]
+        for index in unique_indexes:
+            cursor.execute(f"PRAGMA index_info('{index}')")
+            if [row[2] for row in cursor.fetchall()] == ['student_number']:
+                return True
+        return False
+
+    def _rebuild_students(self, cursor, existing_columns: List[str]):
+        """Recreate students with student numbers unique per school"""
+        baseline = self.migrations()[0][2]
+        create = next(statement for statement in baseline if 'TABLE IF NOT EXISTS students ' in statement)
+        cursor.execute(create.replace('TABLE IF NOT EXISTS students ', 'TABLE students_new ', 1))
+        cursor.execute("PRAGMA table_info(students_new)")
+        shared = ', '.join(row[1] for row in cursor.fetchall() if row[1] in existing_columns)
+        cursor.execute(f"INSERT OR IGNORE INTO students_new ({shared}) SELECT {shared} FROM students")
+        cursor.execute("DROP TABLE students")
+        cursor.execute("ALTER TABLE students_new RENAME TO students")
+        self.logger.info("Rebuilt students table with student numbers unique per school")
+
+
+def main():
+    """Migrate the configured database and print its schema version"""
+    from school_database import SchoolDatabase
+    db = SchoolDatabase()
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version, description, applied_date FROM schema_version ORDER BY version")
+        for version, description, applied_date in cursor.fetchall():
+            print(f"{version:04d}  {applied_date}  {description}")
+    print(f"Schema version {db.get_schema_version()}")
+
+
+if __name__ == '__main__':
+    main()
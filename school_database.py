@@ -6,6 +6,7 @@ With separate tracking for Report Card items vs Internal Assessment items
 Created: 2025-08-06
 """
 
+import hashlib
 import sqlite3
 import pandas as pd
 from datetime import datetime, date
@@ -13,6 +14,12 @@ import os
 from typing import List, Dict, Optional, Tuple, Any
 import logging
 
+from connection_pool import SQLITE_BUSY_TIMEOUT_MS, get_postgres_pool, get_sqlite_pool, sqlite_profile
+import ranking_engine
+import ranking_kernel
+import results_engine
+from schema_migrations import SchemaMigrator
+
 # Optional Postgres support (psycopg2)
 try:
     import psycopg2
@@ -29,6 +36,7 @@ except ImportError:
     PERSISTENT_MANAGER = None
     logging.warning("Persistent data manager not available - using default storage")
 
+
 class SchoolDatabase:
     """Main class for managing school database operations"""
     
@@ -58,6 +66,7 @@ class SchoolDatabase:
 
         self.setup_logging()
         self.init_database()
+        self.apply_sqlite_profile()
         
         # Setup persistent storage features
         if PERSISTENT_MANAGER:
@@ -107,323 +116,11 @@ class SchoolDatabase:
                 self.init_postgres_database()
                 return
 
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Create tables if they don't exist
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS students (
-                        student_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        student_number TEXT,
-                        first_name TEXT NOT NULL,
-                        last_name TEXT NOT NULL,
-                        date_of_birth TEXT,
-                        grade_level INTEGER NOT NULL,
-                        email TEXT,
-                        phone TEXT,
-                        address TEXT,
-                        parent_guardian_name TEXT,
-                        parent_guardian_phone TEXT,
-                        parent_guardian_email TEXT,
-                        status TEXT DEFAULT 'Active',
-                        date_enrolled TEXT DEFAULT CURRENT_TIMESTAMP,
-                        school_id INTEGER NOT NULL,
-                        UNIQUE(student_number, school_id)
-                    )
-                """)
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS student_marks (
-                        mark_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        student_id INTEGER NOT NULL,
-                        subject TEXT NOT NULL,
-                        mark INTEGER NOT NULL,
-                        grade TEXT NOT NULL,
-                        term TEXT NOT NULL,
-                        academic_year TEXT NOT NULL,
-                        form_level INTEGER NOT NULL,
-                        date_entered TEXT DEFAULT CURRENT_TIMESTAMP,
-                        school_id INTEGER NOT NULL,
-                        FOREIGN KEY (student_id) REFERENCES students (student_id),
-                        UNIQUE(student_id, subject, term, academic_year, school_id)
-                    )
-                """)
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS school_settings (
-                        setting_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        school_name TEXT,
-                        school_address TEXT,
-                        school_phone TEXT,
-                        school_email TEXT,
-                        pta_fund TEXT,
-                        sdf_fund TEXT,
-                        boarding_fee TEXT,
-                        next_term_begins TEXT,
-                        boys_uniform TEXT,
-                        girls_uniform TEXT,
-                        selected_term TEXT,
-                        selected_academic_year TEXT,
-                        updated_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                        school_id INTEGER,
-                        UNIQUE(school_id)
-                    )
-                """)
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS academic_periods (
-                        period_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        academic_year TEXT NOT NULL,
-                        period_name TEXT NOT NULL,
-                        start_date TEXT,
-                        end_date TEXT,
-                        is_active INTEGER DEFAULT 0,
-                        school_id INTEGER,
-                        created_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                        UNIQUE(academic_year, period_name, school_id)
-                    )
-                """)
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS subject_teachers (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        subject TEXT NOT NULL,
-                        form_level INTEGER NOT NULL,
-                        teacher_name TEXT NOT NULL,
-                        updated_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                        school_id INTEGER,
-                        UNIQUE(subject, form_level, school_id)
-                    )
-                """)
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS school_fees (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        pta_fund TEXT,
-                        sdf_fund TEXT,
-                        boarding_fee TEXT,
-                        updated_date TEXT DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS schools (
-                        school_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        school_name TEXT NOT NULL,
-                        username TEXT UNIQUE NOT NULL,
-                        password_hash TEXT NOT NULL,
-                        status TEXT DEFAULT 'active',
-                        subscription_status TEXT DEFAULT 'trial',
-                        subscription_start_date TEXT,
-                        subscription_end_date TEXT,
-                        days_remaining INTEGER DEFAULT 90,
-                        must_change_password INTEGER DEFAULT 0,
-                        created_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                        last_login TEXT
-                    )
-                """)
-                
-                # Add school_id columns to existing tables if they don't exist
-                try:
-                    cursor.execute("ALTER TABLE students ADD COLUMN school_id INTEGER")
-                except:
-                    pass
-                
-                try:
-                    cursor.execute("ALTER TABLE student_marks ADD COLUMN school_id INTEGER")
-                except:
-                    pass
-                
-                try:
-                    cursor.execute("ALTER TABLE subject_teachers ADD COLUMN school_id INTEGER")
-                except:
-                    pass
-                
-                # Add missing columns to school_settings
-                try:
-                    cursor.execute("ALTER TABLE school_settings ADD COLUMN sdf_fund TEXT")
-                except:
-                    pass
-                
-                try:
-                    cursor.execute("ALTER TABLE school_settings ADD COLUMN boarding_fee TEXT")
-                except:
-                    pass
-                
-                # Fix UNIQUE constraint for student_number to be per school
-                try:
-                    # Check if we need to recreate the students table
-                    cursor.execute("PRAGMA table_info(students)")
-                    columns = cursor.fetchall()
-                    
-                    # Create new table with correct constraints
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS students_new (
-                            student_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            student_number TEXT,
-                            first_name TEXT NOT NULL,
-                            last_name TEXT NOT NULL,
-                            date_of_birth TEXT,
-                            grade_level INTEGER NOT NULL,
-                            email TEXT,
-                            phone TEXT,
-                            address TEXT,
-                            parent_guardian_name TEXT,
-                            parent_guardian_phone TEXT,
-                            parent_guardian_email TEXT,
-                            status TEXT DEFAULT 'Active',
-                            date_enrolled TEXT DEFAULT CURRENT_TIMESTAMP,
-                            school_id INTEGER,
-                            UNIQUE(student_number, school_id)
-                        )
-                    """)
-                    
-                    # Copy data from old table
-                    cursor.execute("""
-                        INSERT OR IGNORE INTO students_new 
-                        SELECT * FROM students
-                    """)
-                    
-                    # Drop old table and rename new one
-                    cursor.execute("DROP TABLE students")
-                    cursor.execute("ALTER TABLE students_new RENAME TO students")
-                    
-                except Exception as e:
-                    # If recreation fails, just continue - table might already be correct
-                    pass
-                
-                # Add subscription columns to existing schools table if they don't exist
-                try:
-                    cursor.execute("ALTER TABLE schools ADD COLUMN subscription_status TEXT DEFAULT 'trial'")
-                except:
-                    pass
-                
-                try:
-                    cursor.execute("ALTER TABLE schools ADD COLUMN subscription_start_date TEXT")
-                except:
-                    pass
-                
-                try:
-                    cursor.execute("ALTER TABLE schools ADD COLUMN subscription_end_date TEXT")
-                except:
-                    pass
-                
-                try:
-                    cursor.execute("ALTER TABLE schools ADD COLUMN days_remaining INTEGER DEFAULT 90")
-                except:
-                    pass
-
-                try:
-                    cursor.execute("ALTER TABLE schools ADD COLUMN must_change_password INTEGER DEFAULT 0")
-                except:
-                    pass
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS subscription_notifications (
-                        notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        school_id INTEGER,
-                        message TEXT NOT NULL,
-                        notification_type TEXT DEFAULT 'reminder',
-                        sent_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                        is_read INTEGER DEFAULT 0,
-                        FOREIGN KEY (school_id) REFERENCES schools (school_id)
-                    )
-                """)
-                
-                # Update existing schools with default subscription values
-                cursor.execute("""
-                    UPDATE schools 
-                    SET subscription_status = 'trial', days_remaining = 90 
-                    WHERE subscription_status IS NULL OR subscription_status = ''
-                """)
-                
-                # Add selected_term and selected_academic_year columns if they don't exist
-                cursor.execute("PRAGMA table_info(school_settings)")
-                columns = [row[1] for row in cursor.fetchall()]
-                
-                if 'selected_term' not in columns:
-                    try:
-                        cursor.execute("ALTER TABLE school_settings ADD COLUMN selected_term TEXT")
-                        self.logger.info("Added selected_term column to school_settings")
-                    except sqlite3.OperationalError as e:
-                        if "duplicate column name" not in str(e):
-                            self.logger.error(f"Error adding selected_term column: {e}")
-                
-                if 'selected_academic_year' not in columns:
-                    try:
-                        cursor.execute("ALTER TABLE school_settings ADD COLUMN selected_academic_year TEXT")
-                        self.logger.info("Added selected_academic_year column to school_settings")
-                    except sqlite3.OperationalError as e:
-                        if "duplicate column name" not in str(e):
-                            self.logger.error(f"Error adding selected_academic_year column: {e}")
-                
-                # Create default settings for existing schools that don't have settings
-                cursor.execute("""
-                    SELECT s.school_id, s.school_name, s.username 
-                    FROM schools s 
-                    LEFT JOIN school_settings ss ON s.school_id = ss.school_id 
-                    WHERE ss.school_id IS NULL
-                """)
-                schools_without_settings = cursor.fetchall()
-                
-                for school_id, school_name, username in schools_without_settings:
-                    # Create blank settings for existing schools - waiting for admin to edit
-                    cursor.execute("""
-                        INSERT INTO school_settings 
-                        (school_name, school_address, school_phone, school_email, pta_fund, sdf_fund, boarding_fee, next_term_begins, boys_uniform, girls_uniform, selected_term, selected_academic_year, school_id)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        '',  # Blank - admin will fill in
-                        '',
-                        '',
-                        '',
-                        '',
-                        '',
-                        '',
-                        '',
-                        '',
-                        '',
-                        '',  # selected_term - blank initially
-                        '',  # selected_academic_year - blank initially
-                        school_id
-                    ))
-                
-                # Insert default fees if none exist
-                cursor.execute("SELECT COUNT(*) FROM school_fees")
-                if cursor.fetchone()[0] == 0:
-                    cursor.execute("""
-                        INSERT INTO school_fees (pta_fund, sdf_fund, boarding_fee)
-                        VALUES (?, ?, ?)
-                    """, ("", "", "MK 150,000"))
-                
-                # Insert default subject teachers if none exist
-                cursor.execute("SELECT COUNT(*) FROM subject_teachers")
-                if cursor.fetchone()[0] == 0:
-                    subjects = ['Agriculture', 'Bible Knowledge', 'Biology', 'Chemistry', 
-                               'Chichewa', 'Computer Studies', 'English', 'Geography', 
-                               'History', 'Life Skills/SOS', 'Mathematics', 'Physics', 'Business Studies', 'Home Economics']
-
-                    # Determine whether subject_teachers.school_id allows NULL
-                    cursor.execute("PRAGMA table_info(subject_teachers)")
-                    cols = cursor.fetchall()
-                    school_id_notnull = 0
-                    for c in cols:
-                        # PRAGMA table_info returns: cid,name,type,notnull,dflt_value,pk
-                        if c[1] == 'school_id':
-                            school_id_notnull = c[3]
-                            break
-
-                    default_school_id = None if school_id_notnull == 0 else 0
-
-                    for form_level in [1, 2, 3, 4]:
-                        for subject in subjects:
-                            cursor.execute("""
-                                INSERT INTO subject_teachers (subject, form_level, teacher_name, school_id)
-                                VALUES (?, ?, ?, ?)
-                            """, (subject, form_level, f"{subject} Teacher F{form_level}", default_school_id))
-                
-                self.logger.info("Database initialized successfully")
-                
+            # Tables and indexes come from migrations/sqlite; an up-to-date
+            # database costs one query here
+            with self.get_connection() as conn:
+                SchemaMigrator('sqlite').migrate(conn)
+            self.logger.info("Database initialized successfully")
         except Exception as e:
             self.logger.error(f"Error initializing database: {e}")
             raise
@@ -434,137 +131,21 @@ class SchoolDatabase:
             if not HAVE_PSYCOPG2:
                 self.logger.error("psycopg2 not available; cannot initialize Postgres database")
                 raise ImportError("psycopg2 not available")
-            conn = psycopg2.connect(self.db_path)
-            cur = conn.cursor()
-
-            # Use Postgres-compatible table definitions
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS students (
-                student_id SERIAL PRIMARY KEY,
-                student_number TEXT,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                date_of_birth TEXT,
-                grade_level INTEGER NOT NULL,
-                email TEXT,
-                phone TEXT,
-                address TEXT,
-                parent_guardian_name TEXT,
-                parent_guardian_phone TEXT,
-                parent_guardian_email TEXT,
-                status TEXT DEFAULT 'Active',
-                date_enrolled TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                school_id INTEGER,
-                UNIQUE(student_number, school_id)
-            )
-            """)
-
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS student_marks (
-                mark_id SERIAL PRIMARY KEY,
-                student_id INTEGER NOT NULL,
-                subject TEXT NOT NULL,
-                mark INTEGER NOT NULL,
-                grade TEXT NOT NULL,
-                term TEXT NOT NULL,
-                academic_year TEXT NOT NULL,
-                form_level INTEGER NOT NULL,
-                date_entered TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                school_id INTEGER NOT NULL
-            )
-            """)
-
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS school_settings (
-                setting_id SERIAL PRIMARY KEY,
-                school_name TEXT,
-                school_address TEXT,
-                school_phone TEXT,
-                school_email TEXT,
-                pta_fund TEXT,
-                sdf_fund TEXT,
-                boarding_fee TEXT,
-                next_term_begins TEXT,
-                boys_uniform TEXT,
-                girls_uniform TEXT,
-                selected_term TEXT,
-                selected_academic_year TEXT,
-                updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                school_id INTEGER UNIQUE
-            )
-            """)
-
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS academic_periods (
-                period_id SERIAL PRIMARY KEY,
-                academic_year TEXT NOT NULL,
-                period_name TEXT NOT NULL,
-                start_date TEXT,
-                end_date TEXT,
-                is_active INTEGER DEFAULT 0,
-                school_id INTEGER,
-                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE (academic_year, period_name, school_id)
-            )
-            """)
-
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS subject_teachers (
-                id SERIAL PRIMARY KEY,
-                subject TEXT NOT NULL,
-                form_level INTEGER NOT NULL,
-                teacher_name TEXT NOT NULL,
-                updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                school_id INTEGER
-            )
-            """)
-
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS school_fees (
-                id SERIAL PRIMARY KEY,
-                pta_fund TEXT,
-                sdf_fund TEXT,
-                boarding_fee TEXT,
-                updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """)
-
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS schools (
-                school_id SERIAL PRIMARY KEY,
-                school_name TEXT NOT NULL,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                status TEXT DEFAULT 'active',
-                subscription_status TEXT DEFAULT 'trial',
-                subscription_start_date TEXT,
-                subscription_end_date TEXT,
-                days_remaining INTEGER DEFAULT 90,
-                must_change_password INTEGER DEFAULT 0,
-                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TEXT
-            )
-            """)
-
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS subscription_notifications (
-                notification_id SERIAL PRIMARY KEY,
-                school_id INTEGER,
-                message TEXT NOT NULL,
-                notification_type TEXT DEFAULT 'reminder',
-                sent_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_read INTEGER DEFAULT 0
-            )
-            """)
-
-            conn.commit()
-            cur.close()
-            conn.close()
+            with self.get_connection() as conn:
+                SchemaMigrator('postgres').migrate(conn)
             self.logger.info("Postgres database initialized successfully")
         except Exception as e:
             self.logger.error(f"Error initializing Postgres database: {e}")
             raise
 
+    def get_schema_version(self) -> int:
+        """Highest applied schema migration"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MAX(version) FROM schema_version")
+            row = cursor.fetchone()
+            return row[0] if row and row[0] else 0
+
     def create_schema(self, conn):
         """Create database schema from SQL file"""
         try:
@@ -584,74 +165,46 @@ class SchoolDatabase:
     def get_connection(self):
         """Get database connection. Uses psycopg2 for Postgres when configured, else SQLite."""
         if getattr(self, 'use_postgres', False):
-            # psycopg2 accepts a DSN-style URL in connect()
-            conn = psycopg2.connect(self.db_path)
-
-            # Wrap the cursor factory to adapt SQLite-style queries (?), to postgres (%s)
-            dbself = self
-            class CursorAdapter:
-                def __init__(self, cursor):
-                    self._cursor = cursor
-                    self._lastrowid = None
-
-                def execute(self, query, params=None):
-                    q = query.replace('?', '%s') if dbself.use_postgres else query
-                    self._cursor.execute(q, params or ())
-                    # If insert, attempt to capture lastval
-                    try:
-                        if dbself.use_postgres and q.strip().lower().startswith('insert'):
-                            # Use a separate cursor to fetch LASTVAL so we don't disturb results
-                            with conn.cursor() as c2:
-                                c2.execute('SELECT LASTVAL()')
-                                res = c2.fetchone()
-                                self._lastrowid = res[0] if res else None
-                    except Exception:
-                        self._lastrowid = None
-                    return self._cursor
-
-                def executemany(self, query, seq_of_params):
-                    q = query.replace('?', '%s') if dbself.use_postgres else query
-                    return self._cursor.executemany(q, seq_of_params)
-
-                def fetchone(self):
-                    return self._cursor.fetchone()
-
-                def fetchall(self):
-                    return self._cursor.fetchall()
-
-                def __getattr__(self, name):
-                    return getattr(self._cursor, name)
-
-                @property
-                def lastrowid(self):
-                    if dbself.use_postgres:
-                        return self._lastrowid
-                    return getattr(self._cursor, 'lastrowid', None)
-
-            # Replace cursor method to return adapter
-            def cursor_factory(*args, **kwargs):
-                return CursorAdapter(conn.cursor(*args, **kwargs))
-
-            conn.cursor = cursor_factory
-            return conn
-
-        conn = sqlite3.connect(self.db_path, timeout=30.0)
-        # Prefer DELETE journaling on Windows to avoid locking issues with temporary files
+            # Checked out of a bounded psycopg2 pool; cursors accept SQLite-style (?) queries
+            return get_postgres_pool(self.db_path).connection()
+
+        # One connection per thread, kept open and configured once
+        return get_sqlite_pool(self.db_path, self._configure_sqlite_connection).connection()
+
+    def _configure_sqlite_connection(self, conn: sqlite3.Connection):
+        """Apply the PRAGMAs of the SQLite profile once, when the pool opens a connection"""
+        conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        for name, value in sqlite_profile()['pragmas']:
+            conn.execute(f'PRAGMA {name}={value}')
+
+    def apply_sqlite_profile(self):
+        """Set the journal mode of the SQLite profile on the database file.
+
+        The journal mode is stored in the file, so this runs once at startup
+        rather than on every connection. In WAL mode the log left by the last
+        run is checkpointed and truncated.
+        """
+        if getattr(self, 'use_postgres', False):
+            return
+        journal_mode = sqlite_profile()['journal_mode']
         try:
-            conn.execute('PRAGMA journal_mode=DELETE')
-        except sqlite3.OperationalError:
-            # If the DB is briefly locked by another connection, retry once after a short delay
-            import time
-            time.sleep(0.05)
-            try:
-                conn.execute('PRAGMA journal_mode=DELETE')
-            except Exception:
-                # Give up changing the journal mode and proceed; caller will handle any locks
-                pass
-        conn.execute('PRAGMA synchronous=NORMAL')
-        conn.execute('PRAGMA cache_size=10000')
-        conn.execute('PRAGMA temp_store=memory')
-        return conn
+            with self.get_connection() as conn:
+                mode = conn.execute(f'PRAGMA journal_mode={journal_mode}').fetchone()[0]
+                if mode.upper() == 'WAL':
+                    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            if mode.upper() != journal_mode:
+                self.logger.warning(f"SQLite journal mode is {mode}, wanted {journal_mode}")
+            else:
+                self.logger.info(f"SQLite journal mode: {mode}")
+        except sqlite3.OperationalError as e:
+            # Another worker holds the database; it is setting the same mode
+            self.logger.warning(f"Could not set SQLite journal mode {journal_mode}: {e}")
+
+    def get_connection_pool_stats(self) -> Dict:
+        """Counters of the connection pool of this process"""
+        if getattr(self, 'use_postgres', False):
+            return get_postgres_pool(self.db_path).stats()
+        return get_sqlite_pool(self.db_path, self._configure_sqlite_connection).stats()
     
     def _get_next_student_serial_number(self, school_id: Optional[int]) -> str:
         """Generate the next student serial number for a specific school"""
@@ -693,6 +246,9 @@ class SchoolDatabase:
                         parent_guardian_phone, parent_guardian_email, school_id
                     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """
+                if getattr(self, 'use_postgres', False):
+                    # Return the new id with the insert instead of a LASTVAL() round trip
+                    insert_sql += " RETURNING student_id"
                 cursor.execute(self._adapt_query(insert_sql), (
                     student_serial_number,
                     student_data.get('first_name'),
@@ -708,8 +264,6 @@ class SchoolDatabase:
                     school_id
                 ))
                 if getattr(self, 'use_postgres', False):
-                    # Get the last inserted id in Postgres
-                    cursor.execute("SELECT LASTVAL()")
                     student_id = cursor.fetchone()[0]
                 else:
                     student_id = cursor.lastrowid
@@ -734,6 +288,26 @@ class SchoolDatabase:
             self.logger.error(f"Error retrieving student {student_id}: {e}")
             raise
     
+    def get_students_by_ids(self, student_ids: List[int]) -> Dict[int, Dict]:
+        """Get many student records at once as {student_id: record} (same records as get_student_by_id)"""
+        students = {}
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(student_ids), 500):
+                    chunk = student_ids[start:start + 500]
+                    placeholders = ','.join(['?' for _ in chunk])
+                    cursor.execute(f"SELECT * FROM students WHERE student_id IN ({placeholders})", tuple(chunk))
+                    columns = [description[0] for description in cursor.description]
+                    for row in cursor.fetchall():
+                        student = dict(zip(columns, row))
+                        students[student['student_id']] = student
+            return students
+        except Exception as e:
+            self.logger.error(f"Error retrieving students: {e}")
+            raise
+    
     def check_marks_exist_for_period(self, form_level: int, term: str, academic_year: str, school_id: int) -> bool:
         """Check if any marks exist for the given form, term, and academic year"""
         try:
@@ -798,6 +372,10 @@ class SchoolDatabase:
                     where_clause += " AND (school_id = ? OR school_id IS NULL)"
                     update_values.append(school_id)
                 
+                # Names appear in cached rankings and report cards
+                if {'first_name', 'last_name'} & set(update_data):
+                    self._bump_student_period_versions(cursor, student_id)
+                
                 query = f"UPDATE students SET {', '.join(update_fields)} {where_clause}"
                 cursor.execute(query, update_values)
                 
@@ -960,16 +538,12 @@ class SchoolDatabase:
                         school_id = 0
 
                     # Begin transaction (SQLite uses BEGIN IMMEDIATE; Postgres manages transactions differently)
-                    if not getattr(self, 'use_postgres', False):
+                    if not getattr(self, 'use_postgres', False) and not conn.in_transaction:
                         cursor.execute("BEGIN IMMEDIATE")
                     
                     # Insert or update mark
-                    insert_sql = """
-                        INSERT OR REPLACE INTO student_marks 
-                        (student_id, subject, mark, grade, term, academic_year, form_level, date_entered, school_id)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """
-                    cursor.execute(self._adapt_query(insert_sql), (student_id, subject, mark, grade, term, academic_year, form_level, datetime.now().isoformat(), school_id))
+                    cursor.execute(self._mark_upsert_sql(), (student_id, subject, mark, grade, term, academic_year, form_level, datetime.now().isoformat(), school_id))
+                    version = self._bump_period_version(cursor, school_id, term, academic_year)
                     
                     # Commit the transaction
                     if getattr(self, 'use_postgres', False):
@@ -978,6 +552,7 @@ class SchoolDatabase:
                         conn.commit()
                     
                     self.logger.info(f"Saved mark for student {student_id}, subject {subject}: {mark} (School: {school_id})")
+                    self._update_incremental_rankings(student_id, term, academic_year, school_id, version)
                     return  # Success, exit the retry loop
                     
             except sqlite3.OperationalError as e:
@@ -994,6 +569,79 @@ class SchoolDatabase:
                 self.logger.error(f"Error saving student mark: {e}")
                 raise
     
+    def save_student_marks(self, student_id: int, marks: Dict[str, int], term: str, academic_year: str, form_level: int, school_id: Optional[int] = None):
+        """Save several subject marks of a student in one transaction.
+
+        Same result as save_student_mark for every subject, with a single
+        period version bump; on Postgres all rows go in one multi-row INSERT.
+        """
+        if not marks:
+            return
+
+        if school_id is None:
+            student = self.get_student_by_id(student_id)
+            if student and 'school_id' in student:
+                school_id = student.get('school_id')
+        if school_id is None:
+            school_id = 0
+
+        date_entered = datetime.now().isoformat()
+        rows = [(student_id, subject, mark, self.calculate_grade(mark, form_level), term, academic_year, form_level, date_entered, school_id)
+                for subject, mark in marks.items()]
+
+        max_retries = 3
+        retry_count = 0
+
+        while retry_count < max_retries:
+            try:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    if getattr(self, 'use_postgres', False):
+                        cursor.execute_values(self._mark_upsert_sql('?'), rows)
+                    else:
+                        if not conn.in_transaction:
+                            cursor.execute("BEGIN IMMEDIATE")
+                        cursor.executemany(self._mark_upsert_sql(), rows)
+                    version = self._bump_period_version(cursor, school_id, term, academic_year)
+
+                self.logger.info(f"Saved {len(rows)} marks for student {student_id} (School: {school_id})")
+                self._update_incremental_rankings(student_id, term, academic_year, school_id, version)
+                return
+
+            except sqlite3.OperationalError as e:
+                if "database is locked" in str(e).lower() and retry_count < max_retries - 1:
+                    retry_count += 1
+                    import time
+                    time.sleep(0.1 * retry_count)  # Exponential backoff
+                    self.logger.warning(f"Database locked, retrying ({retry_count}/{max_retries})")
+                    continue
+                else:
+                    self.logger.error(f"Database locked error after {max_retries} retries: {e}")
+                    raise
+            except Exception as e:
+                self.logger.error(f"Error saving student marks: {e}")
+                raise
+
+    def _mark_upsert_sql(self, values: str = '(?, ?, ?, ?, ?, ?, ?, ?, ?)') -> str:
+        """Insert-or-update statement of a student_marks row for the selected DB backend.
+
+        `values` is the VALUES clause; pass '?' for Postgres execute_values.
+        """
+        if getattr(self, 'use_postgres', False):
+            return self._adapt_query(f"""
+                INSERT INTO student_marks
+                (student_id, subject, mark, grade, term, academic_year, form_level, date_entered, school_id)
+                VALUES {values}
+                ON CONFLICT (student_id, subject, term, academic_year, school_id)
+                DO UPDATE SET mark = excluded.mark, grade = excluded.grade, form_level = excluded.form_level,
+                              date_entered = excluded.date_entered
+            """)
+        return f"""
+            INSERT OR REPLACE INTO student_marks
+            (student_id, subject, mark, grade, term, academic_year, form_level, date_entered, school_id)
+            VALUES {values}
+        """
+
     def create_data_protection_checkpoint(self) -> bool:
         """Create a data protection checkpoint to prevent accidental wipes"""
         try:
@@ -1141,61 +789,78 @@ class SchoolDatabase:
             self.logger.error(f"Error retrieving student marks: {e}")
             raise
     
+    def get_student_marks_for_students(self, student_ids: List[int], term: str, academic_year: str,
+                                       school_id: int = None) -> Dict[int, Dict]:
+        """Get the marks of many students at once, as {student_id: get_student_marks result}"""
+        marks = {}
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(student_ids), 500):
+                    chunk = student_ids[start:start + 500]
+                    placeholders = ','.join(['?' for _ in chunk])
+                    if school_id:
+                        cursor.execute(f"""
+                            SELECT student_id, subject, mark, grade FROM student_marks
+                            WHERE term = ? AND academic_year = ? AND school_id = ? AND student_id IN ({placeholders})
+                        """, (term, academic_year, school_id, *chunk))
+                    else:
+                        cursor.execute(f"""
+                            SELECT student_id, subject, mark, grade FROM student_marks
+                            WHERE term = ? AND academic_year = ? AND student_id IN ({placeholders})
+                        """, (term, academic_year, *chunk))
+                    for student_id, subject, mark, grade in cursor.fetchall():
+                        marks.setdefault(student_id, {})[subject] = {'mark': mark, 'grade': grade}
+            return marks
+        except Exception as e:
+            self.logger.error(f"Error retrieving student marks: {e}")
+            raise
+    
+    def get_term_marks_for_students(self, student_ids: List[int], term: str, academic_year: str) -> Dict[int, Dict[str, int]]:
+        """Get the term marks of many students at once as {student_id: {subject: mark}}"""
+        marks = {}
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(student_ids), 500):
+                    chunk = student_ids[start:start + 500]
+                    placeholders = ','.join(['?' for _ in chunk])
+                    cursor.execute(f"""
+                        SELECT student_id, subject, mark FROM student_marks
+                        WHERE term = ? AND academic_year = ? AND student_id IN ({placeholders})
+                    """, (term, academic_year, *chunk))
+                    for student_id, subject, mark in cursor.fetchall():
+                        marks.setdefault(student_id, {})[subject] = mark
+            return marks
+        except Exception as e:
+            self.logger.error(f"Error retrieving term marks: {e}")
+            raise
+    
     def calculate_grade(self, mark: int, form_level: int) -> str:
         """Calculate grade based on mark and form level"""
-        if form_level in [1, 2]:  # Junior forms
-            if mark >= 80: return 'A'
-            elif mark >= 70: return 'B'
-            elif mark >= 60: return 'C'
-            elif mark >= 50: return 'D'
-            else: return 'F'
-        else:  # Senior forms (3, 4)
-            if mark >= 75: return '1'
-            elif mark >= 70: return '2'
-            elif mark >= 65: return '3'
-            elif mark >= 60: return '4'
-            elif mark >= 55: return '5'
-            elif mark >= 50: return '6'
-            elif mark >= 45: return '7'
-            elif mark >= 40: return '8'
-            else: return '9'
+        return results_engine.calculate_grade(mark, form_level)
     
     def determine_pass_fail_status(self, passed_subjects: int, english_passed: bool) -> str:
         """Determine overall pass/fail status based on school criteria"""
         # Student must pass at least 6 subjects AND English to be declared PASS
-        if passed_subjects >= 6 and english_passed:
+        if passed_subjects >= results_engine.MIN_PASSED_SUBJECTS and english_passed:
             return 'PASS'
         else:
             return 'FAIL'
     
     def is_english_passed(self, english_mark: int, form_level: int) -> bool:
         """Check if English is passed based on form level and grading system"""
-        if form_level in [1, 2]:  # Junior forms
-            # For junior forms, pass mark is 50% (grade D or better)
-            return english_mark >= 50
-        else:  # Senior forms (3, 4)
-            # For senior forms, grades 1-8 are pass (40+ marks), only grade 9 is fail
-            return english_mark >= 40
+        return english_mark >= results_engine.pass_threshold(form_level)
     
     def is_subject_passed(self, mark: int, form_level: int) -> bool:
         """Check if a subject is passed based on form level and grading system"""
-        if form_level in [1, 2]:  # Junior forms
-            # For junior forms, pass mark is 50% (grade D or better)
-            return mark >= 50
-        else:  # Senior forms (3, 4)
-            # For senior forms, grades 1-8 are pass (40+ marks), only grade 9 is fail
-            return mark >= 40
+        return mark >= results_engine.pass_threshold(form_level)
     
     def get_status_reason(self, passed_subjects: int, english_passed: bool) -> str:
         """Get explanation for pass/fail status"""
-        if passed_subjects >= 6 and english_passed:
-            return 'Passed 6 or more subjects including English'
-        elif passed_subjects >= 6 and not english_passed:
-            return 'Failed English (English is mandatory for pass)'
-        elif passed_subjects < 6 and english_passed:
-            return f'Passed only {passed_subjects} subjects (minimum 6 required)'
-        else:
-            return f'Passed only {passed_subjects} subjects and failed English'
+        return results_engine.status_reason(passed_subjects, english_passed)
     
     # REPORT GENERATION METHODS
     def generate_termly_report_card(self, student_id: int, term: str, academic_year: str = '2024-2025') -> Dict:
@@ -1260,82 +925,15 @@ class SchoolDatabase:
                 attendance_df = pd.read_sql_query(attendance_query, conn, params=(student_id, academic_year, term))
                 
                 # Calculate overall statistics
-                if not grades_df.empty:
-                    overall_average = grades_df['percentage'].mean()
-                    total_subjects = len(grades_df)
-                    # Count passed subjects based on form level
-                    if student['grade_level'] in [1, 2]:
-                        passed_subjects = len(grades_df[grades_df['percentage'] >= 50])
-                    else:
-                        passed_subjects = len(grades_df[grades_df['percentage'] >= 40])
-                    
-                    # Check if English is passed (critical requirement)
-                    english_grade = grades_df[grades_df['subject_name'] == 'English']
-                    english_passed = False
-                    english_percentage = 0
-                    
-                    if not english_grade.empty:
-                        english_percentage = english_grade.iloc[0]['percentage']
-                        english_passed = self.is_english_passed(int(english_percentage), student['grade_level'])
-                    
-                    # Determine overall pass/fail status
-                    # Student must pass at least 6 subjects AND English to be declared PASS
-                    overall_status = self.determine_pass_fail_status(passed_subjects, english_passed)
-                    
-                else:
-                    overall_average = 0
-                    total_subjects = 0
-                    passed_subjects = 0
-                    english_passed = False
-                    english_percentage = 0
-                    overall_status = 'FAIL'
-                
-
-                # Calculate overall grade with fix for Forms 1-2
-                if student['grade_level'] in [1, 2]:
-                    # CRITICAL RULE: For Forms 1&2, ANY student who has failed MUST get F average grade
-                    if overall_status == 'FAIL':
-                        overall_grade = 'F'
-                    else:
-                        # For passing students, use grade distribution logic
-                        if not grades_df.empty:
-                            grades = [self.calculate_grade(int(row['percentage']), student['grade_level']) for _, row in grades_df.iterrows()]
-                            grade_counts = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'F': 0}
-                            for grade in grades:
-                                if grade in grade_counts:
-                                    grade_counts[grade] += 1
-                            
-                            max_count = max(grade_counts.values())
-                            most_common_grades = [grade for grade, count in grade_counts.items() if count == max_count]
-                            
-                            if len(most_common_grades) == 1:
-                                overall_grade = most_common_grades[0]
-                            else:
-                                overall_grade = self.calculate_grade(int(overall_average), student['grade_level'])
-                            
-                            # Ensure passing students don't get F grade
-                            if overall_grade == 'F':
-                                passing_grades = [g for g in grades if g in ['A', 'B', 'C', 'D']]
-                                if passing_grades:
-                                    pass_grade_counts = {'A': 0, 'B': 0, 'C': 0, 'D': 0}
-                                    for grade in passing_grades:
-                                        pass_grade_counts[grade] += 1
-                                    
-                                    max_pass_count = max(pass_grade_counts.values())
-                                    most_common_pass_grades = [grade for grade, count in pass_grade_counts.items() if count == max_pass_count]
-                                    
-                                    if len(most_common_pass_grades) == 1:
-                                        overall_grade = most_common_pass_grades[0]
-                                    else:
-                                        calculated_grade = self.calculate_grade(int(overall_average), student['grade_level'])
-                                        overall_grade = calculated_grade if calculated_grade != 'F' else 'D'
-                                else:
-                                    overall_grade = 'D'  # Fallback for passed student
-                        else:
-                            overall_grade = 'F'
-                else:
-                    # For senior forms, use traditional calculation
-                    overall_grade = self.calculate_grade(int(overall_average), student['grade_level'])
+                marks = dict(zip(grades_df['subject_name'], (int(mark) for mark in grades_df['percentage'])))
+                result = results_engine.student_result(marks, student['grade_level'])
+                overall_average = result['average']
+                total_subjects = len(grades_df)
+                passed_subjects = result['passed_subjects']
+                english_passed = result['english_passed']
+                english_percentage = result['english_mark']
+                overall_status = result['status']
+                overall_grade = result['report_grade']
                 
                 return {
                     'report_type': f'{term} School Report Card',
@@ -1352,7 +950,7 @@ class SchoolDatabase:
                         'english_percentage': round(english_percentage, 1),
                         'overall_grade': overall_grade,
                         'overall_status': overall_status,
-                        'status_reason': self.get_status_reason(passed_subjects, english_passed)
+                        'status_reason': result['status_reason']
                     },
                     'generated_date': datetime.now().isoformat()
                 }
@@ -1473,8 +1071,14 @@ class SchoolDatabase:
             backup_path = f"school_reports_backup_{timestamp}.db"
         
         try:
-            import shutil
-            shutil.copy2(self.db_path, backup_path)
+            # SQLite's backup API, unlike a file copy, includes changes still in the WAL
+            # and gives a consistent copy while other workers write
+            with self.get_connection() as conn:
+                target = sqlite3.connect(backup_path)
+                try:
+                    conn.backup(target)
+                finally:
+                    target.close()
             self.logger.info(f"Database backed up to: {backup_path}")
         except Exception as e:
             self.logger.error(f"Error creating backup: {e}")
@@ -1599,91 +1203,296 @@ class SchoolDatabase:
                 'academic_periods': []
             }
     
-    def get_student_position_and_points(self, student_id: int, term: str, academic_year: str, form_level: int, school_id: int = None) -> Dict:
-        """Calculate student position in class and aggregate points with tied ranking"""
+    def get_student_position_and_points(self, student_id: int, term: str, academic_year: str, form_level: int, school_id: int = None,
+                                        rankings: Dict = None) -> Dict:
+        """Calculate student position in class and aggregate points with tied ranking
+        
+        `rankings` may pass an already loaded get_student_rankings result of the
+        class (bulk report generation) to skip the lookup.
+        """
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Get all students' data for ranking
-                result = self.get_student_rankings(form_level, term, academic_year, school_id)
-                rankings = result.get('rankings', [])
-                total_students = result.get('total_students', 0)
+            # Get all students' data for ranking
+            result = rankings if rankings is not None else self.get_student_rankings(form_level, term, academic_year, school_id)
+            rankings = result.get('rankings', [])
+            total_students = result.get('total_students', 0)
 
-                if not rankings:
-                    return {
-                        'position': 'N/A', 
-                        'aggregate_points': 0, 
-                        'total_students': total_students
-                    }
+            if not rankings:
+                return {
+                    'position': 'N/A', 
+                    'aggregate_points': 0, 
+                    'total_students': total_students
+                }
 
-                # Get student info
-                student_info = self.get_student_by_id(student_id)
-                if not student_info:
-                    return {'position': 'N/A', 'aggregate_points': 0, 'total_students': total_students}
-                
-                student_name = f"{student_info['first_name']} {student_info['last_name']}"
+            # Look the student up by id; the ranking row already holds their points
+            ranking = result.get('index', {}).get(student_id)
+            if ranking:
+                if form_level >= 3:
+                    aggregate_points = ranking['aggregate_points']
+                else:
+                    aggregate_points = ranking['best_six_total']
+                return {
+                    'position': ranking.get('position', 'N/A'),
+                    'aggregate_points': aggregate_points,
+                    'total_students': total_students
+                }
 
-                # Find the target student in rankings and get their position
-                target_position = 'N/A'
-                for ranking in rankings:
-                    if ranking['name'] == student_name:
-                        target_position = ranking.get('position', 'N/A')
-                        break
+            # Student has no marks for this form in the period
+            if not self.get_student_by_id(student_id):
+                return {'position': 'N/A', 'aggregate_points': 0, 'total_students': total_students}
+            return {
+                'position': 'N/A',
+                'aggregate_points': self._query_aggregate_points(student_id, term, academic_year, form_level, school_id),
+                'total_students': total_students
+            }
                 
-                # Calculate aggregate points
+        except Exception as e:
+            self.logger.error(f"Error calculating position and points: {e}")
+            return {'position': 0, 'aggregate_points': 0, 'total_students': 0}
+
+    def _query_aggregate_points(self, student_id: int, term: str, academic_year: str, form_level: int, school_id: int = None) -> int:
+        """Aggregate points of a student who is not part of the class ranking"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # Calculate aggregate points
+            if school_id:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM student_marks 
+                    WHERE student_id = ? AND term = ? AND academic_year = ? AND school_id = ?
+                """, (student_id, term, academic_year, school_id))
+            else:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM student_marks 
+                    WHERE student_id = ? AND term = ? AND academic_year = ?
+                """, (student_id, term, academic_year))
+            
+            subject_count = cursor.fetchone()[0]
+            
+            if subject_count <= 5:
+                aggregate_points = 54 if form_level >= 3 else 0
+            else:
                 if school_id:
                     cursor.execute("""
-                        SELECT COUNT(*) FROM student_marks 
+                        SELECT mark FROM student_marks 
                         WHERE student_id = ? AND term = ? AND academic_year = ? AND school_id = ?
+                        ORDER BY mark DESC LIMIT 6
                     """, (student_id, term, academic_year, school_id))
                 else:
                     cursor.execute("""
-                        SELECT COUNT(*) FROM student_marks 
+                        SELECT mark FROM student_marks 
                         WHERE student_id = ? AND term = ? AND academic_year = ?
+                        ORDER BY mark DESC LIMIT 6
                     """, (student_id, term, academic_year))
                 
-                subject_count = cursor.fetchone()[0]
-                
-                if subject_count <= 5:
-                    aggregate_points = 54 if form_level >= 3 else 0
+                best_marks = [row[0] for row in cursor.fetchall()]
+                if form_level >= 3:
+                    grade_points = []
+                    for mark in best_marks:
+                        grade = self.calculate_grade(mark, form_level)
+                        grade_points.append(int(grade) if grade.isdigit() else 9)
+                    aggregate_points = sum(grade_points)
                 else:
-                    if school_id:
-                        cursor.execute("""
-                            SELECT mark FROM student_marks 
-                            WHERE student_id = ? AND term = ? AND academic_year = ? AND school_id = ?
-                            ORDER BY mark DESC LIMIT 6
-                        """, (student_id, term, academic_year, school_id))
-                    else:
-                        cursor.execute("""
-                            SELECT mark FROM student_marks 
-                            WHERE student_id = ? AND term = ? AND academic_year = ?
-                            ORDER BY mark DESC LIMIT 6
-                        """, (student_id, term, academic_year))
-                    
-                    best_marks = [row[0] for row in cursor.fetchall()]
-                    if form_level >= 3:
-                        grade_points = []
-                        for mark in best_marks:
-                            grade = self.calculate_grade(mark, form_level)
-                            grade_points.append(int(grade) if grade.isdigit() else 9)
-                        aggregate_points = sum(grade_points)
-                    else:
-                        aggregate_points = sum(best_marks) if best_marks else 0
-                
-                return {
-                    'position': target_position,
-                    'aggregate_points': aggregate_points,
-                    'total_students': total_students
-                }
-                
-        except Exception as e:
-            self.logger.error(f"Error calculating position and points: {e}")
-            return {'position': 0, 'aggregate_points': 0, 'total_students': 0}
+                    aggregate_points = sum(best_marks) if best_marks else 0
+            
+            return aggregate_points
     
+    # RANKING CACHE METHODS
+    def _bump_period_version(self, cursor, school_id: Optional[int], term: str, academic_year: str):
+        """Increment the data version of a (school, term, academic year) period.
+
+        Must run inside the writing transaction so cached rankings for the
+        period are invalidated atomically with the change. Returns the new
+        version; the write lock is held, so the previous one is version - 1.
+        """
+        upsert_sql = """
+            INSERT INTO data_versions (school_id, term, academic_year, version, updated_date)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (school_id, term, academic_year)
+            DO UPDATE SET version = data_versions.version + 1, updated_date = excluded.updated_date
+        """
+        if getattr(self, 'use_postgres', False):
+            cursor.execute(self._adapt_query(upsert_sql + " RETURNING version"),
+                           (school_id or 0, term, academic_year, datetime.now().isoformat()))
+            return cursor.fetchone()[0]
+        cursor.execute(upsert_sql, (school_id or 0, term, academic_year, datetime.now().isoformat()))
+        cursor.execute(self._adapt_query("""
+            SELECT version FROM data_versions WHERE school_id = ? AND term = ? AND academic_year = ?
+        """), (school_id or 0, term, academic_year))
+        return cursor.fetchone()[0]
+
+    def _bump_student_period_versions(self, cursor, student_id: int):
+        """Bump the version of every period in which a student has marks"""
+        cursor.execute(self._adapt_query("""
+            SELECT DISTINCT school_id, term, academic_year FROM student_marks WHERE student_id = ?
+        """), (student_id,))
+        for school_id, term, academic_year in cursor.fetchall():
+            self._bump_period_version(cursor, school_id, term, academic_year)
+
+    def _bump_settings_version(self, cursor, school_id: Optional[int]):
+        """Increment the version of a school's settings and subject teachers.
+
+        Stored in data_versions as the period ('', '') of the school; cached
+        report cards are keyed on it.
+        """
+        return self._bump_period_version(cursor, school_id, '', '')
+
+    def get_report_versions(self, term: str, academic_year: str, school_id: int) -> Tuple[int, int, Optional[datetime]]:
+        """(period data version, settings version, last modified) of a school's report cards.
+
+        Last modified is the latest write to the period or the settings, or
+        the latest mark entry of the period when no versions were recorded yet.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self._adapt_query("""
+                SELECT term, version, updated_date FROM data_versions
+                WHERE school_id = ? AND ((term = ? AND academic_year = ?) OR (term = '' AND academic_year = ''))
+            """), (school_id or 0, term, academic_year))
+            rows = cursor.fetchall()
+            versions = {row[0]: row[1] for row in rows}
+            stamps = [row[2] for row in rows if row[2]]
+            if not stamps:
+                cursor.execute(self._adapt_query("""
+                    SELECT MAX(date_entered) FROM student_marks WHERE school_id = ? AND term = ? AND academic_year = ?
+                """), (school_id, term, academic_year))
+                row = cursor.fetchone()
+                stamps = [row[0]] if row and row[0] else []
+            last_modified = None
+            if stamps:
+                last_modified = max(stamp if isinstance(stamp, datetime) else datetime.fromisoformat(str(stamp))
+                                    for stamp in stamps)
+            return versions.get(term, 0), versions.get('', 0), last_modified
+
+    def get_report_fingerprint(self, student_id: int, term: str, academic_year: str, school_id: int) -> str:
+        """Hash of the database identity and the student's own rows for a period.
+
+        Version counters restart in a fresh or restored database; together
+        with them this keeps cached report cards of one dataset from being
+        served for another.
+        """
+        digest = hashlib.sha256()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT database_id FROM database_identity")
+                row = cursor.fetchone()
+                digest.update(str(row[0] if row else '').encode('utf-8'))
+            except Exception:
+                # A backup restored from before the identity existed: no identity to add
+                conn.rollback()
+            cursor.execute(self._adapt_query("""
+                SELECT student_number, first_name, last_name, grade_level, status FROM students
+                WHERE student_id = ?
+            """), (student_id,))
+            digest.update(repr(cursor.fetchone()).encode('utf-8'))
+            cursor.execute(self._adapt_query("""
+                SELECT subject, mark, grade, form_level FROM student_marks
+                WHERE student_id = ? AND term = ? AND academic_year = ? AND school_id = ?
+                ORDER BY subject
+            """), (student_id, term, academic_year, school_id))
+            digest.update(repr(cursor.fetchall()).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _get_period_version(self, term: str, academic_year: str, school_id: int = None) -> int:
+        """Current data version of a period (summed over all schools when school_id is omitted)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if school_id:
+                cursor.execute(self._adapt_query("""
+                    SELECT version FROM data_versions WHERE school_id = ? AND term = ? AND academic_year = ?
+                """), (school_id, term, academic_year))
+            else:
+                cursor.execute(self._adapt_query("""
+                    SELECT SUM(version) FROM data_versions WHERE term = ? AND academic_year = ?
+                """), (term, academic_year))
+            row = cursor.fetchone()
+            return row[0] if row and row[0] is not None else 0
+
+    def _update_incremental_rankings(self, student_id: int, term: str, academic_year: str,
+                                     school_id: int, version: int):
+        """Move one student within the cached incremental rankings after their mark was saved.
+
+        `version` is the period version written together with the mark. Only
+        rankings stored for the version just before it are updated and
+        restamped; if any other write came in between they stay stale and the
+        next read recomputes the class. Never raises: a failure only costs a
+        full recomputation.
+        """
+        if not school_id:
+            return
+        try:
+            keys = [('incremental', self.db_path, school_id, form_level, term, academic_year) for form_level in [1, 2, 3, 4]]
+            if all(ranking_engine.ranking_cache.version_of(key) != version - 1 for key in keys):
+                return
+
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT s.first_name, s.last_name, sm.subject, sm.mark, sm.form_level
+                    FROM students s
+                    JOIN student_marks sm ON s.student_id = sm.student_id
+                    WHERE sm.student_id = ? AND sm.term = ? AND sm.academic_year = ? AND sm.school_id = ?
+                """, (student_id, term, academic_year, school_id))
+                rows = cursor.fetchall()
+
+            first_name, last_name = (rows[0][0], rows[0][1]) if rows else ('', '')
+            marks = {subject: mark for _, _, subject, mark, _ in rows}
+            forms = {form_level for _, _, _, _, form_level in rows}
+            for form_level, key in zip([1, 2, 3, 4], keys):
+                # A student belongs to a class while they have a mark for its form level
+                class_marks = marks if form_level in forms else None
+                ranking_engine.ranking_cache.advance(
+                    key, version - 1, version,
+                    lambda ranking, class_marks=class_marks: ranking.update_student(student_id, first_name, last_name, class_marks))
+        except Exception as e:
+            self.logger.error(f"Error updating incremental rankings: {e}")
+
+    def get_ranking_cache_stats(self) -> Dict:
+        """Hit/miss counters of the process-wide ranking snapshot cache"""
+        return ranking_engine.ranking_cache.stats()
+
+    def _load_period_marks(self, form_level: int, term: str, academic_year: str, school_id: int = None) -> List[Tuple]:
+        """Load every mark of the students ranked in a form for one term, in a single query.
+
+        A student belongs to the class when they have at least one mark recorded
+        for this form level; all of their marks for the term are returned.
+        Rows are (student_id, first_name, last_name, subject, mark) in roster order.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if school_id:
+                cursor.execute("""
+                    SELECT s.student_id, s.first_name, s.last_name, sm.subject, sm.mark
+                    FROM students s
+                    JOIN student_marks sm ON s.student_id = sm.student_id
+                    WHERE sm.term = ? AND sm.academic_year = ? AND sm.school_id = ?
+                      AND sm.student_id IN (
+                          SELECT student_id FROM student_marks
+                          WHERE form_level = ? AND term = ? AND academic_year = ? AND school_id = ?
+                      )
+                    ORDER BY s.first_name, s.last_name, s.student_id
+                """, (term, academic_year, school_id, form_level, term, academic_year, school_id))
+            else:
+                cursor.execute("""
+                    SELECT s.student_id, s.first_name, s.last_name, sm.subject, sm.mark
+                    FROM students s
+                    JOIN student_marks sm ON s.student_id = sm.student_id
+                    WHERE sm.term = ? AND sm.academic_year = ?
+                      AND sm.student_id IN (
+                          SELECT student_id FROM student_marks
+                          WHERE form_level = ? AND term = ? AND academic_year = ?
+                      )
+                    ORDER BY s.first_name, s.last_name, s.student_id
+                """, (term, academic_year, form_level, term, academic_year))
+            return cursor.fetchall()
+
     def get_student_rankings(self, form_level: int, term: str, academic_year: str, school_id: int = None) -> Dict:
         """Get student rankings for a form level
         
+        All marks for the class are loaded with one query and ranked in memory
+        by ranking_engine. The result is cached per period data version, so
+        repeated reads of an unchanged class skip the recomputation; the
+        returned snapshot is shared and must not be modified.
+        
         Returns:
             dict: {
                 'rankings': list of student ranking dicts,
@@ -1692,214 +1501,153 @@ class SchoolDatabase:
             }
         """
         try:
+            # Read the version before the marks so a concurrent write can only make the snapshot newer
+            version = self._get_period_version(term, academic_year, school_id)
+            cache_key = ('rankings', self.db_path, school_id or None, form_level, term, academic_year)
+            snapshot = ranking_engine.ranking_cache.get(cache_key, version)
+            if snapshot is not None:
+                return snapshot
+            
+            if school_id:
+                # School classes keep an incremental ranking that mark saves update in place
+                incremental_key = ('incremental',) + cache_key[1:]
+                incremental = ranking_engine.ranking_cache.get(incremental_key, version)
+                if incremental is None:
+                    rows = self._load_period_marks(form_level, term, academic_year, school_id)
+                    incremental = ranking_engine.IncrementalClassRanking(ranking_engine.group_period_marks(rows), form_level)
+                    ranking_engine.ranking_cache.put(incremental_key, version, incremental)
+                snapshot = incremental.snapshot()
+            else:
+                rows = self._load_period_marks(form_level, term, academic_year, school_id)
+                snapshot = ranking_engine.rank_class(ranking_engine.group_period_marks(rows), form_level)
+            ranking_engine.ranking_cache.put(cache_key, version, snapshot)
+            return snapshot
+        except Exception as e:
+            self.logger.error(f"Error getting student rankings: {e}")
+            return {'rankings': [], 'total_students': 0, 'students_with_marks': 0}
+    
+    def rank_all_forms(self, school_id: int, term: str, academic_year: str) -> Dict[int, Dict]:
+        """Rank Forms 1-4 of a school for one term in a single pass (term close recomputation)
+        
+        Loads every mark of the term with one query and ranks each form with the
+        vectorized kernel. The snapshots are stored in the ranking cache, so the
+        ranking pages and report cards read them without recomputing.
+        
+        Returns:
+            dict: {form_level: same result as get_student_rankings}
+        """
+        try:
+            version = self._get_period_version(term, academic_year, school_id)
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                # Use form-level specific pass threshold
-                pass_threshold = 50 if form_level in [1, 2] else 40
-                
-                # Get ALL students who have marks for this form, term, and academic year
                 if school_id:
                     cursor.execute("""
-                        SELECT DISTINCT s.student_id, s.first_name, s.last_name 
+                        SELECT s.student_id, s.first_name, s.last_name, sm.subject, sm.mark, sm.form_level
                         FROM students s
                         JOIN student_marks sm ON s.student_id = sm.student_id
-                        WHERE sm.form_level = ? AND sm.term = ? AND sm.academic_year = ? AND sm.school_id = ?
-                        ORDER BY s.first_name, s.last_name
-                    """, (form_level, term, academic_year, school_id))
+                        WHERE sm.term = ? AND sm.academic_year = ? AND sm.school_id = ?
+                        ORDER BY s.first_name, s.last_name, s.student_id
+                    """, (term, academic_year, school_id))
                 else:
                     cursor.execute("""
-                        SELECT DISTINCT s.student_id, s.first_name, s.last_name 
+                        SELECT s.student_id, s.first_name, s.last_name, sm.subject, sm.mark, sm.form_level
                         FROM students s
                         JOIN student_marks sm ON s.student_id = sm.student_id
-                        WHERE sm.form_level = ? AND sm.term = ? AND sm.academic_year = ?
-                        ORDER BY s.first_name, s.last_name
-                    """, (form_level, term, academic_year))
-                
-                all_students = cursor.fetchall()
-                rankings = []
-                
-                # For each student, get their marks data
-                for student_id, first_name, last_name in all_students:
-                    # Get marks data for this student
-                    if school_id:
-                        cursor.execute(f"""
-                            SELECT AVG(sm.mark) as average,
-                                   COUNT(CASE WHEN sm.mark >= {pass_threshold} THEN 1 END) as subjects_passed,
-                                   COUNT(sm.mark) as total_subjects
-                            FROM student_marks sm
-                            WHERE sm.student_id = ? AND sm.term = ? AND sm.academic_year = ? AND sm.school_id = ?
-                        """, (student_id, term, academic_year, school_id))
-                    else:
-                        cursor.execute(f"""
-                            SELECT AVG(sm.mark) as average,
-                                   COUNT(CASE WHEN sm.mark >= {pass_threshold} THEN 1 END) as subjects_passed,
-                                   COUNT(sm.mark) as total_subjects
-                            FROM student_marks sm
-                            WHERE sm.student_id = ? AND sm.term = ? AND sm.academic_year = ?
-                        """, (student_id, term, academic_year))
-                    
-                    marks_data = cursor.fetchone()
-                    average = marks_data[0] if marks_data and marks_data[0] is not None else 0
-                    subjects_passed = marks_data[1] if marks_data else 0
-                    total_subjects = marks_data[2] if marks_data else 0
-                    
-                    # Check if student wrote insufficient subjects (1-5)
-                    if total_subjects <= 5:
-                        if form_level <= 2:
-                            # Forms 1&2: Give F grade
-                            rankings.append({
-                                'name': f"{first_name} {last_name}",
-                                'average': 0,
-                                'grade': 'F',
-                                'subjects_passed': 0,
-                                'status': 'FAIL',
-                                'total_subjects': total_subjects
-                            })
-                        else:
-                            # CRITICAL RULE: Forms 3&4 students with 1-5 subjects MUST get 54 aggregate points
-                            rankings.append({
-                                'name': f"{first_name} {last_name}",
-                                'average': 0,
-                                'aggregate_points': 54,
-                                'subjects_passed': 0,
-                                'status': 'FAIL',
-                                'total_subjects': total_subjects
-                            })
-                        continue
-                    
-                    # Check if English is passed (school-specific)
-                    if school_id:
-                        cursor.execute("""
-                            SELECT mark FROM student_marks 
-                            WHERE student_id = ? AND subject = 'English' AND term = ? AND academic_year = ? AND school_id = ?
-                        """, (student_id, term, academic_year, school_id))
-                    else:
-                        cursor.execute("""
-                            SELECT mark FROM student_marks 
-                            WHERE student_id = ? AND subject = 'English' AND term = ? AND academic_year = ?
-                        """, (student_id, term, academic_year))
-                    
-                    english_result = cursor.fetchone()
-                    english_mark = english_result[0] if english_result else 0
-                    english_passed = self.is_english_passed(english_mark, form_level)
-                    
-                    # Determine status
-                    status = self.determine_pass_fail_status(subjects_passed, english_passed)
-                    
-                    # Calculate aggregate points for Forms 3-4, keep grade for Forms 1-2
-                    if form_level >= 3:
-                        # Get best 6 marks for aggregate points calculation
-                        cursor.execute("""
-                            SELECT mark FROM student_marks 
-                            WHERE student_id = ? AND term = ? AND academic_year = ?
-                            ORDER BY mark DESC LIMIT 6
-                        """, (student_id, term, academic_year))
-                        best_marks = [row[0] for row in cursor.fetchall()]
-                        
-                        grade_points = []
-                        for mark in best_marks:
-                            grade = self.calculate_grade(mark, form_level)
-                            grade_points.append(int(grade) if grade.isdigit() else 9)
-                        aggregate_points = sum(grade_points)
-                        
-                        rankings.append({
-                            'name': f"{first_name} {last_name}",
-                            'average': average,
-                            'aggregate_points': aggregate_points,
-                            'subjects_passed': subjects_passed,
-                            'status': status,
-                            'total_subjects': total_subjects
-                        })
-                    else:
-                        # For Forms 1&2: CRITICAL RULE - ANY failed student gets F grade
-                        if status == 'FAIL':
-                            grade = 'F'  # Failed students MUST get F grade
-                        else:
-                            # Passed students: find appropriate grade from their marks
-                            cursor.execute("""
-                                SELECT mark FROM student_marks 
-                                WHERE student_id = ? AND term = ? AND academic_year = ?
-                                ORDER BY mark DESC
-                            """, (student_id, term, academic_year))
-                            marks = [row[0] for row in cursor.fetchall()]
-                            
-                            # Find the most common passing grade
-                            passing_grades = [self.calculate_grade(mark, form_level) for mark in marks if self.is_subject_passed(mark, form_level)]
-                            if passing_grades:
-                                grade_counts = {'A': 0, 'B': 0, 'C': 0, 'D': 0}
-                                for g in passing_grades:
-                                    if g in grade_counts:
-                                        grade_counts[g] += 1
-                                
-                                if any(grade_counts.values()):
-                                    grade = max(grade_counts, key=grade_counts.get)
-                                else:
-                                    grade = 'D'  # Fallback for passed student
-                            else:
-                                grade = 'D'  # Fallback for passed student
-                        
-                        rankings.append({
-                            'name': f"{first_name} {last_name}",
-                            'average': average,
-                            'grade': grade,
-                            'subjects_passed': subjects_passed,
-                            'status': status,
-                            'total_subjects': total_subjects
-                        })
-                
-                # Sort rankings based on form level
-                if form_level >= 3:
-                    # For Forms 3&4: Sort by status (PASS first), then aggregate points (LOWEST first)
-                    rankings.sort(key=lambda x: (
-                        x['status'] == 'FAIL',
-                        x.get('aggregate_points', 999)
-                    ))
-                    
-                    # Add tied positions for Forms 3&4
-                    position = 1
-                    for i, student in enumerate(rankings):
-                        if i > 0:
-                            prev_student = rankings[i-1]
-                            # Same position if same status and same aggregate points
-                            if (student['status'] == prev_student['status'] and 
-                                student.get('aggregate_points') == prev_student.get('aggregate_points')):
-                                student['position'] = prev_student['position']
-                            else:
-                                position = i + 1
-                                student['position'] = position
-                        else:
-                            student['position'] = position
+                        WHERE sm.term = ? AND sm.academic_year = ?
+                        ORDER BY s.first_name, s.last_name, s.student_id
+                    """, (term, academic_year))
+                rows = cursor.fetchall()
+            
+            # A student is in every form they have a mark for; all their term marks count
+            results = ranking_kernel.rank_school_rows(rows)
+            for form_level, snapshot in results.items():
+                cache_key = ('rankings', self.db_path, school_id or None, form_level, term, academic_year)
+                ranking_engine.ranking_cache.put(cache_key, version, snapshot)
+            return results
+        except Exception as e:
+            self.logger.error(f"Error ranking all forms: {e}")
+            raise
+    
+    def _get_year_version(self, academic_year: str, school_id: int = None) -> int:
+        """Sum of the data versions of every term of an academic year; any mark write in the year raises it"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if school_id:
+                cursor.execute(self._adapt_query("""
+                    SELECT SUM(version) FROM data_versions WHERE school_id = ? AND academic_year = ?
+                """), (school_id, academic_year))
+            else:
+                cursor.execute(self._adapt_query("""
+                    SELECT SUM(version) FROM data_versions WHERE academic_year = ?
+                """), (academic_year,))
+            row = cursor.fetchone()
+            return row[0] if row and row[0] is not None else 0
+
+    def get_annual_rankings(self, form_level: int, academic_year: str, school_id: int = None,
+                            term_weights: Dict[str, float] = None) -> Dict:
+        """Get end-of-year rankings for a form from the marks of Terms 1-3
+        
+        Each subject's annual mark is the weighted mean of its term marks
+        (ranking_engine.DEFAULT_TERM_WEIGHTS unless term_weights is given),
+        aggregated in one grouped query; students are then ranked with the
+        same rules and tie handling as a single term. A student is in the
+        class when they have a mark for this form level in any term of the
+        year. Cached per (school, form, year, weights) until a mark of the
+        year changes.
+        
+        Returns:
+            dict: same shape as get_student_rankings, plus 'term_weights'
+        """
+        try:
+            weights = dict(term_weights or ranking_engine.DEFAULT_TERM_WEIGHTS)
+            version = self._get_year_version(academic_year, school_id)
+            cache_key = ('annual', self.db_path, school_id or None, form_level, academic_year,
+                         tuple(sorted(weights.items())))
+            snapshot = ranking_engine.ranking_cache.get(cache_key, version)
+            if snapshot is not None:
+                return snapshot
+            
+            # Weight of each mark's term; marks of other terms weigh 0
+            weight_case = "CASE sm.term " + " ".join("WHEN ? THEN ?" for _ in weights) + " ELSE 0 END"
+            weight_params = [value for item in weights.items() for value in item]
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                if school_id:
+                    cursor.execute(f"""
+                        SELECT s.student_id, s.first_name, s.last_name, sm.subject,
+                               SUM(({weight_case}) * sm.mark), SUM({weight_case})
+                        FROM students s
+                        JOIN student_marks sm ON s.student_id = sm.student_id
+                        WHERE sm.academic_year = ? AND sm.school_id = ?
+                          AND sm.student_id IN (
+                              SELECT student_id FROM student_marks
+                              WHERE form_level = ? AND academic_year = ? AND school_id = ?
+                          )
+                        GROUP BY s.student_id, s.first_name, s.last_name, sm.subject
+                        ORDER BY s.first_name, s.last_name, s.student_id
+                    """, weight_params * 2 + [academic_year, school_id, form_level, academic_year, school_id])
                 else:
-                    # For Forms 1&2: Sort by status (PASS first), then average marks (highest first)
-                    rankings.sort(key=lambda x: (x['status'] == 'FAIL', -x['average']))
-                    
-                    # Add tied positions for Forms 1&2
-                    position = 1
-                    for i, student in enumerate(rankings):
-                        if i > 0:
-                            prev_student = rankings[i-1]
-                            # Same position if same status and same average (rounded to 1 decimal)
-                            if (student['status'] == prev_student['status'] and 
-                                round(student['average'], 1) == round(prev_student['average'], 1)):
-                                student['position'] = prev_student['position']
-                            else:
-                                position = i + 1
-                                student['position'] = position
-                        else:
-                            student['position'] = position
-                
-                # Count students who sat for at least one exam
-                students_with_marks = len(rankings)  # All students in rankings have marks
-                
-                # Return both rankings and counts
-                return {
-                    'rankings': rankings,
-                    'total_students': len(rankings),  # Total students who have marks (actual class size)
-                    'students_with_marks': students_with_marks  # Students who sat for at least one exam
-                }
-                
+                    cursor.execute(f"""
+                        SELECT s.student_id, s.first_name, s.last_name, sm.subject,
+                               SUM(({weight_case}) * sm.mark), SUM({weight_case})
+                        FROM students s
+                        JOIN student_marks sm ON s.student_id = sm.student_id
+                        WHERE sm.academic_year = ?
+                          AND sm.student_id IN (
+                              SELECT student_id FROM student_marks
+                              WHERE form_level = ? AND academic_year = ?
+                          )
+                        GROUP BY s.student_id, s.first_name, s.last_name, sm.subject
+                        ORDER BY s.first_name, s.last_name, s.student_id
+                    """, weight_params * 2 + [academic_year, form_level, academic_year])
+                rows = cursor.fetchall()
+            
+            snapshot = ranking_engine.rank_class(ranking_engine.group_annual_marks(rows), form_level)
+            snapshot['term_weights'] = weights
+            ranking_engine.ranking_cache.put(cache_key, version, snapshot)
+            return snapshot
         except Exception as e:
-            self.logger.error(f"Error getting student rankings: {e}")
+            self.logger.error(f"Error getting annual rankings: {e}")
             return {'rankings': [], 'total_students': 0, 'students_with_marks': 0}
     
     def get_top_performers(self, form_level: int, term: str, academic_year: str, limit: int = 10, school_id: int = None) -> List[Dict]:
@@ -1948,64 +1696,32 @@ class SchoolDatabase:
             return []
     
     def get_subject_analysis(self, form_level: int, term: str, academic_year: str, school_id: int = None) -> Dict:
-        """Get subject performance analysis"""
+        """Get subject performance analysis (averages, pass rates, grade distributions, spread)"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
+                # One scan: how many students got each mark in each subject
                 if school_id:
                     cursor.execute("""
-                        SELECT sm.subject, AVG(sm.mark) as avg_mark, COUNT(*) as student_count,
-                               MIN(sm.mark) as min_mark, MAX(sm.mark) as max_mark
+                        SELECT sm.subject, sm.mark, COUNT(*) as mark_count
                         FROM student_marks sm
                         JOIN students s ON sm.student_id = s.student_id
                         WHERE s.grade_level = ? AND sm.term = ? AND sm.academic_year = ? AND s.school_id = ?
-                        GROUP BY sm.subject
-                        ORDER BY avg_mark DESC
+                        GROUP BY sm.subject, sm.mark
+                        ORDER BY sm.subject, sm.mark
                     """, (form_level, term, academic_year, school_id))
                 else:
                     cursor.execute("""
-                        SELECT sm.subject, AVG(sm.mark) as avg_mark, COUNT(*) as student_count,
-                               MIN(sm.mark) as min_mark, MAX(sm.mark) as max_mark
+                        SELECT sm.subject, sm.mark, COUNT(*) as mark_count
                         FROM student_marks sm
                         JOIN students s ON sm.student_id = s.student_id
                         WHERE s.grade_level = ? AND sm.term = ? AND sm.academic_year = ?
-                        GROUP BY sm.subject
-                        ORDER BY avg_mark DESC
+                        GROUP BY sm.subject, sm.mark
+                        ORDER BY sm.subject, sm.mark
                     """, (form_level, term, academic_year))
                 
-                subjects = []
-                for row in cursor.fetchall():
-                    subject, avg_mark, student_count, min_mark, max_mark = row
-                    
-                    # Calculate pass rate
-                    pass_threshold = 50 if form_level <= 2 else 40
-                    if school_id:
-                        cursor.execute("""
-                            SELECT COUNT(*) FROM student_marks sm
-                            JOIN students s ON sm.student_id = s.student_id
-                            WHERE sm.subject = ? AND s.grade_level = ? AND sm.term = ? AND sm.academic_year = ? 
-                            AND sm.mark >= ? AND s.school_id = ?
-                        """, (subject, form_level, term, academic_year, pass_threshold, school_id))
-                    else:
-                        cursor.execute("""
-                            SELECT COUNT(*) FROM student_marks sm
-                            JOIN students s ON sm.student_id = s.student_id
-                            WHERE sm.subject = ? AND s.grade_level = ? AND sm.term = ? AND sm.academic_year = ? 
-                            AND sm.mark >= ?
-                        """, (subject, form_level, term, academic_year, pass_threshold))
-                    
-                    passed_count = cursor.fetchone()[0]
-                    pass_rate = (passed_count / student_count * 100) if student_count > 0 else 0
-                    
-                    subjects.append({
-                        'subject': subject,
-                        'average': round(avg_mark, 1),
-                        'student_count': student_count,
-                        'min_mark': min_mark,
-                        'max_mark': max_mark,
-                        'pass_rate': round(pass_rate, 1)
-                    })
+                subjects = ranking_engine.summarize_subject_marks(cursor.fetchall(), form_level)
                 
                 return {
                     'subjects': subjects,
@@ -2015,174 +1731,62 @@ class SchoolDatabase:
             self.logger.error(f"Error getting subject analysis: {e}")
             return {'subjects': [], 'total_subjects': 0}
     
-    def get_top_performers_by_category(self, category: str, form_level: int, term: str, academic_year: str, school_id: int = None) -> List[Dict]:
+    def _get_results_matrix(self, form_level: int, term: str, academic_year: str, school_id: int = None) -> List[Dict]:
+        """Class results matrix (every student's marks plus totals) for a period, built once per data version.
+
+        The matrix is shared through the ranking cache and must not be modified.
+        """
+        version = self._get_period_version(term, academic_year, school_id)
+        cache_key = ('results_matrix', self.db_path, school_id or None, form_level, term, academic_year)
+        matrix = ranking_engine.ranking_cache.get(cache_key, version)
+        if matrix is not None:
+            return matrix
 
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if school_id:
+                cursor.execute("""
+                    SELECT s.student_id, s.first_name, s.last_name, sm.subject, sm.mark, sm.school_id
+                    FROM students s
+                    JOIN student_marks sm ON s.student_id = sm.student_id
+                    WHERE s.grade_level = ? AND sm.term = ? AND sm.academic_year = ? AND s.school_id = ?
+                    ORDER BY s.student_id
+                """, (form_level, term, academic_year, school_id))
+            else:
+                cursor.execute("""
+                    SELECT s.student_id, s.first_name, s.last_name, sm.subject, sm.mark, sm.school_id
+                    FROM students s
+                    JOIN student_marks sm ON s.student_id = sm.student_id
+                    WHERE s.grade_level = ? AND sm.term = ? AND sm.academic_year = ?
+                    ORDER BY s.student_id
+                """, (form_level, term, academic_year))
+            matrix = ranking_engine.build_results_matrix(cursor.fetchall())
+
+        ranking_engine.ranking_cache.put(cache_key, version, matrix)
+        return matrix
+
+    def get_top_performers_by_category(self, category: str, form_level: int, term: str, academic_year: str, school_id: int = None) -> List[Dict]:
+        """Get the top 10 students overall or in a department (sciences, humanities, languages)"""
         try:
-            if category == 'overall':
-                # For overall, get students with best performance
-                with self.get_connection() as conn:
-                    cursor = conn.cursor()
-                    if form_level >= 3:
-                        # For Forms 3&4: Sort by lowest aggregate points (best performance)
-                        if school_id:
-                            cursor.execute("""
-                                SELECT s.student_id, s.first_name, s.last_name, AVG(sm.mark) as average
-                                FROM students s
-                                JOIN student_marks sm ON s.student_id = sm.student_id
-                                WHERE s.grade_level = ? AND sm.term = ? AND sm.academic_year = ? AND s.school_id = ?
-                                GROUP BY s.student_id
-                                HAVING COUNT(sm.mark_id) >= 6
-                            """, (form_level, term, academic_year, school_id))
-                        else:
-                            cursor.execute("""
-                                SELECT s.student_id, s.first_name, s.last_name, AVG(sm.mark) as average
-                                FROM students s
-                                JOIN student_marks sm ON s.student_id = sm.student_id
-                                WHERE s.grade_level = ? AND sm.term = ? AND sm.academic_year = ?
-                                GROUP BY s.student_id
-                                HAVING COUNT(sm.mark_id) >= 6
-                            """, (form_level, term, academic_year))
-                        
-                        performers = []
-                        for row in cursor.fetchall():
-                            student_id, first_name, last_name, average = row
-                            aggregate_points = self.calculate_aggregate_points_for_student(student_id, term, academic_year, form_level)
-                            
-                            performers.append({
-                                'name': f"{first_name} {last_name}",
-                                'average': round(average, 1),
-                                'aggregate_points': aggregate_points,
-                                'excellence_area': 'Overall Performance'
-                            })
-                        
-                        # Sort by lowest aggregate points (best performance) - CRITICAL RULE for Forms 3&4
-                        performers.sort(key=lambda x: x.get('aggregate_points', 999))
-                        return performers[:10]
-                    else:
-                        # For Forms 1&2: Sort by highest average
-                        if school_id:
-                            cursor.execute("""
-                                SELECT s.student_id, s.first_name, s.last_name, AVG(sm.mark) as average
-                                FROM students s
-                                JOIN student_marks sm ON s.student_id = sm.student_id
-                                WHERE s.grade_level = ? AND sm.term = ? AND sm.academic_year = ? AND s.school_id = ?
-                                GROUP BY s.student_id
-                                HAVING COUNT(sm.mark_id) >= 6
-                                ORDER BY average DESC
-                                LIMIT 10
-                            """, (form_level, term, academic_year, school_id))
-                        else:
-                            cursor.execute("""
-                                SELECT s.student_id, s.first_name, s.last_name, AVG(sm.mark) as average
-                                FROM students s
-                                JOIN student_marks sm ON s.student_id = sm.student_id
-                                WHERE s.grade_level = ? AND sm.term = ? AND sm.academic_year = ?
-                                GROUP BY s.student_id
-                                HAVING COUNT(sm.mark_id) >= 6
-                                ORDER BY average DESC
-                                LIMIT 10
-                            """, (form_level, term, academic_year))
-                        
-                        performers = []
-                        for row in cursor.fetchall():
-                            student_id, first_name, last_name, average = row
-                            grade = self.calculate_grade(int(average), form_level)
-                            
-                            performers.append({
-                                'name': f"{first_name} {last_name}",
-                                'average': round(average, 1),
-                                'grade': grade,
-                                'excellence_area': 'Overall Performance'
-                            })
-                        
-                        return performers
-            
-            # Define subject groups for department-based performance (user-specified groups)
-            subject_groups = {
-                # Sciences include the full science list including Business Studies and Home Economics
-                'sciences': ['Agriculture', 'Biology', 'Chemistry', 'Physics', 'Mathematics', 'Business Studies', 'Home Economics'],
-                'humanities': ['Bible Knowledge', 'Geography', 'History', 'Life Skills/SOS'],
-                # Languages are Chichewa and English; ranking based on total marks across both
-                'languages': ['English', 'Chichewa']
-            }
-            
-            if category not in subject_groups:
+            if category != 'overall' and category not in ranking_engine.SUBJECT_GROUPS:
                 return []
-            
-            subjects = subject_groups[category]
-            placeholders = ','.join(['?' for _ in subjects])
-            
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                # For department-based performance we calculate the TOTAL marks across the group's subjects
-                # and also provide the department average (total / number of subjects taken) so the frontend
-                # can display both a total and an average percentage.
-                if school_id:
-                    cursor.execute(f"""
-                        SELECT s.student_id, s.first_name, s.last_name, 
-                               SUM(sm.mark) as department_total,
-                               COUNT(DISTINCT sm.subject) as subjects_taken
-                        FROM students s
-                        JOIN student_marks sm ON s.student_id = sm.student_id
-                        WHERE s.grade_level = ? AND sm.term = ? AND sm.academic_year = ? AND s.school_id = ?
-                        AND sm.subject IN ({placeholders})
-                        GROUP BY s.student_id
-                        HAVING subjects_taken >= 1
-                        ORDER BY department_total DESC
-                        LIMIT 10
-                    """, (form_level, term, academic_year, school_id, *subjects))
-                else:
-                    cursor.execute(f"""
-                        SELECT s.student_id, s.first_name, s.last_name, 
-                               SUM(sm.mark) as department_total,
-                               COUNT(DISTINCT sm.subject) as subjects_taken
-                        FROM students s
-                        JOIN student_marks sm ON s.student_id = sm.student_id
-                        WHERE s.grade_level = ? AND sm.term = ? AND sm.academic_year = ?
-                        AND sm.subject IN ({placeholders})
-                        GROUP BY s.student_id
-                        HAVING subjects_taken >= 1
-                        ORDER BY department_total DESC
-                        LIMIT 10
-                    """, (form_level, term, academic_year, *subjects))
-                
-                performers = []
-                for row in cursor.fetchall():
-                    student_id, first_name, last_name, department_total, subjects_taken = row
-                    
-                    # Compute department average (percentage) for coloring and display
-                    department_avg = (department_total / subjects_taken) if subjects_taken > 0 else 0
-                    
-                    # Get student's overall average across all subjects
-                    if school_id:
-                        cursor.execute("""
-                            SELECT AVG(mark) FROM student_marks 
-                            WHERE student_id = ? AND term = ? AND academic_year = ? AND school_id = ?
-                        """, (student_id, term, academic_year, school_id))
-                    else:
-                        cursor.execute("""
-                            SELECT AVG(mark) FROM student_marks 
-                            WHERE student_id = ? AND term = ? AND academic_year = ?
-                        """, (student_id, term, academic_year))
-                    overall_avg_result = cursor.fetchone()
-                    overall_average = overall_avg_result[0] if overall_avg_result and overall_avg_result[0] else 0
-                    
-                    performers.append({
-                        'name': f"{first_name} {last_name}",
-                        'average': round(overall_average, 1),  # Overall average in %
-                        'department_total': int(department_total),
-                        'department_average': round(department_avg, 1),
-                        'subjects_taken': int(subjects_taken),
-                        'excellence_area': f"{category.title()} Department"
-                    })
-                
-                # Sort by department total (highest first)
-                performers.sort(key=lambda x: x['department_total'], reverse=True)
-                return performers
-                
+            matrix = self._get_results_matrix(form_level, term, academic_year, school_id)
+            return ranking_engine.top_performers_from_matrix(matrix, category, form_level, school_id)
         except Exception as e:
             self.logger.error(f"Error getting top performers: {e}")
             return []
+
+    def get_top_performers_all_categories(self, form_level: int, term: str, academic_year: str, school_id: int = None) -> Dict[str, List[Dict]]:
+        """Get the overall, sciences, humanities and languages leaderboards from one results matrix"""
+        try:
+            matrix = self._get_results_matrix(form_level, term, academic_year, school_id)
+            return {
+                category: ranking_engine.top_performers_from_matrix(matrix, category, form_level, school_id)
+                for category in ranking_engine.TOP_PERFORMER_CATEGORIES
+            }
+        except Exception as e:
+            self.logger.error(f"Error getting top performers: {e}")
+            return {category: [] for category in ranking_engine.TOP_PERFORMER_CATEGORIES}
     
     def calculate_aggregate_points_for_student(self, student_id: int, term: str, academic_year: str, form_level: int) -> int:
         """Calculate aggregate points for Forms 3&4 (sum of best 6 subjects converted to MSCE grade points)"""
@@ -2242,6 +1846,7 @@ class SchoolDatabase:
                     INSERT OR REPLACE INTO subject_teachers (subject, form_level, teacher_name, updated_date, school_id)
                     VALUES (?, ?, ?, ?, ?)
                 """, (subject, form_level, teacher_name, datetime.now().isoformat(), school_id))
+                self._bump_settings_version(cursor, school_id)
                 self.logger.info(f"Updated teacher for {subject} Form {form_level}: {teacher_name}")
         except Exception as e:
             self.logger.error(f"Error updating subject teacher: {e}")
@@ -2256,11 +1861,80 @@ class SchoolDatabase:
                     cursor.execute("DELETE FROM subject_teachers WHERE subject = ? AND form_level = ? AND school_id = ?", (subject, form_level, school_id))
                 else:
                     cursor.execute("DELETE FROM subject_teachers WHERE subject = ? AND form_level = ?", (subject, form_level))
-                return cursor.rowcount > 0
+                deleted = cursor.rowcount > 0
+                if deleted:
+                    self._bump_settings_version(cursor, school_id)
+                return deleted
         except Exception as e:
             self.logger.error(f"Error deleting subject teacher: {e}")
             raise
     
+    def _supports_window_functions(self) -> bool:
+        """RANK() OVER is available on Postgres and SQLite 3.25+"""
+        return getattr(self, 'use_postgres', False) or sqlite3.sqlite_version_info >= (3, 25, 0)
+
+    def _get_subject_position_index(self, form_level: int, term: str, academic_year: str, school_id: int = None) -> Dict:
+        """Rank every (subject, student) of a class in one pass.
+
+        Returns a cached snapshot {'positions': {student_id: {subject: "pos/total"}},
+        'totals': {subject: students_with_marks}} that must not be modified.
+        """
+        version = self._get_period_version(term, academic_year, school_id)
+        cache_key = ('subject_positions', self.db_path, school_id or None, form_level, term, academic_year)
+        snapshot = ranking_engine.ranking_cache.get(cache_key, version)
+        if snapshot is not None:
+            return snapshot
+
+        params = [form_level, term, academic_year]
+        school_filter = ""
+        if school_id:
+            school_filter = "AND sm.school_id = ?"
+            params.append(school_id)
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if self._supports_window_functions():
+                cursor.execute(self._adapt_query(f"""
+                    SELECT sm.student_id, sm.subject,
+                           RANK() OVER (PARTITION BY sm.subject ORDER BY sm.mark DESC) AS position,
+                           COUNT(*) OVER (PARTITION BY sm.subject) AS total
+                    FROM student_marks sm
+                    JOIN students s ON s.student_id = sm.student_id
+                    WHERE sm.form_level = ? AND sm.term = ? AND sm.academic_year = ? {school_filter}
+                """), params)
+                positions = {}
+                totals = {}
+                for student_id, subject, position, total in cursor.fetchall():
+                    positions.setdefault(student_id, {})[subject] = position
+                    totals[subject] = total
+            else:
+                cursor.execute(self._adapt_query(f"""
+                    SELECT sm.student_id, sm.subject, sm.mark
+                    FROM student_marks sm
+                    JOIN students s ON s.student_id = sm.student_id
+                    WHERE sm.form_level = ? AND sm.term = ? AND sm.academic_year = ? {school_filter}
+                """), params)
+                positions, totals = ranking_engine.rank_subject_marks(cursor.fetchall())
+
+        snapshot = {
+            'positions': ranking_engine.format_subject_positions(positions, totals),
+            'totals': totals
+        }
+        ranking_engine.ranking_cache.put(cache_key, version, snapshot)
+        return snapshot
+
+    def get_subject_positions(self, form_level: int, term: str, academic_year: str, school_id: int = None) -> Dict[int, Dict[str, str]]:
+        """Get every student's position in every subject of a class with tied ranking
+        
+        Returns:
+            dict: {student_id: {subject: "position/total"}}; read-only, shared with other callers
+        """
+        try:
+            return self._get_subject_position_index(form_level, term, academic_year, school_id)['positions']
+        except Exception as e:
+            self.logger.error(f"Error getting subject positions: {e}")
+            return {}
+
     def get_subject_position(self, student_id: int, subject: str, term: str, academic_year: str, form_level: int, school_id: int = None) -> str:
         """Get student position in a specific subject with tied ranking (format: position/total)
         
@@ -2268,59 +1942,12 @@ class SchoolDatabase:
             str: Position in format "position/total" where total is the number of students who have marks for this subject
         """
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Get students who sat for this subject
-                if school_id:
-                    cursor.execute("""
-                        SELECT DISTINCT s.student_id, s.first_name, s.last_name, sm.mark
-                        FROM students s
-                        JOIN student_marks sm ON s.student_id = sm.student_id
-                        WHERE sm.form_level = ? 
-                          AND sm.subject = ? 
-                          AND sm.term = ? 
-                          AND sm.academic_year = ?
-                          AND sm.school_id = ?
-                        ORDER BY sm.mark DESC, s.first_name, s.last_name
-                    """, (form_level, subject, term, academic_year, school_id))
-                else:
-                    cursor.execute("""
-                        SELECT DISTINCT s.student_id, s.first_name, s.last_name, sm.mark
-                        FROM students s
-                        JOIN student_marks sm ON s.student_id = sm.student_id
-                        WHERE sm.form_level = ? 
-                          AND sm.subject = ? 
-                          AND sm.term = ? 
-                          AND sm.academic_year = ?
-                        ORDER BY sm.mark DESC, s.first_name, s.last_name
-                    """, (form_level, subject, term, academic_year))
-                
-                results = cursor.fetchall()
-                
-                if not results:
-                    return "0/0"
-                
-                total_students = len(results)
-                
-                # Calculate positions with tie handling
-                current_rank = 1
-                prev_mark = None
-                
-                for i, (sid, first_name, last_name, mark) in enumerate(results):
-                    # If this mark is different from previous, update current_rank
-                    if i > 0 and mark != prev_mark:
-                        current_rank = i + 1
-                    
-                    # If this is our target student, return their position
-                    if sid == student_id:
-                        return f"{current_rank}/{total_students}"
-                    
-                    prev_mark = mark
-                
-                # If we get here, the student didn't sit for this subject
-                return f"0/{total_students}"
-                
+            index = self._get_subject_position_index(form_level, term, academic_year, school_id)
+            position = index['positions'].get(student_id, {}).get(subject)
+            if position:
+                return position
+            # The student didn't sit for this subject
+            return f"0/{index['totals'].get(subject, 0)}"
         except Exception as e:
             self.logger.error(f"Error getting subject position: {e}")
             return "0/0"
@@ -2387,6 +2014,7 @@ class SchoolDatabase:
                     datetime.now().isoformat(),
                     school_id
                 ))
+                self._bump_settings_version(cursor, school_id)
                 
                 self.logger.info("School settings updated successfully")
         except Exception as e:
@@ -2399,64 +2027,13 @@ class SchoolDatabase:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Check which columns exist in academic_periods table
-                cursor.execute("PRAGMA table_info(academic_periods)")
-                columns = [row[1] for row in cursor.fetchall()]
-                
-                # Add created_date column if it doesn't exist
-                if 'created_date' not in columns:
-                    try:
-                        cursor.execute("ALTER TABLE academic_periods ADD COLUMN created_date TEXT DEFAULT CURRENT_TIMESTAMP")
-                        self.logger.info("Added created_date column to academic_periods table")
-                        columns.append('created_date')  # Update our list
-                    except sqlite3.OperationalError as e:
-                        if "duplicate column name" not in str(e):
-                            self.logger.error(f"Error adding created_date column: {e}")
-                
-                # Add school_id column if it doesn't exist
-                if 'school_id' not in columns:
-                    try:
-                        cursor.execute("ALTER TABLE academic_periods ADD COLUMN school_id INTEGER")
-                        self.logger.info("Added school_id column to academic_periods table")
-                        columns.append('school_id')  # Update our list
-                    except sqlite3.OperationalError as e:
-                        if "duplicate column name" not in str(e):
-                            self.logger.error(f"Error adding school_id column: {e}")
-                
-                # Build insert statement based on available columns
-                has_school_id = 'school_id' in columns
-                has_created_date = 'created_date' in columns
-                
                 for academic_year in academic_years:
                     for term in terms:
-                        if has_school_id and has_created_date:
-                            # Both columns exist
-                            cursor.execute("""
-                                INSERT OR IGNORE INTO academic_periods 
-                                (academic_year, period_name, school_id, created_date)
-                                VALUES (?, ?, ?, ?)
-                            """, (academic_year.strip(), term.strip(), school_id, datetime.now().isoformat()))
-                        elif has_school_id:
-                            # Only school_id exists
-                            cursor.execute("""
-                                INSERT OR IGNORE INTO academic_periods 
-                                (academic_year, period_name, school_id)
-                                VALUES (?, ?, ?)
-                            """, (academic_year.strip(), term.strip(), school_id))
-                        elif has_created_date:
-                            # Only created_date exists
-                            cursor.execute("""
-                                INSERT OR IGNORE INTO academic_periods 
-                                (academic_year, period_name, created_date)
-                                VALUES (?, ?, ?)
-                            """, (academic_year.strip(), term.strip(), datetime.now().isoformat()))
-                        else:
-                            # Neither column exists (old schema)
-                            cursor.execute("""
-                                INSERT OR IGNORE INTO academic_periods 
-                                (academic_year, period_name)
-                                VALUES (?, ?)
-                            """, (academic_year.strip(), term.strip()))
+                        cursor.execute("""
+                            INSERT OR IGNORE INTO academic_periods 
+                            (academic_year, period_name, school_id, created_date)
+                            VALUES (?, ?, ?, ?)
+                        """, (academic_year.strip(), term.strip(), school_id, datetime.now().isoformat()))
                 
                 self.logger.info(f"Updated academic periods")
         except Exception as e:
@@ -2579,6 +2156,7 @@ class SchoolDatabase:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                self._bump_student_period_versions(cursor, student_id)
                 if school_id:
                     cursor.execute("DELETE FROM student_marks WHERE student_id = ? AND (school_id = ? OR school_id IS NULL)", (student_id, school_id))
                 else:
@@ -2593,6 +2171,7 @@ class SchoolDatabase:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                self._bump_student_period_versions(cursor, student_id)
                 if school_id:
                     cursor.execute("DELETE FROM students WHERE student_id = ? AND (school_id = ? OR school_id IS NULL)", (student_id, school_id))
                 else:
@@ -2613,6 +2192,8 @@ class SchoolDatabase:
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                # Names appear in cached rankings
+                self._bump_student_period_versions(cursor, student_id)
                 if school_id:
                     cursor.execute("""
                         UPDATE students 
@@ -2685,23 +2266,13 @@ class SchoolDatabase:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Check if subscription columns exist, if not add them
-                cursor.execute("PRAGMA table_info(schools)")
-                columns = [row[1] for row in cursor.fetchall()]
-                
                 # Newly created schools receive a temporary OTP password which they must change on first login
-                if 'subscription_status' in columns:
-                    cursor.execute("""
-                        INSERT INTO schools (school_name, username, password_hash, subscription_status, 
-                                           subscription_start_date, subscription_end_date, days_remaining, must_change_password)
-                        VALUES (?, ?, ?, 'trial', ?, ?, 90, 1)
-                    """, (school_data['school_name'], school_data['username'], password_hash, 
-                          start_date.isoformat(), end_date.isoformat()))
-                else:
-                    cursor.execute("""
-                        INSERT INTO schools (school_name, username, password_hash, must_change_password)
-                        VALUES (?, ?, ?, 1)
-                    """, (school_data['school_name'], school_data['username'], password_hash))
+                cursor.execute("""
+                    INSERT INTO schools (school_name, username, password_hash, subscription_status, 
+                                       subscription_start_date, subscription_end_date, days_remaining, must_change_password)
+                    VALUES (?, ?, ?, 'trial', ?, ?, 90, 1)
+                """, (school_data['school_name'], school_data['username'], password_hash, 
+                      start_date.isoformat(), end_date.isoformat()))
                 
                 school_id = cursor.lastrowid
                 self.logger.info(f"Added school: {school_data['school_name']} (ID: {school_id})")
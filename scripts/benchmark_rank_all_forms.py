@@ -0,0 +1,112 @@
+"""
+Benchmark the vectorized term-close ranking against the per-form Python path.
+Builds synthetic schools (default 2,000 students spread over Forms 1-4) in a
+temporary database and times:
+  - get_student_rankings for Forms 1-4 (ranking_engine, cache cleared)
+  - rank_all_forms (one query + ranking_kernel)
+  - the in-memory ranking step alone (rank_class vs rank_class_vectorized)
+Run with: python -m scripts.benchmark_rank_all_forms [--students 2000] [--schools 1] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import ranking_engine
+import ranking_kernel
+from school_database import SchoolDatabase
+
+SUBJECTS = [
+    'Agriculture', 'Biology', 'Bible Knowledge', 'Chemistry', 'Chichewa', 'Computer Studies', 'English',
+    'Geography', 'History', 'Life Skills/SOS', 'Mathematics', 'Physics'
+]
+TERM = 'Term 1'
+YEAR = '2025-2026'
+
+
+def build_school(db: SchoolDatabase, school_id: int, students: int, rng: random.Random):
+    """Insert a synthetic school: students split evenly over Forms 1-4, 4-12 subjects each"""
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        for i in range(students):
+            form_level = i % 4 + 1
+            cursor.execute(
+                "INSERT INTO students (first_name, last_name, grade_level, school_id) VALUES (?, ?, ?, ?)",
+                (f"Student{i:05d}", f"School{school_id}", form_level, school_id))
+            student_id = cursor.lastrowid
+            ability = rng.randint(25, 85)
+            subjects = rng.sample(SUBJECTS, rng.choice([4, 6, 7, 8, 9, 10, 12]))
+            cursor.executemany(
+                "INSERT INTO student_marks (student_id, subject, mark, grade, term, academic_year, form_level, school_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(student_id, subject, mark, db.calculate_grade(mark, form_level), TERM, YEAR, form_level, school_id)
+                 for subject in subjects
+                 for mark in [max(0, min(100, int(rng.gauss(ability, 12))))]])
+
+
+def best_of(repeat: int, func):
+    """Fastest of `repeat` runs, in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=2000, help='students per school')
+    parser.add_argument('--schools', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='rank_bench_')
+    try:
+        db = SchoolDatabase(os.path.join(workdir, 'bench.db'))
+        rng = random.Random(args.seed)
+        for school_id in range(1, args.schools + 1):
+            build_school(db, school_id, args.students, rng)
+        schools = list(range(1, args.schools + 1))
+
+        def current_path():
+            ranking_engine.ranking_cache.clear()
+            for school_id in schools:
+                for form_level in [1, 2, 3, 4]:
+                    db.get_student_rankings(form_level, TERM, YEAR, school_id)
+
+        def vectorized_path():
+            ranking_engine.ranking_cache.clear()
+            for school_id in schools:
+                db.rank_all_forms(school_id, TERM, YEAR)
+
+        # The ranking step alone, on marks already in memory
+        classes = []
+        for school_id in schools:
+            for form_level in [1, 2, 3, 4]:
+                rows = db._load_period_marks(form_level, TERM, YEAR, school_id)
+                classes.append((ranking_engine.group_period_marks(rows), form_level))
+
+        for class_marks, form_level in classes:
+            assert ranking_engine.rank_class(class_marks, form_level) == \
+                ranking_kernel.rank_class_vectorized(class_marks, form_level)
+
+        results = [
+            ('get_student_rankings x4 forms', best_of(args.repeat, current_path)),
+            ('rank_all_forms', best_of(args.repeat, vectorized_path)),
+            ('rank_class (in memory)', best_of(args.repeat, lambda: [ranking_engine.rank_class(c, f) for c, f in classes])),
+            ('rank_class_vectorized (in memory)', best_of(args.repeat, lambda: [ranking_kernel.rank_class_vectorized(c, f) for c, f in classes])),
+        ]
+
+        print(f"{args.schools} school(s) x {args.students} students, best of {args.repeat}")
+        for label, seconds in results:
+            print(f"  {label:<36} {seconds * 1000:9.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark per-card report rendering with and without the cached report template.
+Renders the same Form 3 report payload repeatedly and times:
+  - cold: the template (ReportLab imports, styles, emblem decode and downscale,
+    border) is rebuilt for every card, as every card did before it was cached
+  - warm: the process-wide template is reused, only the student's flowables are built
+Also prints a size report in bytes per card (a single card and a class
+booklet) for the active PDF profile, so output size regressions are visible.
+Run with: python -m scripts.benchmark_report_render [--cards 50] [--booklet 40]
+(PDF_PROFILE=legacy for ReportLab's defaults)
+"""
+import argparse
+import io
+import time
+from datetime import datetime
+
+import pdf_profile
+import termly_report_generator
+
+
+def sample_payload() -> dict:
+    table_rows = [['Subject', 'Marks', 'Grade', 'Position', 'Teachers Comment', 'Signature']]
+    for i, subject in enumerate(['Agriculture', 'Biology', 'Bible Knowledge', 'Chemistry', 'Chichewa', 'Computer Studies',
+                                 'English', 'Geography', 'History', 'Life Skills/SOS', 'Mathematics', 'Physics']):
+        table_rows.append([subject, str(45 + 3 * i), '6', f"{i + 1}/92", 'Good', f"{subject} Teacher"[:15]])
+    return {
+        'form_level': 3,
+        'school_name': 'DEMO SECONDARY SCHOOL',
+        'school_address': 'P.O. Box 123, Zomba, Malawi',
+        'student_rows': [['Serial No:', '0001'], ['Student Name:', 'Student Example'], ['Term:', '1'],
+                         ['Form:', '3'], ['Year:', '2025-2026']],
+        'position_info': '12/92                    Aggregate Points: 24    Remark: PASS',
+        'table_rows': table_rows,
+        'aggregate_points': 24,
+        'status': 'PASS',
+        'form_teacher_comment': 'PASSED - Good performance! Passed 9 subjects with 61.5% average.',
+        'head_teacher_comment': 'PASSED - Well done. Keep up the good work.',
+        'next_term_begins': '5 January 2026',
+        'boarding_fee': 'MK 150,000',
+        'girls_uniform': 'White blouse, black skirt, black shoes',
+        'boys_uniform': 'White shirt, black trousers, black shoes',
+        'generated_at': datetime(2026, 1, 1, 12, 0)
+    }
+
+
+def per_card_ms(cards: int, func) -> float:
+    start = time.perf_counter()
+    for _ in range(cards):
+        func()
+    return (time.perf_counter() - start) / cards * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cards', type=int, default=50)
+    parser.add_argument('--booklet', type=int, default=40, help='cards in the booklet of the size report')
+    args = parser.parse_args()
+
+    payload = sample_payload()
+
+    def cold():
+        termly_report_generator.reset_report_template()
+        return termly_report_generator.render_progress_report_bytes(payload)
+
+    def warm():
+        return termly_report_generator.render_progress_report_bytes(payload)
+
+    # Pay the one-off ReportLab import and font setup before timing
+    warm()
+    results = [('cold template per card', per_card_ms(args.cards, cold)),
+               ('cached template', per_card_ms(args.cards, warm))]
+
+    print(f"{args.cards} cards")
+    for label, ms in results:
+        print(f"  {label:<24} {ms:8.1f} ms/card")
+
+    booklet = io.BytesIO()
+    termly_report_generator.render_class_booklet(((f"Student {i}", payload) for i in range(args.booklet)), booklet)
+    emblem = termly_report_generator.get_report_template().emblem
+    print(f"Size report ({'compact' if pdf_profile.COMPACT_PDF else 'legacy'} profile)")
+    print(f"  {'single card':<24} {len(warm()):8d} bytes/card")
+    print(f"  {f'booklet of {args.booklet}':<24} {len(booklet.getvalue()) // args.booklet:8d} bytes/card")
+    if isinstance(emblem, bytes):
+        print(f"  {'emblem (JPEG)':<24} {len(emblem):8d} bytes")
+
+
+if __name__ == '__main__':
+    main()
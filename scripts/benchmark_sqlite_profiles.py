@@ -0,0 +1,135 @@
+"""
+Benchmark SQLite concurrency profiles under multi-process contention.
+Simulates end-of-term data entry with several gunicorn workers sharing one
+database file: writer processes save a student's marks (save_student_marks,
+one transaction each) while reader processes load whole classes of marks,
+as the ranking and report pages do. Each profile runs on its own copy of a
+synthetic school for the same wall-clock time and reports throughput,
+write latency and "database is locked" failures.
+Run with: python -m scripts.benchmark_sqlite_profiles [--writers 2] [--readers 2] [--seconds 10] [--students 800]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import connection_pool
+from school_database import SchoolDatabase
+from scripts.benchmark_rank_all_forms import TERM, YEAR, build_school
+
+SCHOOL_ID = 1
+SUBJECTS = ['Agriculture', 'Biology', 'Chemistry', 'English', 'Geography', 'History', 'Mathematics', 'Physics']
+
+
+def open_database(db_path: str, profile: str) -> SchoolDatabase:
+    connection_pool.SQLITE_PROFILE = profile
+    return SchoolDatabase(db_path)
+
+
+def writer(db_path, profile, student_ids, seconds, seed, start, results):
+    db = open_database(db_path, profile)
+    rng = random.Random(seed)
+    latencies, failures = [], 0
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        student_id, form_level = rng.choice(student_ids)
+        marks = {subject: rng.randint(20, 95) for subject in SUBJECTS}
+        began = time.perf_counter()
+        try:
+            db.save_student_marks(student_id, marks, TERM, YEAR, form_level, SCHOOL_ID)
+            latencies.append(time.perf_counter() - began)
+        except sqlite3.OperationalError:
+            failures += 1
+    results.put(('writer', latencies, failures))
+
+
+def reader(db_path, profile, seconds, seed, start, results):
+    db = open_database(db_path, profile)
+    rng = random.Random(seed)
+    latencies, failures = [], 0
+    start.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        began = time.perf_counter()
+        try:
+            db._load_period_marks(rng.randint(1, 4), TERM, YEAR, SCHOOL_ID)
+            latencies.append(time.perf_counter() - began)
+        except sqlite3.OperationalError:
+            failures += 1
+    results.put(('reader', latencies, failures))
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_profile(profile: str, template_path: str, workdir: str, args):
+    """Run the writers and readers against a fresh copy of the template database"""
+    db_path = os.path.join(workdir, f'{profile}.db')
+    shutil.copy2(template_path, db_path)
+    db = open_database(db_path, profile)
+    with db.get_connection() as conn:
+        student_ids = conn.execute("SELECT student_id, grade_level FROM students WHERE school_id = ?",
+                                   (SCHOOL_ID,)).fetchall()
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+
+    ctx = multiprocessing.get_context('spawn')
+    start = ctx.Event()
+    results = ctx.Queue()
+    processes = [ctx.Process(target=writer, args=(db_path, profile, student_ids, args.seconds, i, start, results))
+                 for i in range(args.writers)]
+    processes += [ctx.Process(target=reader, args=(db_path, profile, args.seconds, 100 + i, start, results))
+                  for i in range(args.readers)]
+    for process in processes:
+        process.start()
+    # Let every worker finish opening the database before the clock starts
+    time.sleep(args.warmup)
+    start.set()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    writes = [latency for role, latencies, _ in outcomes if role == 'writer' for latency in latencies]
+    reads = [latency for role, latencies, _ in outcomes if role == 'reader' for latency in latencies]
+    failures = sum(failed for _, _, failed in outcomes)
+    print(f"  {profile:<8} ({journal_mode:<6}) "
+          f"{len(writes) / args.seconds:8.1f} saves/s  {len(reads) / args.seconds:7.1f} class reads/s  "
+          f"save p50 {percentile(writes, 0.5) * 1000:6.1f} ms  p95 {percentile(writes, 0.95) * 1000:7.1f} ms  "
+          f"locked {failures}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=2, help='processes saving marks')
+    parser.add_argument('--readers', type=int, default=2, help='processes loading class marks')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--students', type=int, default=800)
+    parser.add_argument('--warmup', type=float, default=3.0, help='seconds given to workers to start')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sqlite_profile_bench_')
+    try:
+        template_path = os.path.join(workdir, 'template.db')
+        db = open_database(template_path, 'default')
+        build_school(db, SCHOOL_ID, args.students, random.Random(args.seed))
+        connection_pool.get_sqlite_pool(template_path).close_all()
+
+        print(f"{args.writers} writer + {args.readers} reader processes, {args.students} students, "
+              f"{args.seconds:g} s per profile, {os.cpu_count()} CPU(s)")
+        for profile in ['default', 'server']:
+            run_profile(profile, template_path, workdir, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
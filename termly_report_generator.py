@@ -9,13 +9,24 @@ Created: 2025-08-06
 
 import os
 import io
+import json
+import hashlib
 import tempfile
 import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from dataclasses import dataclass
 from datetime import datetime
 from typing import Dict, List, Optional, Union, Tuple
 
 from school_database import SchoolDatabase
+import results_engine
+from report_pdf_cache import get_report_pdf_cache, report_cache_key
+import pdf_profile
 
 # Ensure reports directory exists
 REPORTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reports')
@@ -25,6 +36,416 @@ os.makedirs(REPORTS_DIR, exist_ok=True)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Parallel rendering of whole-form downloads: size of the shared process pool
+# (0 or 1 renders serially) and how many of its workers one request may use
+REPORT_RENDER_WORKERS = int(os.environ.get('REPORT_RENDER_WORKERS', '0'))
+REPORT_RENDER_REQUEST_CAP = int(os.environ.get('REPORT_RENDER_REQUEST_CAP', str(max(1, REPORT_RENDER_WORKERS // 2))))
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+# Version of the card layout; bump it whenever render_progress_report changes
+# so that cached PDFs of the old layout are no longer served
+REPORT_TEMPLATE_VERSION = 3
+
+# Single-student downloads are rendered deterministically: dated with the
+# data's last modification and with a document ID derived from the content
+REPORT_DETERMINISTIC_PDF = os.environ.get('REPORT_DETERMINISTIC_PDF', '1') == '1'
+
+EMBLEM_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Malawi Government logo.png')
+
+_report_template = None
+_report_template_lock = threading.Lock()
+
+@dataclass(frozen=True)
+class ClassReportContext:
+    """Everything the report cards of one form need, fetched once per class.
+
+    Built by TermlyReportGenerator.prefetch_class_context; the contained
+    rows and snapshots are shared and treated as read-only.
+    """
+    form_level: int
+    term: str
+    academic_year: str
+    school_id: Optional[int]
+    students: Tuple[Dict, ...]  # student records in roster order
+    marks: Dict[int, Dict[str, Dict]]  # {student_id: {subject: {'mark', 'grade'}}}
+    settings: Dict
+    subject_teachers: Dict[str, str]
+    rankings: Dict  # get_student_rankings snapshot of the form
+    subject_positions: Dict[int, Dict[str, str]]  # {student_id: {subject: "pos/total"}}
+
+
+class ReportTemplate:
+    """Everything on a progress report that does not depend on the student.
+
+    Built once per process by get_report_template(): the ReportLab imports,
+    the bordered document class, paragraph and table styles, the decoded and
+    downscaled government emblem and the page border, which every document
+    defines once as a form XObject and draws on each page.
+    
+    In the compact PDF profile the emblem is flattened onto white and kept as
+    JPEG bytes at print resolution, which ReportLab embeds without re-encoding.
+    """
+
+    EMBLEM_SIZE = 0.8 * 72  # points (0.8 inch)
+    EMBLEM_DPI = pdf_profile.COMPACT_IMAGE_DPI if pdf_profile.COMPACT_PDF else 200
+
+    def __init__(self, emblem_path: str = EMBLEM_PATH):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import Paragraph, Spacer, Table, TableStyle, PageTemplate, Frame, Flowable, PageBreak
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.lib.enums import TA_CENTER, TA_LEFT
+        from reportlab.lib import colors
+        from reportlab.lib.utils import ImageReader
+        from reportlab.platypus.doctemplate import BaseDocTemplate
+        from reportlab.pdfgen.canvas import Canvas
+
+        pdf_profile.apply_pdf_profile()
+        self.A4 = A4
+        self.inch = inch
+        self.Paragraph = Paragraph
+        self.Spacer = Spacer
+        self.Table = Table
+        self.PageTemplate = PageTemplate
+        self.Frame = Frame
+
+        def draw_border(canvas, doc):
+            # Colorful border, drawn once per document and reused on every page
+            if not canvas.hasForm('ReportBorder'):
+                canvas.beginForm('ReportBorder')
+                canvas.saveState()
+                
+                # Outer border - Blue
+                canvas.setStrokeColor(colors.blue)
+                canvas.setLineWidth(4)
+                canvas.rect(20, 20, A4[0]-40, A4[1]-40)
+                
+                # Middle border - Green
+                canvas.setStrokeColor(colors.green)
+                canvas.setLineWidth(2)
+                canvas.rect(30, 30, A4[0]-60, A4[1]-60)
+                
+                # Inner border - Red
+                canvas.setStrokeColor(colors.red)
+                canvas.setLineWidth(1)
+                canvas.rect(40, 40, A4[0]-80, A4[1]-80)
+                
+                canvas.restoreState()
+                canvas.endForm()
+            canvas.doForm('ReportBorder')
+
+        self.draw_border = draw_border
+
+        class ReportDocTemplate(BaseDocTemplate):
+            """Bordered report document, built with its own canvas class when it has one"""
+            canvasmaker = None
+
+            def build(self, flowables, filename=None, canvasmaker=None):
+                BaseDocTemplate.build(self, flowables, filename, canvasmaker or self.canvasmaker or Canvas)
+
+        self.doc_class = ReportDocTemplate
+
+        class Emblem(Flowable):
+            """The emblem, drawn from the image held by the template (JPEG bytes or a decoded image)"""
+            def __init__(self, image, size):
+                Flowable.__init__(self)
+                self.image = image
+                self.width = self.height = size
+                self.hAlign = 'CENTER'
+
+            def draw(self):
+                # A reader per document: JPEG readers hold a file position
+                reader = ImageReader(io.BytesIO(self.image)) if isinstance(self.image, bytes) else self.image
+                self.canv.drawImage(reader, 0, 0, self.width, self.height, mask='auto')
+
+        self.Emblem = Emblem
+
+        class Bookmark(Flowable):
+            """Zero-size marker that bookmarks its page and adds an outline entry"""
+            def __init__(self, key, title):
+                Flowable.__init__(self)
+                self.key = key
+                self.title = title
+                self.width = self.height = 0
+
+            def draw(self):
+                self.canv.bookmarkPage(self.key)
+                self.canv.addOutlineEntry(self.title, self.key, level=0)
+                self.canv.showOutline()
+
+        self.Bookmark = Bookmark
+        self.PageBreak = PageBreak
+        self.emblem = None
+        if os.path.exists(emblem_path):
+            try:
+                from PIL import Image as PILImage
+                with PILImage.open(emblem_path) as image:
+                    pixels = int(self.EMBLEM_SIZE / 72 * self.EMBLEM_DPI)
+                    image.load()
+                    image.thumbnail((pixels, pixels), PILImage.LANCZOS)
+                    if pdf_profile.COMPACT_PDF:
+                        flat = PILImage.new('RGB', image.size, 'white')
+                        flat.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+                        jpeg = io.BytesIO()
+                        flat.save(jpeg, 'JPEG', quality=pdf_profile.COMPACT_JPEG_QUALITY, optimize=True)
+                        self.emblem = jpeg.getvalue()
+                    else:
+                        self.emblem = ImageReader(image.copy())
+            except Exception as e:
+                logger.error(f"Error loading report emblem {emblem_path}: {e}")
+
+        # Create styles with black text and background colors only
+        styles = getSampleStyleSheet()
+        self.school_name_style = ParagraphStyle('SchoolName', parent=styles['Heading1'], fontSize=16, alignment=TA_CENTER, fontName='Helvetica-Bold', textColor=colors.black)
+        self.address_style = ParagraphStyle('Address', parent=styles['Normal'], fontSize=10, alignment=TA_CENTER, fontName='Helvetica-Bold', textColor=colors.black)
+        self.progress_style = ParagraphStyle('Progress', parent=styles['Heading1'], fontSize=14, alignment=TA_CENTER, fontName='Helvetica-Bold', textColor=colors.black)
+        self.aggregate_style = ParagraphStyle('AggregatePoints', parent=styles['Normal'], fontSize=10, alignment=TA_LEFT, fontName='Helvetica-Bold', textColor=colors.black)
+        # Grading, comments and fees of every form share one footer style
+        self.footer_style = ParagraphStyle('FooterStyle', parent=styles['Normal'], fontSize=9, fontName='Helvetica-Bold', textColor=colors.black, leading=10)
+        self.final_footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=7, alignment=TA_CENTER, fontName='Helvetica-Bold', textColor=colors.black)
+
+        self.marks_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('TOPPADDING', (0, 0), (-1, 0), 8),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
+        ])
+        # Student information and position rows share one uniform style
+        self.info_table_style = TableStyle([
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('LEFTPADDING', (0, 0), (-1, -1), 0),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+            ('TOPPADDING', (0, 0), (-1, -1), 2),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP')
+        ])
+        self.marks_col_widths = [2*inch, 0.8*inch, 0.8*inch, 0.8*inch, 1.5*inch, 1.2*inch]
+        self.info_col_widths = [1.5*inch, 4*inch]
+
+    def new_document(self, output, created_at: datetime = None, document_id: bytes = None):
+        """A bordered A4 document writing to `output` (frames hold layout state, so one per document)
+        
+        With `created_at` and `document_id` the document is deterministic: its
+        creation date and ID are pinned to them instead of the clock.
+        """
+        inch, A4 = self.inch, self.A4
+        doc = self.doc_class(output, pagesize=A4, topMargin=0.8*inch, bottomMargin=0.8*inch, leftMargin=0.8*inch, rightMargin=0.8*inch,
+                             **pdf_profile.doc_options())
+        if created_at is not None:
+            doc.invariant = 1
+            doc.canvasmaker = self._pinned_canvas(created_at, document_id)
+        frame = self.Frame(0.8*inch, 0.8*inch, A4[0]-1.6*inch, A4[1]-1.6*inch, leftPadding=0, bottomPadding=0, rightPadding=0, topPadding=0)
+        doc.addPageTemplates([self.PageTemplate(id='bordered', frames=frame, onPage=self.draw_border)])
+        return doc
+
+    @staticmethod
+    def _pinned_canvas(created_at: datetime, document_id: bytes):
+        """Canvas class whose PDF creation date and document ID are fixed"""
+        import time
+        from reportlab.pdfgen.canvas import Canvas
+        from reportlab.pdfbase.pdfdoc import PDFText, DummyDoc
+        from reportlab.lib.utils import TimeStamp
+
+        class PinnedCanvas(Canvas):
+            def __init__(self, *args, **kwargs):
+                Canvas.__init__(self, *args, **kwargs)
+                stamp = TimeStamp(1)
+                stamp.t = created_at.timestamp()
+                stamp.lt = time.gmtime(stamp.t)
+                stamp.YMDhms = tuple(stamp.lt)[:6]
+                self._doc._timeStamp = stamp
+                ids = PDFText(document_id, enc='raw').format(DummyDoc())
+                self._doc._ID = b'\n[' + ids + ids + b']\n% ReportLab generated PDF document -- digest (http://www.reportlab.com)\n'
+
+        return PinnedCanvas
+
+    def build_story(self, payload: Dict) -> List:
+        """Flowables of one report card"""
+        Paragraph, Spacer, Table = self.Paragraph, self.Spacer, self.Table
+        story = []
+        form_level = payload['form_level']
+        
+        # Add logo if exists - smaller for A4 fit
+        if self.emblem is not None:
+            story.append(self.Emblem(self.emblem, self.EMBLEM_SIZE))
+            story.append(Spacer(1, 6))
+        
+        # Add school header with reduced spacing for Forms 3-4
+        spacing = 2 if form_level >= 3 else 4
+        story.append(Paragraph(f"<b>{payload['school_name']}</b>", self.school_name_style))
+        story.append(Spacer(1, spacing))
+        
+        # Add school address from settings
+        address_lines = payload['school_address'].split(', ')
+        for line in address_lines:
+            story.append(Paragraph(f"<b>{line.strip()}</b>", self.address_style))
+        story.append(Spacer(1, spacing))
+        
+        # Add progress report title
+        story.append(Paragraph(f"<b>PROGRESS REPORT</b>", self.progress_style))
+        story.append(Spacer(1, spacing))
+        
+        # Add student information with uniform spacing using table
+        student_table = Table(payload['student_rows'], colWidths=self.info_col_widths)
+        student_table.setStyle(self.info_table_style)
+        story.append(student_table)
+        
+        # Add position as separate table row
+        position_table = Table([['Position:', payload['position_info']]], colWidths=self.info_col_widths)
+        position_table.setStyle(self.info_table_style)
+        story.append(position_table)
+        
+        story.append(Spacer(1, 3 if form_level >= 3 else 6))
+        
+        # Add the marks table
+        table = Table(payload['table_rows'], colWidths=self.marks_col_widths)
+        table.setStyle(self.marks_table_style)
+        story.append(table)
+        
+        # Add aggregate points for senior forms (left-aligned below table)
+        if form_level >= 3:
+            story.append(Spacer(1, 2))
+            story.append(Paragraph(f"<b>**Aggregate Points (Best Six): {payload['aggregate_points']}    Remark: {payload['status']}**</b>", self.aggregate_style))
+        
+        story.append(Spacer(1, 3 if form_level >= 3 else 6))
+        
+        # Compact footer spacing for Forms 3 and 4
+        footer_style = grading_style = self.footer_style
+        spacer_size = 3 if form_level <= 2 else 2
+        teacher_comment_spacer = 2
+        
+        # Add grading system
+        if form_level <= 2:
+            story.append(Paragraph(f"<b><u>GRADING:</u> A(80-100) B(70-79) C(60-69) D(50-59) F(0-49)</b>", grading_style))
+        else:
+            story.append(Paragraph(f"<b><u>MSCE GRADING:</u> 1(75-100) 2(70-74) 3(65-69) 4(60-64) 5(55-59) 6(50-54) 7(45-49) 8(40-44) 9(0-39)</b>", grading_style))
+        story.append(Spacer(1, spacer_size))
+        
+        # Add teacher comments
+        story.append(Paragraph(f"<b><u>FORM TEACHERS' COMMENT:</u> {payload['form_teacher_comment']}</b>", footer_style))
+        story.append(Paragraph(f"<b><u>HEAD TEACHERS' COMMENT:</u> {payload['head_teacher_comment']}</b>", footer_style))
+        story.append(Spacer(1, teacher_comment_spacer))
+        story.append(Paragraph(f"<b><u>FORM TEACHER SIGN:</u> ________________________</b>", footer_style))
+        story.append(Paragraph(f"<b><u>HEAD TEACHER SIGN:</u> ________________________</b>", footer_style))
+        story.append(Spacer(1, spacer_size))
+        
+        # Add fees and uniform information from school settings
+        story.append(Paragraph(f"<b><u>NEXT TERM BEGINS ON:</u> {payload['next_term_begins']}</b>", footer_style))
+        story.append(Paragraph(f"<b><u>FEES</u> - <u>BOARDING FEE:</u> {payload['boarding_fee']}</b>", footer_style))
+        story.append(Paragraph(f"<b><u>UNIFORM - GIRLS:</u> {payload['girls_uniform']}</b>", footer_style))
+        story.append(Paragraph(f"<b><u>UNIFORM - BOYS:</u> {payload['boys_uniform']}</b>", footer_style))
+        story.append(Spacer(1, spacer_size))
+        
+        # Compact final footer for all forms
+        story.append(Paragraph(f"<b>Generated by: RN_LAB_TECH</b>", self.final_footer_style))
+        story.append(Paragraph(f"<b>Date: {payload['generated_at'].strftime('%d/%m/%Y %H:%M')}</b>", self.final_footer_style))
+        return story
+
+
+def render_class_booklet(cards, output) -> int:
+    """Lay out many report cards as one PDF, one card per page, in a single build.
+
+    `cards` yields (bookmark title, payload). Fonts, the emblem and the page
+    border are written once and shared by every page. Returns the number of cards.
+    """
+    template = get_report_template()
+    doc = template.new_document(output)
+    story = []
+    for index, (title, payload) in enumerate(cards):
+        if story:
+            story.append(template.PageBreak())
+        story.append(template.Bookmark(f"card{index}", title))
+        story.extend(template.build_story(payload))
+    if not story:
+        return 0
+    doc.build(story)
+    return index + 1
+
+
+def get_report_template() -> ReportTemplate:
+    """The process-wide report template, built on first use"""
+    global _report_template
+    if _report_template is None:
+        with _report_template_lock:
+            if _report_template is None:
+                _report_template = ReportTemplate()
+    return _report_template
+
+
+def reset_report_template():
+    """Drop the cached template (after the emblem file changed, and in benchmarks)"""
+    global _report_template
+    with _report_template_lock:
+        _report_template = None
+
+
+def payload_digest(payload: Dict) -> bytes:
+    """MD5 of a report payload and the template version, the size of a PDF document ID"""
+    content = json.dumps([REPORT_TEMPLATE_VERSION, payload], sort_keys=True, default=str)
+    return hashlib.md5(content.encode('utf-8')).digest()
+
+
+def render_progress_report(payload: Dict, output, deterministic: bool = False) -> None:
+    """Lay out one progress report PDF from a report payload.
+
+    `output` is a filename or a writable binary file object. The payload is
+    plain data (see TermlyReportGenerator._build_report_payload), so this
+    does no database access and the same payload always renders the same page.
+    Only the student's own flowables are built here; the rest comes from the
+    cached ReportTemplate. A deterministic render is dated payload['generated_at']
+    and identified by payload_digest, so equal payloads give identical bytes.
+    """
+    template = get_report_template()
+    if deterministic:
+        doc = template.new_document(output, payload['generated_at'], payload_digest(payload))
+    else:
+        doc = template.new_document(output)
+    doc.build(template.build_story(payload))
+
+
+def render_progress_report_bytes(payload: Dict, deterministic: bool = False) -> bytes:
+    """Render a report payload to PDF bytes (the unit of work sent to the render pool)"""
+    buffer = io.BytesIO()
+    render_progress_report(payload, buffer, deterministic)
+    return buffer.getvalue()
+
+
+def get_render_pool() -> Optional[ProcessPoolExecutor]:
+    """Shared report render pool, created on first use; None when parallel rendering is off"""
+    global _render_pool
+    if REPORT_RENDER_WORKERS <= 1:
+        return None
+    with _render_pool_lock:
+        if _render_pool is None:
+            # Spawned workers only import this module; they never inherit open database connections
+            _render_pool = ProcessPoolExecutor(max_workers=REPORT_RENDER_WORKERS,
+                                               mp_context=multiprocessing.get_context('spawn'))
+        return _render_pool
+
+
+def reset_render_pool() -> None:
+    """Drop a broken render pool so the next request starts a fresh one"""
+    global _render_pool
+    with _render_pool_lock:
+        pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
 class TermlyReportGenerator:
     """Class for generating professional termly report cards with pass/fail determination"""
     
@@ -188,41 +609,37 @@ UNIFORM - BOYS: {settings.get('boys_uniform', 'White shirt, black trousers, blac
             
             print(f"Analyzing pass/fail status for Form {form_level} - {term}...")
             
+            # One marks query and one results pass for the whole class
+            student_ids = [int(student['student_id']) for student in students]
+            class_marks = self.db.get_term_marks_for_students(student_ids, term, academic_year)
+            results = results_engine.compute_results({sid: class_marks.get(sid, {}) for sid in student_ids}, form_level)
+            
             for student in students:
-                try:
-                    report_data = self.db.generate_termly_report_card(
-                        student['student_id'], term, academic_year
-                    )
-                    
-                    if report_data:
-                        stats = report_data['overall_statistics']
-                        student_detail = {
-                            'name': f"{student['first_name']} {student['last_name']}",
-                            'student_number': student['student_number'],
-                            'status': stats['overall_status'],
-                            'passed_subjects': stats['passed_subjects'],
-                            'english_passed': stats['english_passed'],
-                            'english_percentage': stats['english_percentage'],
-                            'overall_average': stats['overall_average']
-                        }
-                        
-                        summary_data['student_details'].append(student_detail)
-                        
-                        if stats['overall_status'] == 'PASS':
-                            summary_data['passed_students'] += 1
-                        else:
-                            summary_data['failed_students'] += 1
-                            
-                            # Categorize failure reasons
-                            if stats['passed_subjects'] >= 6 and not stats['english_passed']:
-                                summary_data['failed_english_only'] += 1
-                            elif stats['passed_subjects'] < 6 and stats['english_passed']:
-                                summary_data['failed_insufficient_subjects'] += 1
-                            else:
-                                summary_data['failed_both'] += 1
+                result = results[int(student['student_id'])]
+                student_detail = {
+                    'name': f"{student['first_name']} {student['last_name']}",
+                    'student_number': student['student_number'],
+                    'status': result['status'],
+                    'passed_subjects': result['passed_subjects'],
+                    'english_passed': result['english_passed'],
+                    'english_percentage': round(result['english_mark'], 1),
+                    'overall_average': round(result['average'], 1)
+                }
                 
-                except Exception as e:
-                    print(f"Error processing {student['first_name']} {student['last_name']}: {e}")
+                summary_data['student_details'].append(student_detail)
+                
+                if result['status'] == 'PASS':
+                    summary_data['passed_students'] += 1
+                else:
+                    summary_data['failed_students'] += 1
+                    
+                    # Categorize failure reasons
+                    if result['passed_subjects'] >= 6 and not result['english_passed']:
+                        summary_data['failed_english_only'] += 1
+                    elif result['passed_subjects'] < 6 and result['english_passed']:
+                        summary_data['failed_insufficient_subjects'] += 1
+                    else:
+                        summary_data['failed_both'] += 1
             
             return self.format_class_summary(summary_data, form_level, term, academic_year)
             
@@ -315,15 +732,11 @@ For High Performing Students:
         """Format authentic Malawi school report card matching sample format"""
         form_level = student['grade_level']
         
-        # Calculate statistics
-        total_marks = sum(data['mark'] for data in marks.values()) if marks else 0
-        subject_count = len(marks)
-        average = total_marks / subject_count if subject_count > 0 else 0
-        
-        # Pass/fail determination
-        passed_subjects = sum(1 for data in marks.values() if data['mark'] >= 50) if marks else 0
-        english_mark = marks.get('English', {}).get('mark', 0)
-        overall_status = 'PASS' if passed_subjects >= 6 and english_mark >= 50 else 'FAIL'
+        # Calculate statistics and pass/fail status
+        result = results_engine.student_result({subject: data['mark'] for subject, data in marks.items()}, form_level)
+        average = result['average']
+        passed_subjects = result['passed_subjects']
+        overall_status = result['status']
         
         # Get school settings
         settings = self.db.get_school_settings(school_id)
@@ -352,12 +765,13 @@ Subject                Marks Grade Pos  Comment      Signature
 ==============================================================================
 """
         
-        # Add subjects with positions
+        # Add subjects with positions (one ranking pass for the whole class)
+        subject_positions = self.db.get_subject_positions(form_level, term, academic_year, school_id).get(student['student_id'], {})
         for subject in self.standard_subjects:
             if subject in marks:
                 mark = marks[subject]['mark']
                 grade = marks[subject]['grade']
-                pos = self.db.get_subject_position(student['student_id'], subject, term, academic_year, form_level) if hasattr(self.db, 'get_subject_position') else 'N/A'
+                pos = subject_positions.get(subject) or self.db.get_subject_position(student['student_id'], subject, term, academic_year, form_level, school_id)
                 comment = self.db.get_teacher_comment(grade) if hasattr(self.db, 'get_teacher_comment') else ('Good' if mark >= 50 else 'Fair')
                 report += f"{subject:<20} {mark:>3} {grade:>5} {pos:>3}  {comment:<12} ____________\n"
             else:
@@ -365,17 +779,7 @@ Subject                Marks Grade Pos  Comment      Signature
         
         # Add aggregate for Forms 3&4
         if form_level >= 3:
-            # Calculate aggregate points
-            if marks:
-                best_marks = sorted([data['mark'] for data in marks.values()], reverse=True)[:6]
-                grade_points = []
-                for mark in best_marks:
-                    grade = self.db.calculate_grade(mark, form_level) if hasattr(self.db, 'calculate_grade') else ('1' if mark >= 75 else '9')
-                    grade_points.append(int(grade) if grade.isdigit() else 9)
-                aggregate = sum(grade_points)
-            else:
-                aggregate = 54
-            report += f"\n================================================================================\nAggregate Points (Best Six): {aggregate}    Remark: {overall_status}\n"
+            report += f"\n================================================================================\nAggregate Points (Best Six): {result['aggregate_points']}    Remark: {overall_status}\n"
         
         # Grading system
         if form_level <= 2:
@@ -452,7 +856,8 @@ UNIFORM - BOYS: {settings.get('boys_uniform', 'White shirt, black trousers, blac
             
             # Create PDF in memory
             buffer = io.BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.8*inch, bottomMargin=0.8*inch)
+            pdf_profile.apply_pdf_profile()
+            doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.8*inch, bottomMargin=0.8*inch, **pdf_profile.doc_options())
             
             styles = getSampleStyleSheet()
             story = []
@@ -522,31 +927,134 @@ UNIFORM - BOYS: {settings.get('boys_uniform', 'White shirt, black trousers, blac
             print(f"Error generating PDF: {e}")
             return io.BytesIO(b'Error generating PDF')
     
+    def _report_pdf_cache(self):
+        """PDF cache next to the school database (REPORT_PDF_CACHE_DIR overrides it)"""
+        cache_dir = os.environ.get('REPORT_PDF_CACHE_DIR') or os.path.join(
+            'data' if getattr(self.db, 'use_postgres', False) else os.path.dirname(os.path.abspath(self.db.db_path)),
+            'pdf_cache')
+        return get_report_pdf_cache(cache_dir)
+    
     def export_report_to_pdf_bytes(self, student_id: int, term: str, academic_year: str = '2024-2025', school_id: int = None):
-        """Export professional progress report as PDF and return as bytes"""
+        """Export professional progress report as PDF and return as bytes
+        
+        With a school_id the card is rendered deterministically (unless
+        REPORT_DETERMINISTIC_PDF=0): it is dated with the last change to the
+        school's period data or settings, so unchanged data always gives the
+        same bytes. It is served from the report PDF cache while those
+        versions are unchanged.
+        """
         try:
-            print(f"DEBUG: Starting PDF generation for student {student_id}")
-            pdf_filename = self.export_progress_report(student_id, term, academic_year, school_id)
-            print(f"DEBUG: PDF filename generated: {pdf_filename}")
+            cache = cache_key = None
+            generated_at = None
+            deterministic = False
+            if school_id:
+                period_version, settings_version, last_modified = self.db.get_report_versions(term, academic_year, school_id)
+                deterministic = REPORT_DETERMINISTIC_PDF and last_modified is not None
+                if deterministic:
+                    generated_at = last_modified
+                cache = self._report_pdf_cache()
+                if cache is not None:
+                    # The counters say whether the class or settings changed; the modification time,
+                    # database identity and the student's own rows keep a restored or fresh database,
+                    # whose counters start over, from hitting cards of other data
+                    fingerprint = self.db.get_report_fingerprint(student_id, term, academic_year, school_id)
+                    cache_key = report_cache_key(REPORT_TEMPLATE_VERSION, deterministic, school_id, student_id, term,
+                                                 academic_year, period_version, settings_version,
+                                                 last_modified.isoformat() if last_modified else '', fingerprint)
+                    pdf_bytes = cache.get(cache_key)
+                    if pdf_bytes:
+                        return pdf_bytes
             
-            if pdf_filename and os.path.exists(pdf_filename):
-                print(f"DEBUG: PDF file exists, reading {pdf_filename}")
-                with open(pdf_filename, 'rb') as f:
-                    pdf_bytes = f.read()
-                print(f"DEBUG: Read {len(pdf_bytes)} bytes from PDF")
-                os.remove(pdf_filename)  # Clean up temporary file
-                return pdf_bytes
-            else:
-                print(f"DEBUG: PDF file not found or not generated: {pdf_filename}")
+            buffer = io.BytesIO()
+            if self.write_progress_report(buffer, student_id, term, academic_year, school_id, generated_at,
+                                          deterministic=deterministic) is None:
                 return b''
+            pdf_bytes = buffer.getvalue()
+            # Text fallbacks are not cached; the next download retries the PDF
+            if cache_key and pdf_bytes.startswith(b'%PDF'):
+                cache.put(cache_key, pdf_bytes)
+            return pdf_bytes
         except Exception as e:
             print(f"Error generating PDF bytes: {e}")
             import traceback
             traceback.print_exc()
             return b''
     
-    def export_progress_report(self, student_id: int, term: str, academic_year: str = '2024-2025', school_id: int = None):
-        """Export progress report to PDF file"""
+    def _build_report_payload(self, student: Dict, marks: Dict, settings: Dict, subject_teachers: Dict[str, str],
+                              subject_positions: Dict[str, str], position_data: Dict, term: str, academic_year: str,
+                              school_id: int = None, generated_at: datetime = None) -> Dict:
+        """Turn prefetched data for one student into the plain-data payload of render_progress_report"""
+        student_id = student['student_id']
+        form_level = student['grade_level'] if student else 1
+        
+        # The student's outcome is computed once and reused by every section below
+        result = results_engine.student_result({subject: data['mark'] for subject, data in marks.items()}, form_level)
+        
+        table_rows = [['Subject', 'Marks', 'Grade', 'Position', 'Teachers Comment', 'Signature']]
+        for subject in self.standard_subjects:
+            if subject in marks:
+                mark = marks[subject]['mark']
+                grade = marks[subject]['grade']
+                position = subject_positions.get(subject) or self.db.get_subject_position(student_id, subject, term, academic_year, form_level, school_id)
+                comment = self.db.get_teacher_comment(grade)
+                teacher = subject_teachers.get(subject, f"{subject} Teacher F{form_level}")
+                table_rows.append([subject, str(mark), grade, str(position), comment, teacher[:15]])
+            else:
+                table_rows.append([subject, '--', '--', '--', 'Not taken', '--'])
+        
+        overall_status_pdf = result['status']
+        if form_level <= 2:
+            # CRITICAL RULE: Forms 1&2 failed students (including 1-5 subjects) MUST get F grade
+            position_info = f"{position_data['position']}/{position_data['total_students']}                    Average Grade: {result['report_grade']}    Remark: {overall_status_pdf}"
+        else:
+            # CRITICAL RULE: Forms 3&4 students with 1-5 subjects MUST get 54 aggregate points
+            position_info = f"{position_data['position']}/{position_data['total_students']}                    Aggregate Points: {result['aggregate_points']}    Remark: {overall_status_pdf}"
+        
+        subject_count = result['total_subjects']
+        if subject_count <= 5:
+            # Insufficient subjects
+            form_teacher_comment = f"FAILED - Insufficient subjects written ({subject_count}/6 minimum required)."
+            head_teacher_comment = "FAILED - Must write at least 6 subjects to be eligible for pass."
+        elif result['status'] == 'PASS':
+            form_teacher_comment = f"PASSED - Good performance! Passed {result['passed_subjects']} subjects with {result['average']:.1f}% average."
+            head_teacher_comment = "PASSED - Well done. Keep up the good work."
+        else:
+            form_teacher_comment = f"FAILED - Needs improvement. Focus on weak subjects, especially English."
+            head_teacher_comment = "FAILED - Extra effort required. Seek help from teachers."
+        
+        return {
+            'form_level': form_level,
+            'school_name': settings.get('school_name', 'DEMO SECONDARY SCHOOL'),
+            'school_address': settings.get('school_address', 'P.O. Box [NUMBER], [CITY], Malawi'),
+            'student_rows': [
+                ['Serial No:', student['student_number']],
+                ['Student Name:', f"{student['first_name']} {student['last_name']}"],
+                ['Term:', term.replace('Term', '').strip()],
+                ['Form:', str(form_level)],
+                ['Year:', academic_year]
+            ],
+            'position_info': position_info,
+            'table_rows': table_rows,
+            'aggregate_points': result['aggregate_points'],
+            'status': overall_status_pdf,
+            'form_teacher_comment': form_teacher_comment,
+            'head_teacher_comment': head_teacher_comment,
+            'next_term_begins': settings.get('next_term_begins', 'To be announced'),
+            'boarding_fee': settings.get('boarding_fee', 'MK 150,000'),
+            'girls_uniform': settings.get('girls_uniform', 'White blouse, black skirt, black shoes'),
+            'boys_uniform': settings.get('boys_uniform', 'White shirt, black trousers, black shoes'),
+            'generated_at': generated_at or datetime.now()
+        }
+    
+    def write_progress_report(self, output, student_id: int, term: str, academic_year: str = '2024-2025',
+                              school_id: int = None, generated_at: datetime = None,
+                              deterministic: bool = False) -> Optional[str]:
+        """Render a student's progress report into a writable binary stream
+        
+        Returns 'pdf', or 'txt' when the PDF could not be built and the text
+        report was written instead (a seekable `output` is first rewound past
+        any partial PDF). Returns None when the student or their marks are missing.
+        """
         student = self.db.get_student_by_id(student_id)
         if not student:
             return None
@@ -554,343 +1062,171 @@ UNIFORM - BOYS: {settings.get('boys_uniform', 'White shirt, black trousers, blac
         # Use student's school_id if not provided
         if not school_id:
             school_id = student.get('school_id')
-            
+        
+        marks = self.db.get_student_marks(student_id, term, academic_year, school_id)
+        if not marks:
+            return None
+        
+        start = output.tell() if output.seekable() else None
+        try:
+            form_level = student['grade_level'] if student else 1
+            payload = self._build_report_payload(
+                student, marks,
+                self.db.get_school_settings(school_id),
+                self.db.get_subject_teachers(form_level, school_id),
+                self.db.get_subject_positions(form_level, term, academic_year, school_id).get(student_id, {}),
+                self.db.get_student_position_and_points(student_id, term, academic_year, form_level, school_id),
+                term, academic_year, school_id, generated_at)
+            render_progress_report(payload, output, deterministic)
+            return 'pdf'
+        except Exception as e:
+            print(f"Error creating PDF: {e}")
+            # Fallback to text report
+            if start is not None:
+                output.seek(start)
+                output.truncate()
+            report = self.generate_progress_report(student_id, term, academic_year, school_id)
+            output.write((report or '').encode('utf-8'))
+            return 'txt'
+    
+    def export_progress_report(self, student_id: int, term: str, academic_year: str = '2024-2025', school_id: int = None,
+                               generated_at: datetime = None):
+        """Export progress report to PDF file (a .txt file when the PDF could not be built)"""
+        buffer = io.BytesIO()
+        kind = self.write_progress_report(buffer, student_id, term, academic_year, school_id, generated_at)
+        if kind is None:
+            return None
+        
+        student = self.db.get_student_by_id(student_id)
         student_name = f"{student['first_name']}_{student['last_name']}"
-        filename = f"{student_name}_{term}_Progress_Report_{academic_year.replace('-', '_')}.pdf"
+        filename = f"{student_name}_{term}_Progress_Report_{academic_year.replace('-', '_')}.{kind}"
+        with open(filename, 'wb') as f:
+            f.write(buffer.getvalue())
+        return filename
+    
+    def prefetch_class_context(self, form_level: int, term: str, academic_year: str, school_id: int) -> 'ClassReportContext':
+        """Load everything the report cards of a form need with a handful of queries"""
+        roster = self.db.get_students_by_grade(form_level, school_id)
+        student_ids = [int(student['student_id']) for student in roster]
+        students = self.db.get_students_by_ids(student_ids)
+        return ClassReportContext(
+            form_level=form_level,
+            term=term,
+            academic_year=academic_year,
+            school_id=school_id,
+            students=tuple(students[student_id] for student_id in student_ids if student_id in students),
+            marks=self.db.get_student_marks_for_students(student_ids, term, academic_year, school_id),
+            settings=self.db.get_school_settings(school_id),
+            subject_teachers=self.db.get_subject_teachers(form_level, school_id),
+            rankings=self.db.get_student_rankings(form_level, term, academic_year, school_id),
+            subject_positions=self.db.get_subject_positions(form_level, term, academic_year, school_id)
+        )
+    
+    def build_class_payloads(self, context: 'ClassReportContext', generated_at: datetime = None, skip_student_ids=()):
+        """Yield (student, payload) in roster order; payload is None for students without marks"""
+        generated_at = generated_at or datetime.now()
+        for student in context.students:
+            student_id = student['student_id']
+            if student_id in skip_student_ids:
+                continue
+            marks = context.marks.get(student_id)
+            if not marks:
+                yield student, None
+                continue
+            position_data = self.db.get_student_position_and_points(
+                student_id, context.term, context.academic_year, student['grade_level'], context.school_id,
+                rankings=context.rankings)
+            yield student, self._build_report_payload(
+                student, marks, context.settings, context.subject_teachers,
+                context.subject_positions.get(student_id, {}), position_data,
+                context.term, context.academic_year, context.school_id, generated_at)
+    
+    def _render_card(self, student: Dict, payload: Optional[Dict], term: str, academic_year: str, school_id: int,
+                     deterministic: bool = False) -> bytes:
+        """Render one card in this process; b'' without marks, the single-student path if rendering fails"""
+        if payload is None:
+            return b''
+        try:
+            return render_progress_report_bytes(payload, deterministic)
+        except Exception as e:
+            print(f"Error creating PDF for student {student['student_id']}: {e}")
+            # The single-student path has the text fallback
+            return self.export_report_to_pdf_bytes(student['student_id'], term, academic_year, school_id)
+    
+    def generate_class_booklet(self, form_level: int, term: str, academic_year: str, school_id: int, output,
+                               generated_at: datetime = None) -> int:
+        """Render the report cards of a form as one bookmarked PDF booklet into `output`
         
-        report = self.generate_progress_report(student_id, term, academic_year, school_id)
-        print(f"DEBUG: Generated report text: {len(report) if report else 0} characters")
+        Built from one prefetched class context in a single ReportLab build,
+        one card per page in roster order; students without marks are left
+        out. Returns the number of cards.
+        """
+        context = self.prefetch_class_context(form_level, term, academic_year, school_id)
+        cards = ((f"{student['first_name']} {student['last_name']} ({student['student_number']})", payload)
+                 for student, payload in self.build_class_payloads(context, generated_at)
+                 if payload is not None)
+        return render_class_booklet(cards, output)
+    
+    def generate_class_report_pdfs(self, form_level: int, term: str, academic_year: str, school_id: int,
+                                   generated_at: datetime = None, max_workers: int = None, skip_student_ids=()):
+        """Render the report card of every student in a form from one prefetched class context
         
-        if report:
-            try:
-                from reportlab.lib.pagesizes import A4
-                from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle, PageTemplate, Frame
-                from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-                from reportlab.lib.units import inch
-                from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-                from reportlab.lib import colors
-                from reportlab.platypus.doctemplate import BaseDocTemplate
-                
-                # Create custom document with colorful border
-                class BorderedDocTemplate(BaseDocTemplate):
-                    def __init__(self, filename, **kwargs):
-                        BaseDocTemplate.__init__(self, filename, **kwargs)
-                        
-                    def draw_border(self, canvas, doc):
-                        # Draw colorful border
-                        canvas.saveState()
-                        
-                        # Outer border - Blue
-                        canvas.setStrokeColor(colors.blue)
-                        canvas.setLineWidth(4)
-                        canvas.rect(20, 20, A4[0]-40, A4[1]-40)
-                        
-                        # Middle border - Green
-                        canvas.setStrokeColor(colors.green)
-                        canvas.setLineWidth(2)
-                        canvas.rect(30, 30, A4[0]-60, A4[1]-60)
-                        
-                        # Inner border - Red
-                        canvas.setStrokeColor(colors.red)
-                        canvas.setLineWidth(1)
-                        canvas.rect(40, 40, A4[0]-80, A4[1]-80)
-                        
-                        canvas.restoreState()
-                
-                doc = BorderedDocTemplate(filename, pagesize=A4, topMargin=0.8*inch, bottomMargin=0.8*inch, leftMargin=0.8*inch, rightMargin=0.8*inch)
-                
-                # Create frame and page template with border
-                frame = Frame(0.8*inch, 0.8*inch, A4[0]-1.6*inch, A4[1]-1.6*inch, leftPadding=0, bottomPadding=0, rightPadding=0, topPadding=0)
-                template = PageTemplate(id='bordered', frames=frame, onPage=doc.draw_border)
-                doc.addPageTemplates([template])
-                styles = getSampleStyleSheet()
-                story = []
-                
-                # Get school settings and student info for PDF processing
-                settings = self.db.get_school_settings(school_id)
-                school_name = settings.get('school_name', 'DEMO SECONDARY SCHOOL')
-                student_info = self.db.get_student_by_id(student_id)
-                form_level = student_info['grade_level'] if student_info else 1
-                
-                # Add logo if exists - smaller for A4 fit
-                logo_path = "Malawi Government logo.png"
-                if os.path.exists(logo_path):
-                    try:
-                        logo = Image(logo_path, width=0.8*inch, height=0.8*inch)
-                        story.append(logo)
-                        story.append(Spacer(1, 6))
-                    except:
-                        pass
-                
-                # Create styles with black text and background colors only
-                school_name_style = ParagraphStyle('SchoolName', parent=styles['Heading1'], fontSize=16, alignment=TA_CENTER, fontName='Helvetica-Bold', textColor=colors.black)
-                address_style = ParagraphStyle('Address', parent=styles['Normal'], fontSize=10, alignment=TA_CENTER, fontName='Helvetica-Bold', textColor=colors.black)
-                progress_style = ParagraphStyle('Progress', parent=styles['Heading1'], fontSize=14, alignment=TA_CENTER, fontName='Helvetica-Bold', textColor=colors.black)
-                normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=9, fontName='Helvetica', textColor=colors.black)
-                section_style = ParagraphStyle('Section', parent=styles['Normal'], fontSize=10, fontName='Helvetica-Bold', textColor=colors.black)
-                
-                # Add school header with reduced spacing for Forms 3-4
-                spacing = 2 if form_level >= 3 else 4
-                story.append(Paragraph(f"<b>{school_name}</b>", school_name_style))
-                story.append(Spacer(1, spacing))
-                
-                # Add school address from settings
-                school_address = settings.get('school_address', 'P.O. Box [NUMBER], [CITY], Malawi')
-                address_lines = school_address.split(', ')
-                for line in address_lines:
-                    story.append(Paragraph(f"<b>{line.strip()}</b>", address_style))
-                story.append(Spacer(1, spacing))
-                
-                # Add progress report title
-                story.append(Paragraph(f"<b>PROGRESS REPORT</b>", progress_style))
-                story.append(Spacer(1, spacing))
-                
-
-                
-                # Build table data directly from marks data
-                marks = self.db.get_student_marks(student_id, term, academic_year, school_id)
-                subject_teachers = self.db.get_subject_teachers(form_level, school_id)
-                
-                # Create table with actual data
-                table_data = [['Subject', 'Marks', 'Grade', 'Position', 'Teachers Comment', 'Signature']]
-                
-                for subject in self.standard_subjects:
-                    if subject in marks:
-                        mark = marks[subject]['mark']
-                        grade = marks[subject]['grade']
-                        position = self.db.get_subject_position(student_id, subject, term, academic_year, form_level)
-                        comment = self.db.get_teacher_comment(grade)
-                        teacher = subject_teachers.get(subject, f"{subject} Teacher F{form_level}")
-                        table_data.append([subject, str(mark), grade, str(position), comment, teacher[:15]])
-                    else:
-                        table_data.append([subject, '--', '--', '--', 'Not taken', '--'])
-                
-                # Create professional table
-                table = Table(table_data, colWidths=[2*inch, 0.8*inch, 0.8*inch, 0.8*inch, 1.5*inch, 1.2*inch])
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 10),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                    ('TOPPADDING', (0, 0), (-1, 0), 8),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-                    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                    ('FONTSIZE', (0, 1), (-1, -1), 10),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
-                ]))
-                
-                # Add student information with uniform spacing using table
-                student_data = [
-                    ['Serial No:', student_info['student_number']],
-                    ['Student Name:', f"{student_info['first_name']} {student_info['last_name']}"],
-                    ['Term:', term.replace('Term', '').strip()],
-                    ['Form:', str(form_level)],
-                    ['Year:', academic_year]
-                ]
-                
-                student_table = Table(student_data, colWidths=[1.5*inch, 4*inch])
-                student_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                    ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-                    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 9),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                    ('TOPPADDING', (0, 0), (-1, -1), 2),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP')
-                ]))
-                story.append(student_table)
-                
-                # Get position data for PDF
-                position_data = self.db.get_student_position_and_points(student_id, term, academic_year, form_level, school_id)
-                marks_pdf = self.db.get_student_marks(student_id, term, academic_year, school_id)
-                subject_count = len(marks_pdf)
-                
-                # Check for insufficient subjects
-                if subject_count <= 5:
-                    overall_status_pdf = 'FAIL'
-                    if form_level <= 2:
-                        avg_grade = 'F'
-                        position_info = f"{position_data['position']}/{position_data['total_students']}                    Average Grade: {avg_grade}    Remark: {overall_status_pdf}"
-                    else:
-                        # CRITICAL RULE: Forms 3&4 students with 1-5 subjects MUST get 54 aggregate points
-                        position_data['aggregate_points'] = 54
-                        position_info = f"{position_data['position']}/{position_data['total_students']}                    Aggregate Points: {position_data['aggregate_points']}    Remark: {overall_status_pdf}"
-                else:
-                    if form_level <= 2:
-                        # Calculate average grade for junior forms
-                        if form_level in [1, 2]:
-                            passed_subjects = sum(1 for data in marks_pdf.values() if data['mark'] >= 50)
-                        else:
-                            passed_subjects = sum(1 for data in marks_pdf.values() if data['mark'] >= 40)
-                        english_mark = marks_pdf.get('English', {}).get('mark', 0)
-                        english_passed = self.db.is_english_passed(english_mark, form_level)
-                        overall_status = self.db.determine_pass_fail_status(passed_subjects, english_passed)
-                        
-                        # CRITICAL RULE: Forms 1&2 failed students MUST get F grade
-                        if overall_status == 'FAIL':
-                            avg_grade = 'F'
-                        else:
-                            grades = [marks_pdf[subject]['grade'] for subject in marks_pdf if subject in marks_pdf]
-                            if grades:
-                                grade_counts = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'F': 0}
-                                for grade in grades:
-                                    if grade in grade_counts:
-                                        grade_counts[grade] += 1
-                                
-                                max_count = max(grade_counts.values())
-                                most_common_grades = [grade for grade, count in grade_counts.items() if count == max_count]
-                                
-                                if len(most_common_grades) == 1:
-                                    avg_grade = most_common_grades[0]
-                                else:
-                                    total_marks = sum(marks_pdf[subject]['mark'] for subject in marks_pdf if subject in marks_pdf)
-                                    average_mark = total_marks / len(marks_pdf)
-                                    avg_grade = self.db.calculate_grade(int(average_mark), form_level)
-                                
-                                # Ensure passing students don't get F grade
-                                if avg_grade == 'F':
-                                    passing_grades = [g for g in grades if g in ['A', 'B', 'C', 'D']]
-                                    if passing_grades:
-                                        pass_grade_counts = {'A': 0, 'B': 0, 'C': 0, 'D': 0}
-                                        for grade in passing_grades:
-                                            pass_grade_counts[grade] += 1
-                                        
-                                        max_pass_count = max(pass_grade_counts.values())
-                                        most_common_pass_grades = [grade for grade, count in pass_grade_counts.items() if count == max_pass_count]
-                                        
-                                        if len(most_common_pass_grades) == 1:
-                                            avg_grade = most_common_pass_grades[0]
-                                        else:
-                                            total_marks = sum(marks_pdf[subject]['mark'] for subject in marks_pdf if subject in marks_pdf)
-                                            average_mark = total_marks / len(marks_pdf)
-                                            avg_grade = self.db.calculate_grade(int(average_mark), form_level)
-                            else:
-                                avg_grade = 'D'  # Fallback for passed student
-                        
-                        overall_status_pdf = overall_status
-                        position_info = f"{position_data['position']}/{position_data['total_students']}                    Average Grade: {avg_grade}    Remark: {overall_status_pdf}"
-                    else:
-                        # Get pass/fail status for PDF
-                        if form_level in [1, 2]:
-                            passed_subjects_pdf = sum(1 for data in marks_pdf.values() if data['mark'] >= 50)
-                        else:
-                            passed_subjects_pdf = sum(1 for data in marks_pdf.values() if data['mark'] >= 40)
-                        english_mark_pdf = marks_pdf.get('English', {}).get('mark', 0)
-                        english_passed_pdf = self.db.is_english_passed(english_mark_pdf, form_level)
-                        overall_status_pdf = self.db.determine_pass_fail_status(passed_subjects_pdf, english_passed_pdf)
-                        
-                        position_info = f"{position_data['position']}/{position_data['total_students']}                    Aggregate Points: {position_data['aggregate_points']}    Remark: {overall_status_pdf}"
-                
-                # Add position as separate table row
-                position_table = Table([['Position:', position_info]], colWidths=[1.5*inch, 4*inch])
-                position_table.setStyle(TableStyle([
-                    ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-                    ('ALIGN', (1, 0), (1, 0), 'LEFT'),
-                    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 9),
-                    ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                    ('TOPPADDING', (0, 0), (-1, -1), 2),
-                    ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP')
-                ]))
-                story.append(position_table)
-                
-                story.append(Spacer(1, 3 if form_level >= 3 else 6))
-                
-                # Add the table
-                story.append(table)
-                
-                # Add aggregate points for senior forms (left-aligned below table)
-                if form_level >= 3:
-                    story.append(Spacer(1, 2))
-                    story.append(Paragraph(f"<b>**Aggregate Points (Best Six): {position_data['aggregate_points']}    Remark: {overall_status_pdf}**</b>", ParagraphStyle('AggregatePoints', parent=styles['Normal'], fontSize=10, alignment=TA_LEFT, fontName='Helvetica-Bold', textColor=colors.black)))
-                
-                story.append(Spacer(1, 3 if form_level >= 3 else 6))
-                
-                # Define style and spacing for footer based on form level
-                if form_level <= 2:
-                    footer_style = ParagraphStyle('FooterStyle', parent=styles['Normal'], fontSize=9, fontName='Helvetica-Bold', textColor=colors.black, leading=10)
-                    grading_style = footer_style
-                    spacer_size = 3
-                    teacher_comment_spacer = 2
-                else:
-                    # Compact footer for Forms 3 and 4
-                    footer_style = ParagraphStyle('FooterStyleSqueezed', parent=styles['Normal'], fontSize=9, fontName='Helvetica-Bold', textColor=colors.black, leading=10)
-                    grading_style = ParagraphStyle('GradingSqueezed', parent=styles['Normal'], fontSize=9, fontName='Helvetica-Bold', textColor=colors.black, leading=10)
-                    spacer_size = 2
-                    teacher_comment_spacer = 2
-
-                # Add grading system
-                if form_level <= 2:
-                    story.append(Paragraph(f"<b><u>GRADING:</u> A(80-100) B(70-79) C(60-69) D(50-59) F(0-49)</b>", grading_style))
-                else:
-                    story.append(Paragraph(f"<b><u>MSCE GRADING:</u> 1(75-100) 2(70-74) 3(65-69) 4(60-64) 5(55-59) 6(50-54) 7(45-49) 8(40-44) 9(0-39)</b>", grading_style))
-                story.append(Spacer(1, spacer_size))
-                
-                # Add teacher comments
-                marks = self.db.get_student_marks(student_id, term, academic_year, school_id)
-                subject_count = len(marks)
-                
-                if subject_count <= 5:
-                    # Insufficient subjects
-                    overall_status = 'FAIL'
-                    form_teacher_comment = f"FAILED - Insufficient subjects written ({subject_count}/6 minimum required)."
-                    head_teacher_comment = "FAILED - Must write at least 6 subjects to be eligible for pass."
-                else:
-                    if form_level in [1, 2]:
-                        passed_subjects = sum(1 for data in marks.values() if data['mark'] >= 50)
-                    else:
-                        passed_subjects = sum(1 for data in marks.values() if data['mark'] >= 40)
-                    english_mark = marks.get('English', {}).get('mark', 0)
-                    english_passed = self.db.is_english_passed(english_mark, form_level)
-                    overall_status = self.db.determine_pass_fail_status(passed_subjects, english_passed)
-                    average = sum(data['mark'] for data in marks.values()) / len(marks) if marks else 0
-                    
-                    if overall_status == 'PASS':
-                        form_teacher_comment = f"PASSED - Good performance! Passed {passed_subjects} subjects with {average:.1f}% average."
-                        head_teacher_comment = "PASSED - Well done. Keep up the good work."
-                    else:
-                        form_teacher_comment = f"FAILED - Needs improvement. Focus on weak subjects, especially English."
-                        head_teacher_comment = "FAILED - Extra effort required. Seek help from teachers."
-                
-                story.append(Paragraph(f"<b><u>FORM TEACHERS' COMMENT:</u> {form_teacher_comment}</b>", footer_style))
-                story.append(Paragraph(f"<b><u>HEAD TEACHERS' COMMENT:</u> {head_teacher_comment}</b>", footer_style))
-                story.append(Spacer(1, teacher_comment_spacer))
-                story.append(Paragraph(f"<b><u>FORM TEACHER SIGN:</u> ________________________</b>", footer_style))
-                story.append(Paragraph(f"<b><u>HEAD TEACHER SIGN:</u> ________________________</b>", footer_style))
-                story.append(Spacer(1, spacer_size))
-                
-                # Add fees and uniform information from school settings
-                settings = self.db.get_school_settings(school_id)
-                
-                story.append(Paragraph(f"<b><u>NEXT TERM BEGINS ON:</u> {settings.get('next_term_begins', 'To be announced')}</b>", footer_style))
-                story.append(Paragraph(f"<b><u>FEES</u> - <u>BOARDING FEE:</u> {settings.get('boarding_fee', 'MK 150,000')}</b>", footer_style))
-                story.append(Paragraph(f"<b><u>UNIFORM - GIRLS:</u> {settings.get('girls_uniform', 'White blouse, black skirt, black shoes')}</b>", footer_style))
-                story.append(Paragraph(f"<b><u>UNIFORM - BOYS:</u> {settings.get('boys_uniform', 'White shirt, black trousers, black shoes')}</b>", footer_style))
-                story.append(Spacer(1, spacer_size))
-                
-                # Add footer with centered text
-                # Compact final footer for all forms
-                story.append(Paragraph(f"<b>Generated by: RN_LAB_TECH</b>", ParagraphStyle('Footer', parent=styles['Normal'], fontSize=7, alignment=TA_CENTER, fontName='Helvetica-Bold', textColor=colors.black)))
-                story.append(Paragraph(f"<b>Date: {datetime.now().strftime('%d/%m/%Y %H:%M')}</b>", ParagraphStyle('Footer', parent=styles['Normal'], fontSize=7, alignment=TA_CENTER, fontName='Helvetica-Bold', textColor=colors.black)))
-                
-                doc.build(story)
-                return filename
-            except Exception as e:
-                print(f"Error creating PDF: {e}")
-                # Fallback to text file
-                filename = filename.replace('.pdf', '.txt')
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(report)
-                return filename
-        return None
+        Yields (student, pdf_bytes) in roster order (b'' when the student has
+        no marks for the term). Without `generated_at` the cards are dated and
+        rendered deterministically like export_report_to_pdf_bytes, so each is
+        the same bytes that method produces for the student. Students in
+        `skip_student_ids` (already rendered by a resumed job) are left out.
+        
+        With REPORT_RENDER_WORKERS > 1 the cards are rendered in the shared
+        process pool, at most `max_workers` (default REPORT_RENDER_REQUEST_CAP)
+        at a time for this request. Any pool failure falls back to rendering
+        the affected cards serially.
+        """
+        deterministic = False
+        if generated_at is None and school_id:
+            last_modified = self.db.get_report_versions(term, academic_year, school_id)[2]
+            deterministic = REPORT_DETERMINISTIC_PDF and last_modified is not None
+            if deterministic:
+                generated_at = last_modified
+        
+        context = self.prefetch_class_context(form_level, term, academic_year, school_id)
+        payloads = self.build_class_payloads(context, generated_at, skip_student_ids)
+        
+        in_flight = min(max_workers or REPORT_RENDER_REQUEST_CAP, REPORT_RENDER_WORKERS)
+        pool = get_render_pool() if in_flight > 1 else None
+        if pool is None:
+            for student, payload in payloads:
+                yield student, self._render_card(student, payload, term, academic_year, school_id, deterministic)
+            return
+        
+        pending = deque()
+        
+        def collect():
+            student, payload, future = pending.popleft()
+            if future is not None:
+                try:
+                    return student, future.result()
+                except Exception as e:
+                    logger.warning(f"Parallel render failed for student {student['student_id']}, rendering serially: {e}")
+                    if isinstance(e, BrokenProcessPool):
+                        reset_render_pool()
+            return student, self._render_card(student, payload, term, academic_year, school_id, deterministic)
+        
+        for student, payload in payloads:
+            future = None
+            if payload is not None and pool is not None:
+                try:
+                    future = pool.submit(render_progress_report_bytes, payload, deterministic)
+                except Exception as e:
+                    # Broken or shut down pool: finish this request serially
+                    logger.warning(f"Render pool unavailable, rendering serially: {e}")
+                    reset_render_pool()
+                    pool = None
+            pending.append((student, payload, future))
+            if len(pending) >= in_flight:
+                yield collect()
+        while pending:
+            yield collect()
     
     def export_report_to_file(self, student_id: int, term: str, academic_year: str = '2024-2025', 
                              filename: str = None):
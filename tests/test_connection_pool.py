@@ -0,0 +1,197 @@
+import os
+import threading
+
+import pytest
+
+import connection_pool
+from connection_pool import SQLitePool
+from school_database import SchoolDatabase
+
+
+def test_connection_is_reused_per_thread_and_configured_once(tmp_path):
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    configured = []
+    pool = connection_pool.get_sqlite_pool(db.db_path)
+    pool.configure = lambda conn: (configured.append(conn), db._configure_sqlite_connection(conn))
+    pool.close_all()
+
+    with db.get_connection() as conn:
+        first = conn
+        assert conn.execute('PRAGMA cache_size').fetchone()[0] == 10000
+    with db.get_connection() as conn:
+        assert conn is first
+    assert configured == [first]
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(id(db.get_connection())))
+    thread.start()
+    thread.join()
+    assert other[0] != id(first)
+
+    stats = db.get_connection_pool_stats()
+    assert stats['created'] >= 2 and stats['reused'] >= 1 and stats['in_use'] == 0
+
+
+def test_nested_blocks_share_one_transaction(tmp_path):
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    student_id = db.add_student({'first_name': 'Outer', 'last_name': 'Test', 'grade_level': 1}, 1)
+
+    with pytest.raises(RuntimeError):
+        with db.get_connection() as conn:
+            conn.execute("UPDATE students SET first_name = 'Changed' WHERE student_id = ?", (student_id,))
+            # The inner block must not commit the outer block's work
+            with db.get_connection() as inner:
+                assert inner is conn
+                inner.execute("UPDATE students SET last_name = 'Changed' WHERE student_id = ?", (student_id,))
+            raise RuntimeError('abort')
+
+    student = db.get_student_by_id(student_id)
+    assert (student['first_name'], student['last_name']) == ('Outer', 'Test')
+
+    # close() hands the connection back instead of closing it
+    conn = db.get_connection()
+    conn.close()
+    assert db.get_connection() is conn
+
+
+def test_expired_replaced_and_forked_connections_are_reopened(tmp_path, monkeypatch):
+    path = str(tmp_path / 'pool.db')
+    pool = SQLitePool(path, max_age=3600)
+    first = pool.connection()
+    first.execute('CREATE TABLE t (x INTEGER)')
+
+    pool.max_age = 0
+    second = pool.connection()
+    assert second is not first
+    pool.max_age = 3600
+
+    # The file is replaced (e.g. restored from a backup)
+    os.replace(str(tmp_path / 'pool.db'), str(tmp_path / 'old.db'))
+    SQLitePool(path).connection().execute('CREATE TABLE restored (x INTEGER)')
+    third = pool.connection()
+    assert third is not second
+    assert third.execute("SELECT name FROM sqlite_master").fetchall() == [('restored',)]
+
+    # In a forked child the parent's connection is set aside, never reused or closed
+    monkeypatch.setattr(pool, '_pid', -1)
+    fourth = pool.connection()
+    assert fourth is not third and third in pool._inherited
+    assert third.execute('SELECT 1').fetchone() == (1,)
+
+    stats = pool.stats()
+    assert (stats['created'], stats['expired'], stats['unhealthy'], stats['forked'], stats['open']) == (4, 1, 1, 1, 1)
+
+
+class FakePgConnection:
+    """Enough of a psycopg2 connection for the pool: records statements, commits and rollbacks"""
+
+    class info:
+        transaction_status = 0  # TRANSACTION_STATUS_IDLE
+
+    def __init__(self, log):
+        self.log = log
+        self.closed = 0
+
+    def cursor(self):
+        log = self.log
+
+        class Cursor:
+            connection = self
+
+            def execute(self, query, params=None):
+                log.append(query)
+
+            def fetchone(self):
+                return (7,)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                return False
+        return Cursor()
+
+    def commit(self):
+        self.log.append('COMMIT')
+
+    def rollback(self):
+        self.log.append('ROLLBACK')
+
+    def close(self):
+        self.closed = 1
+
+
+def test_postgres_pool_checks_out_per_outer_block(monkeypatch):
+    psycopg2 = pytest.importorskip('psycopg2')
+    log = []
+    opened = []
+    monkeypatch.setattr(psycopg2, 'connect', lambda *args, **kwargs: opened.append(FakePgConnection(log)) or opened[-1])
+    pool = connection_pool.PostgresPool('postgresql://example/school', minconn=1, maxconn=2, timeout=0.1)
+
+    with pool.connection() as conn:
+        with pool.connection() as inner:
+            assert inner is conn
+            cursor = inner.cursor()
+            cursor.execute('UPDATE students SET first_name = ? WHERE student_id = ?', ('A', 1))
+            # No LASTVAL round trip unless the id is asked for
+            cursor.execute('INSERT INTO students (first_name) VALUES (?)', ('B',))
+            assert log == ['UPDATE students SET first_name = %s WHERE student_id = %s', 'INSERT INTO students (first_name) VALUES (%s)']
+            assert cursor.lastrowid == 7
+        assert pool.stats()['in_use'] == 1
+    assert log[2] == 'SELECT LASTVAL()' and log[3] == 'COMMIT'
+    assert pool.stats()['in_use'] == 0
+
+    # Every connection is checked out: the next caller waits, then gives up
+    holders = [pool.connection()]
+    errors = []
+
+    def checkout():
+        try:
+            holders.append(pool.connection())
+        except psycopg2.pool.PoolError as e:
+            errors.append(e)
+    for _ in range(2):
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        thread.join()
+    assert len(holders) == 2 and len(errors) == 1
+    for holder in holders:
+        holder.close()
+    stats = pool.stats()
+    assert (stats['in_use'], stats['timeouts'], stats['checkouts'], len(opened)) == (0, 1, 3, 2)
+
+
+def test_marks_of_a_student_are_saved_in_one_transaction(tmp_path):
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    student_id = db.add_student({'first_name': 'Bulk', 'last_name': 'Test', 'grade_level': 3}, 1)
+    db.save_student_mark(student_id, 'English', 40, 'Term 1', '2025-2026', 3, 1)
+    version = db.get_report_versions('Term 1', '2025-2026', 1)[0]
+
+    db.save_student_marks(student_id, {'English': 72, 'Biology': 55, 'Physics': 81}, 'Term 1', '2025-2026', 3, 1)
+
+    marks = db.get_student_marks(student_id, 'Term 1', '2025-2026', 1)
+    assert {subject: data['mark'] for subject, data in marks.items()} == {'English': 72, 'Biology': 55, 'Physics': 81}
+    assert marks['Physics']['grade'] == db.calculate_grade(81, 3)
+    assert db.get_report_versions('Term 1', '2025-2026', 1)[0] == version + 1
+
+
+def test_server_profile_uses_wal_and_backups_include_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(connection_pool, 'SQLITE_PROFILE', 'server')
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    student_id = db.add_student({'first_name': 'Wal', 'last_name': 'Test', 'grade_level': 2}, 1)
+
+    with db.get_connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == connection_pool.SQLITE_BUSY_TIMEOUT_MS
+        assert conn.execute('PRAGMA wal_autocheckpoint').fetchone()[0] == 1000
+    assert os.path.getsize(str(tmp_path / 'school.db-wal')) > 0
+
+    # The new student is still only in the WAL; the backup must contain it
+    db.backup_database(str(tmp_path / 'backup.db'))
+    backup = SchoolDatabase(str(tmp_path / 'backup.db'))
+    assert backup.get_student_by_id(student_id)['first_name'] == 'Wal'
+
+    # Back on the default profile the file returns to rollback journaling at startup
+    monkeypatch.setattr(connection_pool, 'SQLITE_PROFILE', 'default')
+    connection_pool.get_sqlite_pool(db.db_path).close_all()
+    assert SchoolDatabase(db.db_path).get_connection().execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
@@ -28,3 +28,75 @@ def test_persistent_manager_uses_override(tmp_path, monkeypatch):
 
     # Clean up
     shutil.rmtree(str(custom_dir))
+
+
+
+def test_restore_never_reuses_cached_ranking_versions(tmp_path, monkeypatch):
+    import ranking_engine
+    from school_database import SchoolDatabase
+
+    monkeypatch.chdir(tmp_path)
+    for name in ['RENDER', 'RENDER_PERSISTENT_DIR', 'DATABASE_PATH', 'BACKUP_DIR']:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    manager = PersistentDataManager()
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    subjects = ['Agriculture', 'Biology', 'Chemistry', 'English', 'Geography', 'Mathematics']
+
+    def save(student_id, mark):
+        db.save_student_marks(student_id, {subject: mark for subject in subjects}, 'Term 1', '2025-2026', 1, 1)
+
+    def ranked_ids():
+        return [row['student_id'] for row in db.get_student_rankings(1, 'Term 1', '2025-2026', 1)['rankings']]
+
+    first = db.add_student({'first_name': 'A', 'last_name': 'Test', 'grade_level': 1}, 1)
+    second = db.add_student({'first_name': 'B', 'last_name': 'Test', 'grade_level': 1}, 1)
+    save(first, 60)
+    backup_path = str(tmp_path / 'backup.db')
+    db.backup_database(backup_path)
+
+    # Two more writes; the rankings are cached for the version they reach
+    save(second, 90)
+    save(second, 95)
+    assert ranked_ids() == [second, first]
+
+    # The restore drops the second student's marks; two writes after it
+    # would bring the period back to the cached version number
+    assert manager.restore_from_backup(backup_path, db.db_path)
+    save(first, 61)
+    save(first, 62)
+    assert ranked_ids() == [first]
+
+
+def test_auto_backup_script_copies_database_and_reports_failure(tmp_path, monkeypatch):
+    import sqlite3
+    import subprocess
+
+    monkeypatch.chdir(tmp_path)
+    db_path = tmp_path / 'school.db'
+    with sqlite3.connect(str(db_path)) as conn:
+        conn.execute('CREATE TABLE students (name TEXT)')
+        conn.execute("INSERT INTO students VALUES ('A')")
+    conn.close()
+    for name in ['RENDER', 'RENDER_PERSISTENT_DIR']:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('BACKUP_DIR', str(tmp_path / 'backups'))
+    monkeypatch.setenv('DATABASE_PATH', str(db_path))
+    os.makedirs(tmp_path / 'backups')
+    # Writes the script on construction
+    PersistentDataManager()
+    script = str(tmp_path / 'backups' / 'auto_backup.sh')
+
+    result = subprocess.run([script], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    backups = [name for name in os.listdir(tmp_path / 'backups') if name.endswith('.db')]
+    assert len(backups) == 1
+    with sqlite3.connect(str(tmp_path / 'backups' / backups[0])) as backup:
+        assert backup.execute('SELECT name FROM students').fetchall() == [('A',)]
+    backup.close()
+
+    db_path.write_bytes(b'not a database' * 100)
+    result = subprocess.run([script], capture_output=True, text=True)
+    assert result.returncode != 0 and 'Auto backup failed' in result.stderr
+    db_path.unlink()
+    assert subprocess.run([script], capture_output=True, text=True).returncode != 0
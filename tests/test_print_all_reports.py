@@ -0,0 +1,75 @@
+import io
+import zipfile
+
+import app as app_module
+
+
+def test_zip_stream_yields_each_entry_before_the_next_is_produced():
+    produced = []
+
+    def entries():
+        for i in range(3):
+            produced.append(i)
+            yield f'card_{i}.pdf', bytes([i]) * 5000
+
+    chunks = []
+    for chunk in app_module.iter_zip_stream(entries()):
+        chunks.append((len(produced), chunk))
+
+    # The first entry is sent before the second one is produced
+    assert chunks[0][0] == 1 and chunks[0][1].startswith(b'PK')
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunk for _, chunk in chunks)))
+    assert archive.namelist() == ['card_0.pdf', 'card_1.pdf', 'card_2.pdf']
+    assert archive.read('card_2.pdf') == bytes([2]) * 5000
+    assert archive.testzip() is None
+
+
+def test_print_all_reports_streams_zip(monkeypatch):
+    students = [{'student_id': 1, 'first_name': 'Ann', 'last_name': 'Banda'},
+                {'student_id': 2, 'first_name': 'Bob', 'last_name': 'Phiri'},
+                {'student_id': 3, 'first_name': 'Cy', 'last_name': 'Zulu'}]
+
+    def fake_cards(form_level, term, academic_year, school_id):
+        yield students[0], b'%PDF-ann'
+        yield students[1], b''  # no marks: left out of the archive
+        raise RuntimeError('render failed')
+
+    monkeypatch.setattr(app_module.db, 'get_students_by_grade', lambda form_level, school_id: students)
+    monkeypatch.setattr(app_module.generator, 'generate_class_report_pdfs', fake_cards)
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['user_type'] = 'school'
+        session['days_remaining'] = 365
+
+    rv = client.get('/api/print-all-reports?form_level=1&term=Term%201&academic_year=2025-2026')
+    assert rv.status_code == 200
+    assert rv.is_streamed
+    assert rv.headers['Content-Type'] == 'application/zip'
+    archive = zipfile.ZipFile(io.BytesIO(rv.get_data()))
+    # Cards rendered before the failure still make a valid archive, marked as incomplete
+    assert archive.namelist() == ['Ann_Banda_Report_Term_1_2025_2026.pdf', 'ERRORS.txt']
+    assert archive.read('Ann_Banda_Report_Term_1_2025_2026.pdf') == b'%PDF-ann'
+    assert b'render failed' in archive.read('ERRORS.txt')
+
+
+def test_print_all_reports_setup_failure_is_an_error_response(monkeypatch):
+    students = [{'student_id': 1, 'first_name': 'Ann', 'last_name': 'Banda'}]
+
+    def failing_prefetch(form_level, term, academic_year, school_id):
+        raise RuntimeError('database unavailable')
+        yield
+
+    monkeypatch.setattr(app_module.db, 'get_students_by_grade', lambda form_level, school_id: students)
+    monkeypatch.setattr(app_module.generator, 'generate_class_report_pdfs', failing_prefetch)
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['user_type'] = 'school'
+        session['days_remaining'] = 365
+
+    rv = client.get('/api/print-all-reports?form_level=1&term=Term%201&academic_year=2025-2026')
+    assert rv.status_code == 500
+    assert rv.get_json()['success'] is False
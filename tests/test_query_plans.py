@@ -0,0 +1,51 @@
+import re
+
+import ranking_engine
+from schema_migrations import SchemaMigrator
+from school_database import SchoolDatabase
+
+
+SUBJECTS = ['Agriculture', 'Biology', 'Chemistry', 'English', 'Geography', 'History', 'Mathematics', 'Physics']
+# A plan step reading a whole table; scans of subqueries and window co-routines are fine
+FULL_SCAN = re.compile(r'^SCAN (s|sm|students|student_marks)( |$)')
+
+
+def test_hot_queries_use_indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=64))
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    student_ids = []
+    for school_id in [1, 2]:
+        for i, form_level in enumerate([1, 1, 2, 3, 4, 4]):
+            student_id = db.add_student({'first_name': f'S{i}', 'last_name': f'School{school_id}', 'grade_level': form_level}, school_id)
+            db.save_student_marks(student_id, {subject: 40 + 5 * j for j, subject in enumerate(SUBJECTS)},
+                                  'Term 1', '2025-2026', form_level, school_id)
+            student_ids.append(student_id)
+
+    assert db.get_schema_version() == SchemaMigrator('sqlite').latest_version
+
+    statements = []
+    with db.get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            for form_level in [1, 3]:
+                db.get_student_rankings(form_level, 'Term 1', '2025-2026', 1)
+                db.get_subject_positions(form_level, 'Term 1', '2025-2026', 1)
+                db.get_top_performers(form_level, 'Term 1', '2025-2026', 10, 1)
+                db.get_top_performers_all_categories(form_level, 'Term 1', '2025-2026', 1)
+                db.get_subject_analysis(form_level, 'Term 1', '2025-2026', 1)
+                db.get_annual_rankings(form_level, '2025-2026', 1)
+                db.get_students_by_grade(form_level, 1)
+                db.check_marks_exist_for_period(form_level, 'Term 1', '2025-2026', 1)
+            db.rank_all_forms(1, 'Term 1', '2025-2026')
+            db.get_student_marks(student_ids[0], 'Term 1', '2025-2026', 1)
+            db.get_student_marks_for_students(student_ids[:6], 'Term 1', '2025-2026', 1)
+            db.get_report_versions('Term 1', '2025-2026', 1)
+        finally:
+            conn.set_trace_callback(None)
+
+        queries = [sql for sql in statements
+                   if sql.lstrip().upper().startswith('SELECT') and re.search(r'\bstudents?(_marks)?\b', sql)]
+        assert len(queries) >= 12
+        for sql in queries:
+            plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql).fetchall()]
+            assert not [step for step in plan if FULL_SCAN.match(step)], (sql, plan)
@@ -0,0 +1,289 @@
+import pytest
+
+import ranking_engine
+from school_database import SchoolDatabase
+
+
+SUBJECTS = ['Agriculture', 'Biology', 'Chemistry', 'English', 'Geography', 'History', 'Mathematics', 'Physics']
+
+
+def _add_student_with_marks(db, school_id, first_name, last_name, form_level, marks, term='Term 1', year='2025-2026'):
+    student_id = db.add_student({'first_name': first_name, 'last_name': last_name, 'grade_level': form_level}, school_id)
+    for subject, mark in marks.items():
+        db.save_student_mark(student_id, subject, mark, term, year, form_level, school_id)
+    return student_id
+
+
+def test_forms_1_2_ranking_rules_and_ties():
+    class_marks = [
+        (1, 'Ann', 'Banda', dict(zip(SUBJECTS, [80, 80, 80, 80, 70, 70, 60, 60]))),
+        (2, 'Bob', 'Phiri', dict(zip(SUBJECTS, [70, 70, 80, 80, 80, 80, 60, 60]))),
+        (3, 'Cy', 'Zulu', dict(zip(SUBJECTS, [90, 90, 90, 40, 90, 90, 90, 90]))),  # failed English
+        (4, 'Dee', 'Moyo', {'English': 90, 'Biology': 90}),  # insufficient subjects
+    ]
+    result = ranking_engine.rank_class(class_marks, 1)
+    rankings = result['rankings']
+
+    assert result['total_students'] == 4
+    assert [r['name'] for r in rankings] == ['Ann Banda', 'Bob Phiri', 'Cy Zulu', 'Dee Moyo']
+    # Equal averages share a position; the next position skips
+    assert [r['position'] for r in rankings] == [1, 1, 3, 4]
+    assert rankings[0]['grade'] == 'A'
+    assert rankings[2]['status'] == 'FAIL' and rankings[2]['grade'] == 'F'
+    assert rankings[3] == {'student_id': 4, 'name': 'Dee Moyo', 'average': 0, 'grade': 'F', 'best_six_total': 0,
+                           'subjects_passed': 0, 'status': 'FAIL', 'total_subjects': 2, 'position': 4}
+    assert result['index'][2] is rankings[1]
+
+
+def test_forms_3_4_rank_by_lowest_aggregate_points():
+    class_marks = [
+        (1, 'Ann', 'Banda', dict(zip(SUBJECTS, [75, 75, 75, 75, 75, 70, 40, 40]))),
+        (2, 'Bob', 'Phiri', dict(zip(SUBJECTS, [80, 80, 80, 80, 80, 80, 80, 80]))),
+        (3, 'Cy', 'Zulu', {'English': 90}),
+    ]
+    rankings = ranking_engine.rank_class(class_marks, 3)['rankings']
+
+    assert [r['name'] for r in rankings] == ['Bob Phiri', 'Ann Banda', 'Cy Zulu']
+    assert [r['aggregate_points'] for r in rankings] == [6, 7, 54]
+    assert [r['position'] for r in rankings] == [1, 2, 3]
+
+
+def test_get_student_rankings_uses_period_marks(tmp_path):
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    marks = dict(zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 35]))
+    _add_student_with_marks(db, 1, 'Ann', 'Banda', 3, marks)
+    _add_student_with_marks(db, 1, 'Bob', 'Phiri', 3, {s: m + 10 for s, m in marks.items()})
+    # Another school's class must not leak into the ranking
+    _add_student_with_marks(db, 2, 'Cy', 'Zulu', 3, marks)
+
+    result = db.get_student_rankings(3, 'Term 1', '2025-2026', 1)
+
+    assert result['total_students'] == 2
+    assert result['students_with_marks'] == 2
+    top, second = result['rankings']
+    assert top['name'] == 'Bob Phiri' and top['position'] == 1
+    assert top['aggregate_points'] == 1 + 1 + 2 + 3 + 4 + 5
+    assert second['name'] == 'Ann Banda' and second['status'] == 'PASS'
+
+
+def test_ranking_cache_lru_eviction():
+    cache = ranking_engine.RankingSnapshotCache(maxsize=2)
+    cache.put('a', 1, 'A')
+    cache.put('b', 1, 'B')
+    assert cache.get('a', 1) == 'A'
+    cache.put('c', 1, 'C')  # evicts 'b', the least recently used
+
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 2) is None  # stale version is never served
+    stats = cache.stats()
+    assert (stats['size'], stats['hits'], stats['misses'], stats['evictions']) == (2, 1, 2, 1)
+
+
+def test_rankings_cached_until_period_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=8))
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    marks = dict(zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 35]))
+    ann_id = _add_student_with_marks(db, 1, 'Ann', 'Banda', 1, marks)
+    _add_student_with_marks(db, 1, 'Bob', 'Phiri', 1, {s: m + 10 for s, m in marks.items()})
+
+    first = db.get_student_rankings(1, 'Term 1', '2025-2026', 1)
+    assert db.get_student_rankings(1, 'Term 1', '2025-2026', 1) is first
+    assert db.get_ranking_cache_stats()['hits'] == 1
+
+    # A mark write bumps the period version
+    db.save_student_mark(ann_id, 'English', 99, 'Term 1', '2025-2026', 1, 1)
+    after_mark = db.get_student_rankings(1, 'Term 1', '2025-2026', 1)
+    assert after_mark is not first
+    ann = next(r for r in after_mark['rankings'] if r['name'] == 'Ann Banda')
+    assert ann['average'] == (70 + 65 + 60 + 99 + 50 + 45 + 40 + 35) / 8
+
+    # So does a rename
+    db.update_student_name(ann_id, 'Anne', 'Banda', 1)
+    names = [r['name'] for r in db.get_student_rankings(1, 'Term 1', '2025-2026', 1)['rankings']]
+    assert 'Anne Banda' in names
+
+    # Writes in another term leave the snapshot valid
+    cached = db.get_student_rankings(1, 'Term 1', '2025-2026', 1)
+    db.save_student_mark(ann_id, 'English', 10, 'Term 2', '2025-2026', 1, 1)
+    assert db.get_student_rankings(1, 'Term 1', '2025-2026', 1) is cached
+
+    db.delete_student_marks(ann_id, 1)
+    assert [r['name'] for r in db.get_student_rankings(1, 'Term 1', '2025-2026', 1)['rankings']] == ['Bob Phiri']
+
+
+def test_incremental_ranking_matches_full_recompute():
+    # Roster order (first name, last name, student id), as loaded from the database
+    class_marks = sorted((
+        (sid, f'S{sid % 7}', 'Test', dict(zip(SUBJECTS, [(sid * 7 + i * 13) % 60 + 30 for i in range(sid % 8 + 1)])))
+        for sid in range(1, 40)
+    ), key=lambda s: (s[1], s[2], s[0]))
+    for form_level in [1, 3]:
+        incremental = ranking_engine.IncrementalClassRanking(class_marks, form_level)
+        assert incremental.snapshot() == ranking_engine.rank_class(class_marks, form_level)
+
+        students = {sid: (first_name, last_name, marks) for sid, first_name, last_name, marks in class_marks}
+        for sid, marks in [(3, dict(zip(SUBJECTS, [90] * 8))), (5, {}), (40, {'English': 50}), (8, dict(zip(SUBJECTS, [45] * 8)))]:
+            first_name, last_name, _ = students.get(sid, ('S0', 'Test', None))
+            students[sid] = (first_name, last_name, marks)
+            incremental.update_student(sid, first_name, last_name, marks)
+
+        roster = sorted(((sid, f, l, m) for sid, (f, l, m) in students.items() if m), key=lambda s: (s[1], s[2], s[0]))
+        expected = ranking_engine.rank_class(roster, form_level)
+        assert incremental.snapshot() == expected
+        assert all(incremental.position(row['student_id']) == row['position'] for row in expected['rankings'])
+        assert 5 not in incremental and incremental.position(5) is None
+
+
+def test_mark_saves_update_cached_ranking_in_place(tmp_path, monkeypatch):
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    marks = dict(zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 35]))
+    ann_id = _add_student_with_marks(db, 1, 'Ann', 'Banda', 1, marks)
+    _add_student_with_marks(db, 1, 'Bob', 'Phiri', 1, {s: m + 10 for s, m in marks.items()})
+    db.get_student_rankings(1, 'Term 1', '2025-2026', 1)
+
+    load_period_marks = db._load_period_marks
+    monkeypatch.setattr(db, '_load_period_marks', lambda *args: pytest.fail('class was recomputed'))
+    db.save_student_mark(ann_id, 'English', 99, 'Term 1', '2025-2026', 1, 1)
+    cy_id = _add_student_with_marks(db, 1, 'Cy', 'Zulu', 1, {s: 90 for s in SUBJECTS})
+    patched = db.get_student_rankings(1, 'Term 1', '2025-2026', 1)
+
+    monkeypatch.setattr(db, '_load_period_marks', load_period_marks)
+    rows = db._load_period_marks(1, 'Term 1', '2025-2026', 1)
+    assert patched == ranking_engine.rank_class(ranking_engine.group_period_marks(rows), 1)
+    assert [row['student_id'] for row in patched['rankings']][0] == cy_id
+
+    # Writes that do not patch the ranking (here a rename) still invalidate it
+    db.update_student_name(cy_id, 'Cyrus', 'Zulu', 1)
+    assert db.get_student_rankings(1, 'Term 1', '2025-2026', 1)['rankings'][0]['name'] == 'Cyrus Zulu'
+
+
+def test_annual_rankings_weight_terms_and_follow_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    ann_id = _add_student_with_marks(db, 1, 'Ann', 'Banda', 3, {s: 80 for s in SUBJECTS}, term='Term 1')
+    for subject in SUBJECTS:
+        db.save_student_mark(ann_id, subject, 41, 'Term 3', '2025-2026', 3, 1)
+    bob_id = _add_student_with_marks(db, 1, 'Bob', 'Phiri', 3, {s: 60 for s in SUBJECTS}, term='Term 3')
+
+    # Equal weights: Ann's annual mark is (80 + 41) / 2 = 60.5 -> 61 in every subject
+    annual = db.get_annual_rankings(3, '2025-2026', 1)
+    assert [row['student_id'] for row in annual['rankings']] == [ann_id, bob_id]
+    assert annual['rankings'][0]['average'] == 61
+    assert annual['rankings'][0]['aggregate_points'] == 6 * 4
+    assert db.get_annual_rankings(3, '2025-2026', 1) is annual
+
+    # Term 3 counting triple: (80 + 3 * 41) / 4 = 50.75 -> 51, Ann drops behind Bob
+    weighted = db.get_annual_rankings(3, '2025-2026', 1, ranking_engine.parse_term_weights('1,0,3'))
+    assert [row['student_id'] for row in weighted['rankings']] == [bob_id, ann_id]
+
+    # A mark written in any term of the year invalidates the annual ranking
+    db.save_student_mark(bob_id, 'English', 10, 'Term 2', '2025-2026', 3, 1)
+    refreshed = db.get_annual_rankings(3, '2025-2026', 1)
+    assert refreshed is not annual
+    assert next(row for row in refreshed['rankings'] if row['student_id'] == bob_id)['status'] == 'FAIL'
+
+
+
+def test_group_annual_marks_accepts_postgres_numeric_sums():
+    from decimal import Decimal
+    rows = [
+        (1, 'Ann', 'Banda', 'English', Decimal('121.0'), Decimal('2.0')),
+        (1, 'Ann', 'Banda', 'Physics', Decimal('203.0'), Decimal('4.0')),
+        (2, 'Bob', 'Phiri', 'English', Decimal('0'), Decimal('0')),
+    ]
+    assert ranking_engine.group_annual_marks(rows) == [(1, 'Ann', 'Banda', {'English': 61, 'Physics': 51})]
+
+
+def test_term_weights_reject_non_finite_values_and_bad_configuration():
+    for text in ['1,nan,1', '1,inf,1', '1,1', '0,0,0', '1,-1,1', 'a,b,c']:
+        with pytest.raises(ValueError):
+            ranking_engine.parse_term_weights(text)
+    assert ranking_engine.default_term_weights('1,x,1') == {'Term 1': 1.0, 'Term 2': 1.0, 'Term 3': 1.0}
+    assert ranking_engine.default_term_weights('1,1,2')['Term 3'] == 2.0
+
+def test_subject_positions_bulk_matches_single_lookup(tmp_path):
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    ann_id = _add_student_with_marks(db, 1, 'Ann', 'Banda', 2, {'English': 70, 'Biology': 60})
+    bob_id = _add_student_with_marks(db, 1, 'Bob', 'Phiri', 2, {'English': 70, 'Biology': 80})
+    cy_id = _add_student_with_marks(db, 1, 'Cy', 'Zulu', 2, {'English': 65})
+    # Another school's marks are ranked separately
+    _add_student_with_marks(db, 2, 'Dee', 'Moyo', 2, {'English': 99})
+
+    positions = db.get_subject_positions(2, 'Term 1', '2025-2026', 1)
+
+    assert positions == {
+        ann_id: {'English': '1/3', 'Biology': '2/2'},
+        bob_id: {'English': '1/3', 'Biology': '1/2'},
+        cy_id: {'English': '3/3'},
+    }
+    assert db.get_subject_position(cy_id, 'English', 'Term 1', '2025-2026', 2, 1) == '3/3'
+    assert db.get_subject_position(cy_id, 'Biology', 'Term 1', '2025-2026', 2, 1) == '0/2'
+    assert db.get_subject_position(cy_id, 'Physics', 'Term 1', '2025-2026', 2, 1) == '0/0'
+    assert ranking_engine.rank_subject_marks([(1, 'English', 70), (2, 'English', 70), (3, 'English', 50)]) == (
+        {1: {'English': 1}, 2: {'English': 1}, 3: {'English': 3}}, {'English': 3})
+
+
+def test_position_and_points_resolved_by_student_id(tmp_path):
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    marks = dict(zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 35]))
+    # Two students share a name; each must get their own position
+    weak_id = _add_student_with_marks(db, 1, 'Precious', 'Mwale', 3, {'English': 30})
+    strong_id = _add_student_with_marks(db, 1, 'Precious', 'Mwale', 3, {s: m + 10 for s, m in marks.items()})
+    _add_student_with_marks(db, 1, 'Bob', 'Phiri', 3, marks)
+    absent_id = db.add_student({'first_name': 'Cy', 'last_name': 'Zulu', 'grade_level': 3}, 1)
+
+    strong = db.get_student_position_and_points(strong_id, 'Term 1', '2025-2026', 3, 1)
+    weak = db.get_student_position_and_points(weak_id, 'Term 1', '2025-2026', 3, 1)
+
+    assert strong == {'position': 1, 'aggregate_points': 16, 'total_students': 3}
+    assert weak == {'position': 3, 'aggregate_points': 54, 'total_students': 3}
+    assert db.get_student_position_and_points(absent_id, 'Term 1', '2025-2026', 3, 1) == {
+        'position': 'N/A', 'aggregate_points': 54, 'total_students': 3}
+
+    f1_id = _add_student_with_marks(db, 1, 'Dee', 'Moyo', 1, marks)
+    assert db.get_student_position_and_points(f1_id, 'Term 1', '2025-2026', 1, 1)['aggregate_points'] == 345
+
+
+def test_top_performers_all_categories_from_one_matrix(tmp_path, monkeypatch):
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=8))
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    marks = dict(zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 35]))
+    _add_student_with_marks(db, 1, 'Ann', 'Banda', 3, marks)
+    _add_student_with_marks(db, 1, 'Bob', 'Phiri', 3, {**marks, 'Chichewa': 90, 'Biology': 20})
+    _add_student_with_marks(db, 1, 'Cy', 'Zulu', 3, {'History': 99})
+
+    categories = db.get_top_performers_all_categories(3, 'Term 1', '2025-2026', 1)
+
+    assert list(categories) == ['overall', 'sciences', 'humanities', 'languages']
+    assert [(p['name'], p['aggregate_points']) for p in categories['overall']] == [('Bob Phiri', 25), ('Ann Banda', 27)]
+    assert [p['name'] for p in categories['sciences']] == ['Ann Banda', 'Bob Phiri']
+    assert categories['humanities'][0] == {'name': 'Cy Zulu', 'average': 99.0, 'department_total': 99,
+                                           'department_average': 99.0, 'subjects_taken': 1,
+                                           'excellence_area': 'Humanities Department'}
+    assert categories['languages'][0]['name'] == 'Bob Phiri'
+    assert categories['languages'][0]['department_total'] == 145
+    # Every category is sliced from the same cached matrix
+    for category, performers in categories.items():
+        assert db.get_top_performers_by_category(category, 3, 'Term 1', '2025-2026', 1) == performers
+    assert db.get_ranking_cache_stats()['misses'] == 1
+    assert db.get_top_performers_by_category('arts', 3, 'Term 1', '2025-2026', 1) == []
+
+
+def test_subject_analysis_distribution_and_spread(tmp_path):
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    for i, (english, biology) in enumerate([(85, 40), (72, 60), (55, 60), (40, 80)]):
+        _add_student_with_marks(db, 1, f'S{i}', 'Test', 1, {'English': english, 'Biology': biology})
+
+    analysis = db.get_subject_analysis(1, 'Term 1', '2025-2026', 1)
+
+    assert analysis['total_subjects'] == 2
+    english, biology = analysis['subjects']
+    assert english == {
+        'subject': 'English', 'average': 63.0, 'student_count': 4, 'min_mark': 40, 'max_mark': 85,
+        'pass_rate': 75.0, 'grade_distribution': {'A': 1, 'B': 1, 'C': 0, 'D': 1, 'F': 1},
+        'std_dev': 17.0, 'median': 63.5
+    }
+    assert biology['median'] == 60.0 and biology['std_dev'] == 14.1
+    assert list(ranking_engine.summarize_subject_marks([('English', 45, 3)], 3)[0]['grade_distribution'].items()) == [
+        ('1', 0), ('2', 0), ('3', 0), ('4', 0), ('5', 0), ('6', 0), ('7', 3), ('8', 0), ('9', 0)]
@@ -0,0 +1,45 @@
+import random
+
+import ranking_engine
+import ranking_kernel
+from school_database import SchoolDatabase
+
+
+SUBJECTS = ['Agriculture', 'Biology', 'Chemistry', 'English', 'Geography', 'History', 'Mathematics', 'Physics']
+
+
+def test_vectorized_ranking_matches_rank_class():
+    rng = random.Random(3)
+    class_marks = []
+    for student_id in range(1, 80):
+        subjects = rng.sample(SUBJECTS, rng.choice([2, 5, 6, 7, 8]))
+        # Few distinct marks so that ties on averages and points are common
+        class_marks.append((student_id, f'S{student_id}', 'Test', {s: rng.choice([35, 45, 50, 62, 75, 90]) for s in subjects}))
+
+    for form_level in [1, 2, 3, 4]:
+        expected = ranking_engine.rank_class(class_marks, form_level)
+        assert ranking_kernel.rank_class_vectorized(class_marks, form_level) == expected
+    assert ranking_kernel.rank_class_vectorized([], 1)['rankings'] == []
+
+
+def test_round1_matches_python_round():
+    import numpy as np
+    averages = np.array([total / count for count in range(1, 13) for total in range(0, 1201)])
+    assert ranking_kernel._round1(averages).tolist() == [round(value, 1) for value in averages.tolist()]
+
+
+def test_rank_all_forms_warms_the_ranking_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    for i, form_level in enumerate([1, 1, 3, 4]):
+        student_id = db.add_student({'first_name': f'S{i}', 'last_name': 'Test', 'grade_level': form_level}, 1)
+        for subject, mark in zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 120 if form_level == 4 else 35]):
+            db.save_student_mark(student_id, subject, mark, 'Term 1', '2025-2026', form_level, 1)
+
+    results = db.rank_all_forms(1, 'Term 1', '2025-2026')
+
+    assert [results[form]['total_students'] for form in [1, 2, 3, 4]] == [2, 0, 1, 1]
+    # An out-of-range mark is ranked by the Python path
+    assert results[4]['rankings'][0]['aggregate_points'] == 1 + 2 + 3 + 4 + 5 + 6
+    for form_level in [1, 2, 3, 4]:
+        assert db.get_student_rankings(form_level, 'Term 1', '2025-2026', 1) is results[form_level]
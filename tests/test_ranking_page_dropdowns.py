@@ -27,4 +27,18 @@ def test_ranking_page_has_academic_year_and_term_selects():
 
     # Check academicYear select contains at least one year option (e.g., 2025-2026)
     assert 'id="academicYear"' in body
-    assert '2025-2026' in body, 'Expected 2025-2026 to appear in Academic Year select'
\ No newline at end of file
+    assert '2025-2026' in body, 'Expected 2025-2026 to appear in Academic Year select'
+
+def test_malformed_annual_weights_are_rejected():
+    client = flask_app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['user_type'] = 'school'
+        sess['days_remaining'] = 365
+
+    rv = client.get('/api/rankings/3/annual?academic_year=2025-2026&weights=1,nan,1')
+    assert rv.status_code == 400
+    rv = client.post('/api/export-rankings-pdf', json={
+        'form_level': 3, 'academic_year': '2025-2026', 'annual': True, 'weights': '1,x,1'})
+    assert rv.status_code == 400
+    assert rv.get_json()['success'] is False
@@ -0,0 +1,187 @@
+import re
+from datetime import datetime
+
+from reportlab import rl_config
+
+import ranking_engine
+from school_database import SchoolDatabase
+from termly_report_generator import TermlyReportGenerator
+
+
+SUBJECTS = ['Agriculture', 'Biology', 'Chemistry', 'English', 'Geography', 'History', 'Mathematics', 'Physics']
+
+
+def test_class_reports_match_single_student_pdfs(tmp_path, monkeypatch):
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    monkeypatch.chdir(tmp_path)
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    student_ids = []
+    for i, offset in enumerate([0, 15, -20]):
+        student_id = db.add_student({'first_name': f'S{i}', 'last_name': 'Test', 'grade_level': 3}, 1)
+        for subject, mark in zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 35]):
+            db.save_student_mark(student_id, subject, max(0, mark + offset), 'Term 1', '2025-2026', 3, 1)
+        student_ids.append(student_id)
+    # A student without marks gets no card
+    db.add_student({'first_name': 'S9', 'last_name': 'Test', 'grade_level': 3}, 1)
+
+    generator = TermlyReportGenerator()
+    generator.db = db
+    cards = list(generator.generate_class_report_pdfs(3, 'Term 1', '2025-2026', 1))
+
+    assert [student['first_name'] for student, _ in cards] == ['S0', 'S1', 'S2', 'S9']
+    assert cards[-1][1] == b''
+    for (student, pdf_bytes), student_id in zip(cards, student_ids):
+        assert pdf_bytes.startswith(b'%PDF')
+        assert generator.export_report_to_pdf_bytes(student_id, 'Term 1', '2025-2026', 1) == pdf_bytes
+
+
+def test_parallel_rendering_matches_serial(tmp_path, monkeypatch):
+    import termly_report_generator
+
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    monkeypatch.chdir(tmp_path)
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    for i in range(5):
+        student_id = db.add_student({'first_name': f'S{i}', 'last_name': 'Test', 'grade_level': 1}, 1)
+        for subject, mark in zip(SUBJECTS, [80, 72, 64, 58, 50, 45, 40, 30]):
+            db.save_student_mark(student_id, subject, mark - i * 3, 'Term 1', '2025-2026', 1, 1)
+
+    generator = TermlyReportGenerator()
+    generator.db = db
+    # Cards are dated with the last change to the class, so both runs render identical bytes
+    serial = list(generator.generate_class_report_pdfs(1, 'Term 1', '2025-2026', 1))
+    assert len({pdf_bytes for _, pdf_bytes in serial}) == 5
+
+    monkeypatch.setattr(termly_report_generator, 'REPORT_RENDER_WORKERS', 2)
+    try:
+        parallel = list(generator.generate_class_report_pdfs(1, 'Term 1', '2025-2026', 1, max_workers=2))
+        assert termly_report_generator._render_pool is not None
+    finally:
+        termly_report_generator.reset_render_pool()
+    assert parallel == serial
+
+    # A pool that cannot take work falls back to serial rendering
+    class BrokenPool:
+        def submit(self, *args):
+            raise RuntimeError('pool is shut down')
+
+    monkeypatch.setattr(termly_report_generator, 'get_render_pool', lambda: BrokenPool())
+    assert list(generator.generate_class_report_pdfs(1, 'Term 1', '2025-2026', 1, max_workers=2)) == serial
+
+
+def test_progress_report_renders_into_caller_stream(tmp_path, monkeypatch):
+    import io
+    import termly_report_generator
+
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    monkeypatch.chdir(tmp_path)
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    student_id = db.add_student({'first_name': 'S0', 'last_name': 'Test', 'grade_level': 2}, 1)
+    for subject, mark in zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 35]):
+        db.save_student_mark(student_id, subject, mark, 'Term 1', '2025-2026', 2, 1)
+    generator = TermlyReportGenerator()
+    generator.db = db
+    generated_at = datetime(2026, 1, 1, 12, 0)
+
+    stream = io.BytesIO(b'header')
+    stream.seek(0, io.SEEK_END)
+    assert generator.write_progress_report(stream, student_id, 'Term 1', '2025-2026', 1, generated_at) == 'pdf'
+    filename = generator.export_progress_report(student_id, 'Term 1', '2025-2026', 1, generated_at=generated_at)
+    with open(filename, 'rb') as f:
+        assert stream.getvalue() == b'header' + f.read()
+    assert generator.write_progress_report(io.BytesIO(), student_id, 'Term 3', '2025-2026', 1) is None
+
+    # A failed PDF is rewound and replaced by the text report
+    def failing_render(payload, output, deterministic=False):
+        output.write(b'%PDF-partial')
+        raise RuntimeError('layout error')
+
+    monkeypatch.setattr(termly_report_generator, 'render_progress_report', failing_render)
+    stream = io.BytesIO()
+    assert generator.write_progress_report(stream, student_id, 'Term 1', '2025-2026', 1) == 'txt'
+    assert not stream.getvalue().startswith(b'%PDF')
+    assert generator.export_progress_report(student_id, 'Term 1', '2025-2026', 1).endswith('.txt')
+
+
+def test_report_template_is_shared_between_cards(monkeypatch):
+    import termly_report_generator
+
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    termly_report_generator.reset_report_template()
+    builds = []
+    template_class = termly_report_generator.ReportTemplate
+
+    def counting_template():
+        builds.append(1)
+        return template_class()
+
+    monkeypatch.setattr(termly_report_generator, 'ReportTemplate', counting_template)
+    payload = {
+        'form_level': 1, 'school_name': 'DEMO', 'school_address': 'P.O. Box 1, Zomba',
+        'student_rows': [['Serial No:', '0001'], ['Student Name:', 'S0 Test']], 'position_info': '1/1',
+        'table_rows': [['Subject', 'Marks'], ['English', '70']], 'aggregate_points': 0, 'status': 'PASS',
+        'form_teacher_comment': '', 'head_teacher_comment': '', 'next_term_begins': '', 'boarding_fee': '',
+        'girls_uniform': '', 'boys_uniform': '', 'generated_at': datetime(2026, 1, 1, 12, 0)
+    }
+    try:
+        first = termly_report_generator.render_progress_report_bytes(payload)
+        second = termly_report_generator.render_progress_report_bytes(payload)
+    finally:
+        termly_report_generator.reset_report_template()
+
+    assert builds == [1]
+    assert first == second
+    # The border is one form XObject and the emblem one downscaled image
+    assert b'/FormXob.ReportBorder' in first
+    assert first.count(b'/Subtype /Image') <= 2
+
+
+def test_class_booklet_is_one_bookmarked_pdf(tmp_path, monkeypatch):
+    import io
+    import re
+
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    monkeypatch.setattr(rl_config, 'invariant', 1)
+    monkeypatch.chdir(tmp_path)
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    for i, offset in enumerate([0, 15, -20]):
+        student_id = db.add_student({'first_name': f'S{i}', 'last_name': 'Test', 'grade_level': 3}, 1)
+        for subject, mark in zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 35]):
+            db.save_student_mark(student_id, subject, max(0, mark + offset), 'Term 1', '2025-2026', 3, 1)
+    db.add_student({'first_name': 'S9', 'last_name': 'Test', 'grade_level': 3}, 1)
+    generator = TermlyReportGenerator()
+    generator.db = db
+    generated_at = datetime(2026, 1, 1, 12, 0)
+
+    booklet = io.BytesIO()
+    assert generator.generate_class_booklet(3, 'Term 1', '2025-2026', 1, booklet, generated_at) == 3
+    pdf = booklet.getvalue()
+    cards = [pdf_bytes for _, pdf_bytes in generator.generate_class_report_pdfs(3, 'Term 1', '2025-2026', 1, generated_at=generated_at)
+             if pdf_bytes]
+
+    assert len(re.findall(rb'/Type /Page\b', pdf)) == 3
+    assert pdf.count(b'/Type /Outlines') == 1
+    assert [title.decode() for title in re.findall(rb'/Title \((S\d Test) ', pdf)] == ['S0 Test', 'S1 Test', 'S2 Test']
+    # Fonts, emblem and border are shared by all pages
+    assert pdf.count(b'/Subtype /Image') == cards[0].count(b'/Subtype /Image')
+    assert pdf.count(b'/Type /Font') == cards[0].count(b'/Type /Font')
+    assert len(pdf) < sum(len(card) for card in cards) / 2
+
+    assert generator.generate_class_booklet(3, 'Term 2', '2025-2026', 1, io.BytesIO()) == 0
+
+
+def test_compact_profile_keeps_cards_small():
+    import pdf_profile
+    import termly_report_generator
+    from scripts.benchmark_report_render import sample_payload
+
+    if not pdf_profile.COMPACT_PDF:
+        return
+    pdf = termly_report_generator.render_progress_report_bytes(sample_payload())
+
+    # Binary compressed streams, the emblem embedded as JPEG, only standard fonts
+    assert b'ASCII85Decode' not in pdf
+    assert b'/DCTDecode' in pdf
+    assert set(re.findall(rb'/BaseFont /([\w-]+)', pdf)) <= {b'Helvetica', b'Helvetica-Bold'}
+    assert len(pdf) < 16 * 1024
@@ -0,0 +1,92 @@
+import io
+import zipfile
+
+import app as app_module
+import ranking_engine
+from report_jobs import ReportJobManager
+from school_database import SchoolDatabase
+from termly_report_generator import TermlyReportGenerator
+
+
+SUBJECTS = ['Agriculture', 'Biology', 'Chemistry', 'English', 'Geography', 'History', 'Mathematics', 'Physics']
+
+
+def _manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    monkeypatch.chdir(tmp_path)
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    for i in range(3):
+        student_id = db.add_student({'first_name': f'S{i}', 'last_name': 'Test', 'grade_level': 2}, 1)
+        for subject, mark in zip(SUBJECTS, [80, 72, 64, 58, 50, 45, 40, 30]):
+            db.save_student_mark(student_id, subject, mark - i * 5, 'Term 1', '2025-2026', 2, 1)
+    generator = TermlyReportGenerator()
+    generator.db = db
+    return ReportJobManager(str(tmp_path / 'jobs'), generator, workers=0)
+
+
+def test_report_job_resumes_after_interruption(tmp_path, monkeypatch):
+    jobs = _manager(tmp_path, monkeypatch)
+    job_id = jobs.submit(1, [2], 'Term 1', '2025-2026')
+    assert jobs.get_job(job_id, 1)['status'] == 'queued'
+    assert jobs.get_job(job_id, 2) is None
+
+    # First run is interrupted after one student: its lease then expires
+    first_job_id, first_claim = jobs.claim_next_job()
+    assert first_job_id == job_id
+    first_student, first_pdf = next(jobs.generator.generate_class_report_pdfs(2, 'Term 1', '2025-2026', 1))
+    assert jobs._record_student(job_id, first_claim, 2, 0, first_student, first_pdf, 'Term 1', '2025-2026')
+    with jobs._connect() as conn:
+        conn.execute("UPDATE report_jobs SET lease_expires = 0 WHERE job_id = ?", (job_id,))
+    assert jobs.get_job(job_id, 1)['done'] == 1
+
+    skipped = []
+    render = jobs.generator.generate_class_report_pdfs
+
+    def recording_render(*args, skip_student_ids=(), **kwargs):
+        skipped.append(set(skip_student_ids))
+        return render(*args, skip_student_ids=skip_student_ids, **kwargs)
+
+    monkeypatch.setattr(jobs.generator, 'generate_class_report_pdfs', recording_render)
+    claim = jobs.claim_next_job()
+    assert claim[0] == job_id and claim[1] != first_claim
+    # The interrupted worker wakes up: its claim is gone, so it can neither renew nor finish the job
+    assert not jobs._record_student(job_id, first_claim, 2, 0, first_student, first_pdf, 'Term 1', '2025-2026')
+    jobs._finish_job(job_id, first_claim, [2], 'Term 1', '2025-2026')
+    assert jobs.get_job(job_id, 1)['status'] == 'running'
+    assert not (tmp_path / 'jobs' / f'{job_id}.zip').exists()
+    jobs.run_job(*claim)
+
+    assert skipped == [{first_student['student_id']}]
+    job = jobs.get_job(job_id, 1)
+    assert (job['status'], job['done'], job['total'], job['progress']) == ('completed', 3, 3, 1.0)
+    archive = zipfile.ZipFile(job['artifact_path'])
+    assert archive.namelist() == [f'S{i}_Test_Report_Term_1_2025_2026.pdf' for i in range(3)]
+    assert archive.read('S0_Test_Report_Term_1_2025_2026.pdf') == first_pdf
+    assert jobs.claim_next_job() is None
+
+
+def test_report_job_endpoints_and_range_download(tmp_path, monkeypatch):
+    jobs = _manager(tmp_path, monkeypatch)
+    monkeypatch.setattr(app_module, 'report_jobs', jobs)
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['user_type'] = 'school'
+        session['days_remaining'] = 365
+
+    assert client.post('/api/report-jobs', json={'form_level': 7}).status_code == 400
+    rv = client.post('/api/report-jobs', json={'form_level': 2, 'term': 'Term 1', 'academic_year': '2025-2026'})
+    assert rv.status_code == 202
+    job_id = rv.get_json()['job_id']
+    assert client.get(f'/api/report-jobs/{job_id}/download').status_code == 409
+
+    jobs.run_job(*jobs.claim_next_job())
+    job = client.get(f'/api/report-jobs/{job_id}').get_json()['job']
+    assert job['status'] == 'completed' and job['done'] == job['total'] == 3
+
+    full = client.get(f'/api/report-jobs/{job_id}/download')
+    assert full.status_code == 200
+    assert zipfile.ZipFile(io.BytesIO(full.data)).testzip() is None
+    partial = client.get(f'/api/report-jobs/{job_id}/download', headers={'Range': 'bytes=100-'})
+    assert partial.status_code == 206
+    assert partial.data == full.data[100:]
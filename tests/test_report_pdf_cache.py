@@ -0,0 +1,128 @@
+import os
+import time
+
+import ranking_engine
+import termly_report_generator
+from report_pdf_cache import ReportPDFCache
+from school_database import SchoolDatabase
+from termly_report_generator import TermlyReportGenerator
+
+
+SUBJECTS = ['Agriculture', 'Biology', 'Chemistry', 'English', 'Geography', 'History', 'Mathematics', 'Physics']
+
+
+def test_unchanged_report_is_served_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    monkeypatch.chdir(tmp_path)
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    student_id = db.add_student({'first_name': 'S0', 'last_name': 'Test', 'grade_level': 3}, 1)
+    for subject, mark in zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 35]):
+        db.save_student_mark(student_id, subject, mark, 'Term 1', '2025-2026', 3, 1)
+    generator = TermlyReportGenerator()
+    generator.db = db
+
+    renders = []
+    render = termly_report_generator.render_progress_report
+
+    def counting_render(payload, output, *args):
+        renders.append(payload['position_info'])
+        render(payload, output, *args)
+
+    monkeypatch.setattr(termly_report_generator, 'render_progress_report', counting_render)
+
+    first = generator.export_report_to_pdf_bytes(student_id, 'Term 1', '2025-2026', 1)
+    assert first.startswith(b'%PDF')
+    assert generator.export_report_to_pdf_bytes(student_id, 'Term 1', '2025-2026', 1) == first
+    assert len(renders) == 1
+    assert os.path.isdir(tmp_path / 'pdf_cache')
+
+    # Marks, school settings and subject teachers all change the card
+    db.save_student_mark(student_id, 'Physics', 90, 'Term 1', '2025-2026', 3, 1)
+    generator.export_report_to_pdf_bytes(student_id, 'Term 1', '2025-2026', 1)
+    settings = db.get_school_settings(1)
+    settings['school_name'] = 'Renamed School'
+    db.update_school_settings(settings, 1)
+    generator.export_report_to_pdf_bytes(student_id, 'Term 1', '2025-2026', 1)
+    db.update_subject_teacher('Physics', 3, 'Mr Phiri', 1)
+    generator.export_report_to_pdf_bytes(student_id, 'Term 1', '2025-2026', 1)
+    assert len(renders) == 4
+    # Unchanged again: served from the cache
+    generator.export_report_to_pdf_bytes(student_id, 'Term 1', '2025-2026', 1)
+    assert len(renders) == 4
+
+
+def test_cache_evicts_least_recently_served(tmp_path):
+    cache = ReportPDFCache(str(tmp_path), max_bytes=3500)
+    for i, key in enumerate(['aa01', 'bb02', 'cc03']):
+        cache.put(key, b'%PDF' + bytes(996))
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    # Serving the oldest card makes it the most recently used
+    assert cache.get('aa01') is not None
+
+    cache.put('dd04', b'%PDF' + bytes(996))
+
+    assert cache.get('bb02') is None
+    assert all(cache.get(key) is not None for key in ['aa01', 'cc03', 'dd04'])
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size_bytes'] == 3000
+
+
+def test_report_card_downloads_are_deterministic_with_etags(tmp_path, monkeypatch):
+    import re
+    import app as app_module
+    from report_pdf_cache import get_report_pdf_cache
+
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    monkeypatch.chdir(tmp_path)
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    student_id = db.add_student({'first_name': 'S0', 'last_name': 'Test', 'grade_level': 1}, 1)
+    for subject, mark in zip(SUBJECTS, [70, 65, 60, 55, 50, 45, 40, 35]):
+        db.save_student_mark(student_id, subject, mark, 'Term 1', '2025-2026', 1, 1)
+    generator = TermlyReportGenerator()
+    generator.db = db
+    monkeypatch.setattr(app_module, 'db', db)
+    monkeypatch.setattr(app_module, 'generator', generator)
+
+    first = generator.export_report_to_pdf_bytes(student_id, 'Term 1', '2025-2026', 1)
+    # Rendered again from scratch: the same bytes, dated with the last change
+    get_report_pdf_cache(str(tmp_path / 'pdf_cache')).clear()
+    assert generator.export_report_to_pdf_bytes(student_id, 'Term 1', '2025-2026', 1) == first
+    last_modified = db.get_report_versions('Term 1', '2025-2026', 1)[2]
+    created = time.strftime('%Y%m%d%H%M%S', time.gmtime(last_modified.timestamp()))
+    assert re.search(rb'/CreationDate \(D:(\d{14})', first).group(1) == created.encode()
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['user_type'] = 'school'
+        session['days_remaining'] = 365
+    body = {'student_id': student_id, 'term': 'Term 1', 'academic_year': '2025-2026'}
+    rv = client.post('/api/export-report-card', json=body)
+    assert rv.status_code == 200 and rv.data == first
+    etag = rv.headers['ETag']
+    assert not etag.startswith('W/')
+
+    assert client.post('/api/export-report-card', json=body, headers={'If-None-Match': etag}).status_code == 304
+    db.save_student_mark(student_id, 'Physics', 90, 'Term 1', '2025-2026', 1, 1)
+    rv = client.post('/api/export-report-card', json=body, headers={'If-None-Match': etag})
+    assert rv.status_code == 200 and rv.headers['ETag'] != etag
+
+
+def test_cache_is_not_shared_across_databases_with_equal_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(ranking_engine, 'ranking_cache', ranking_engine.RankingSnapshotCache(maxsize=16))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('REPORT_PDF_CACHE_DIR', str(tmp_path / 'shared_cache'))
+
+    cards = []
+    for name, mark in [('first.db', 70), ('second.db', 30)]:
+        # Same school, student and period versions, different marks
+        db = SchoolDatabase(str(tmp_path / name))
+        student_id = db.add_student({'first_name': 'S0', 'last_name': 'Test', 'grade_level': 2}, 1)
+        db.save_student_marks(student_id, {subject: mark for subject in SUBJECTS}, 'Term 1', '2025-2026', 2, 1)
+        generator = TermlyReportGenerator()
+        generator.db = db
+        assert db.get_report_versions('Term 1', '2025-2026', 1)[:2] == (1, 0)
+        cards.append(generator.export_report_to_pdf_bytes(student_id, 'Term 1', '2025-2026', 1))
+
+    assert cards[0] != cards[1]
+    assert sum(len(files) for _, _, files in os.walk(tmp_path / 'shared_cache')) == 2
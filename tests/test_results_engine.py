@@ -0,0 +1,60 @@
+import results_engine
+
+
+SUBJECTS = ['Agriculture', 'Biology', 'Chemistry', 'English', 'Geography', 'History', 'Mathematics', 'Physics']
+
+
+def _marks(values):
+    return dict(zip(SUBJECTS, values))
+
+
+def test_pass_requires_six_subjects_and_english():
+    passed = results_engine.student_result(_marks([80, 80, 70, 55, 60, 60, 40, 30]), 1)
+    assert passed['status'] == 'PASS'
+    assert passed['passed_subjects'] == 6
+    assert passed['status_reason'] == 'Passed 6 or more subjects including English'
+
+    failed_english = results_engine.student_result(_marks([80, 80, 70, 45, 60, 60, 55, 50]), 1)
+    assert failed_english['status'] == 'FAIL'
+    assert failed_english['status_reason'] == 'Failed English (English is mandatory for pass)'
+
+    # The same English mark passes in Forms 3&4 (pass mark 40)
+    assert results_engine.student_result(_marks([80, 80, 70, 45, 60, 60, 55, 50]), 3)['status'] == 'PASS'
+
+
+def test_insufficient_subjects_fail_with_54_points():
+    result = results_engine.student_result({'English': 90, 'Biology': 90, 'Physics': 90}, 3)
+    assert result['status'] == 'FAIL'
+    assert result['aggregate_points'] == results_engine.INSUFFICIENT_SUBJECTS_POINTS
+    assert result['best_six_total'] == 0
+    assert results_engine.student_result({}, 1)['report_grade'] == 'F'
+
+
+def test_best_six_aggregate_points():
+    result = results_engine.student_result(_marks([75, 75, 70, 65, 60, 55, 10, 10]), 4)
+    assert result['aggregate_points'] == 1 + 1 + 2 + 3 + 4 + 5
+    assert result['best_six_total'] == 75 + 75 + 70 + 65 + 60 + 55
+
+
+def test_ranking_and_report_card_grade_rules():
+    # Two A's, two B's, two C's, two F's: the ranking rule takes the best of the
+    # most common passing grades, the report card falls back to the average (63 -> C)
+    result = results_engine.student_result(_marks([85, 80, 75, 70, 65, 60, 40, 30]), 2)
+    assert result['status'] == 'PASS'
+    assert result['grade'] == 'A'
+    assert result['report_grade'] == 'C'
+
+    # A passed student never gets F on the report card
+    result = results_engine.student_result(_marks([50, 50, 50, 50, 50, 50, 0, 0]), 1)
+    assert result['average'] == 37.5
+    assert result['report_grade'] == 'D'
+
+    failed = results_engine.student_result(_marks([90, 90, 90, 40, 90, 90, 90, 90]), 1)
+    assert failed['grade'] == failed['report_grade'] == 'F'
+    assert results_engine.student_result(_marks([90] * 8), 3)['report_grade'] == '1'
+
+
+def test_compute_results_batch():
+    results = results_engine.compute_results({1: _marks([80] * 8), 2: {'English': 30}}, 1)
+    assert results[1]['status'] == 'PASS' and results[1]['grade'] == 'A'
+    assert results[2]['status'] == 'FAIL' and results[2]['english_passed'] is False
@@ -0,0 +1,109 @@
+import sqlite3
+
+from schema_migrations import SchemaMigrator
+from school_database import SchoolDatabase
+
+
+def indexes(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA index_list({table})").fetchall()}
+
+
+def test_fresh_database_is_migrated_once(tmp_path):
+    db = SchoolDatabase(str(tmp_path / 'school.db'))
+    latest = SchemaMigrator('sqlite').latest_version
+    assert db.get_schema_version() == latest
+
+    with db.get_connection() as conn:
+        assert [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")] == list(range(1, latest + 1))
+        teachers = conn.execute("SELECT subject, form_level, teacher_name FROM subject_teachers ORDER BY id").fetchall()
+        assert len(teachers) == 56 and teachers[0] == ('Agriculture', 1, 'Agriculture Teacher F1')
+        assert teachers[-1] == ('Home Economics', 4, 'Home Economics Teacher F4')
+        assert conn.execute("SELECT boarding_fee FROM school_fees").fetchall() == [('MK 150,000',)]
+
+        # A restart runs one query against an up-to-date schema and keeps its indexes
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            SchoolDatabase(db.db_path)
+        finally:
+            conn.set_trace_callback(None)
+        assert [sql for sql in statements if 'schema_version' in sql] == ['SELECT MAX(version) FROM schema_version']
+        assert not [sql for sql in statements if 'CREATE' in sql.upper() or 'ALTER' in sql.upper() or 'table_info' in sql]
+        assert 'idx_students_school_grade' in indexes(conn, 'students')
+        assert {'idx_student_marks_class', 'idx_student_marks_term'} <= indexes(conn, 'student_marks')
+        assert conn.execute("SELECT COUNT(*) FROM subject_teachers").fetchone()[0] == 56
+
+
+def test_legacy_database_is_adopted(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE students (
+            student_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_number TEXT UNIQUE,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            grade_level INTEGER NOT NULL,
+            status TEXT DEFAULT 'Active'
+        );
+        CREATE TABLE schools (
+            school_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            school_name TEXT NOT NULL,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            status TEXT DEFAULT 'active'
+        );
+        CREATE TABLE school_settings (
+            setting_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            school_name TEXT,
+            school_address TEXT,
+            school_phone TEXT,
+            school_email TEXT,
+            pta_fund TEXT,
+            next_term_begins TEXT,
+            boys_uniform TEXT,
+            girls_uniform TEXT,
+            updated_date TEXT DEFAULT CURRENT_TIMESTAMP,
+            school_id INTEGER,
+            UNIQUE(school_id)
+        );
+        CREATE TABLE academic_periods (
+            period_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            academic_year TEXT NOT NULL,
+            period_name TEXT NOT NULL,
+            start_date TEXT,
+            end_date TEXT,
+            is_active INTEGER DEFAULT 0
+        );
+        INSERT INTO schools (school_name, username, password_hash) VALUES ('Old School', 'old', 'x');
+        INSERT INTO students (student_number, first_name, last_name, grade_level) VALUES ('001', 'Old', 'Student', 2);
+    """)
+    conn.close()
+
+    db = SchoolDatabase(path)
+    assert db.get_schema_version() == SchemaMigrator('sqlite').latest_version
+    with db.get_connection() as conn:
+        conn.execute("UPDATE students SET school_id = 1")
+    student = db.get_student_by_id(1)
+    assert (student['first_name'], student['school_id']) == ('Old', 1)
+
+    # Student numbers are now unique per school only
+    school_id = db.add_school({'school_name': 'New School', 'username': 'new', 'password': 'secret'})
+    db.add_student({'student_number': '001', 'first_name': 'New', 'last_name': 'Student', 'grade_level': 2}, school_id)
+
+    old = db.get_school_settings(1)
+    assert old['selected_term'] == '' and old['sdf_fund'] == ''
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT subscription_status, days_remaining FROM schools WHERE school_id = 1").fetchone() == ('trial', 90)
+        assert 'idx_students_school_grade' in indexes(conn, 'students')
+
+    db.update_academic_periods(['2025-2026'], ['Term 1'], school_id)
+    assert [period['period_name'] for period in db.get_academic_periods(school_id)] == ['Term 1']
+
+
+def test_postgres_migrations_match_sqlite():
+    sqlite_versions = [version for version, _, _ in SchemaMigrator('sqlite').migrations()]
+    postgres = SchemaMigrator('postgres').migrations()
+    assert [version for version, _, _ in postgres] == sqlite_versions
+    for _, _, statements in postgres:
+        assert statements and not [sql for sql in statements if 'AUTOINCREMENT' in sql or 'INSERT OR' in sql]